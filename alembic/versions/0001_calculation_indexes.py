@@ -0,0 +1,64 @@
+"""Add composite indexes for pagination and per-user queries
+
+Tables are created by init_db(); this revision adds the indexes to databases
+that were created before the indexes were declared on the models. On
+PostgreSQL the indexes are built CONCURRENTLY so writes are not blocked.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_users_created_at_id", "users", ["created_at", "id"]),
+    ("ix_calculations_created_at_id", "calculations", ["created_at", "id"]),
+    ("ix_calculations_user_id_created_at_id", "calculations", ["user_id", "created_at", "id"]),
+    ("ix_calculations_type_created_at", "calculations", ["type", "created_at"]),
+]
+
+
+def _has_table(table: str) -> bool:
+    """Check that a table exists; always true when generating offline SQL"""
+    if op.get_context().as_sql:
+        return True
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if not _has_table(table):
+                continue
+            op.create_index(
+                name,
+                table,
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            if not _has_table(table):
+                continue
+            op.drop_index(
+                name,
+                table_name=table,
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
@@ -0,0 +1,57 @@
+"""Set a server-side default for created_at
+
+created_at was filled in by the application; the write paths now rely on
+the database default so INSERT ... RETURNING gives back the stored value.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import utcnow
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("users", "calculations")
+
+
+def _has_table(table: str) -> bool:
+    """Check that a table exists; always true when generating offline SQL"""
+    if op.get_context().as_sql:
+        return True
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        if not _has_table(table):
+            continue
+        # Batch mode recreates the table on SQLite, which cannot ALTER COLUMN
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "created_at",
+                existing_type=sa.DateTime(),
+                server_default=utcnow(),
+            )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        if not _has_table(table):
+            continue
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "created_at",
+                existing_type=sa.DateTime(),
+                server_default=None,
+            )
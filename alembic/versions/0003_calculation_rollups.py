@@ -0,0 +1,52 @@
+"""Add the calculation_rollups table
+
+Hourly aggregates read by GET /calculations/stats when CALCULATION_ROLLUPS
+is enabled. The table starts empty; run `python -m app.stats` to fill it
+from existing calculations before enabling the rollups.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE = "calculation_rollups"
+
+
+def _has_table(table: str) -> bool:
+    """Check that a table exists; always false when generating offline SQL"""
+    if op.get_context().as_sql:
+        return False
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    # init_db() creates the table on new databases
+    if _has_table(TABLE):
+        return
+    op.create_table(
+        TABLE,
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("user_key", sa.Integer(), nullable=False),
+        sa.Column("result_count", sa.Integer(), nullable=False),
+        sa.Column("result_sum", sa.Float(), nullable=False),
+        sa.Column("result_min", sa.Float(), nullable=True),
+        sa.Column("result_max", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("bucket_start", "type", "user_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table(TABLE)
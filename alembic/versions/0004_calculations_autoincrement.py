@@ -0,0 +1,84 @@
+"""Use AUTOINCREMENT for calculation ids on SQLite
+
+Write-behind ingestion reserves ids in blocks from the AUTOINCREMENT
+counter in sqlite_sequence, which SQLite only keeps for tables declared
+with AUTOINCREMENT. The table is rebuilt on SQLite; other databases
+already reserve ids from the serial sequence and are left unchanged.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import utcnow
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def _uses_autoincrement() -> bool:
+    """Check whether the SQLite calculations table already has AUTOINCREMENT"""
+    sql = op.get_bind().scalar(sa.text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'calculations'"
+    ))
+    return sql is None or "AUTOINCREMENT" in sql.upper()
+
+
+def _table_at_revision() -> sa.Table:
+    """
+    The calculations table as of this revision
+
+    Frozen here rather than derived from the model, so later changes to the
+    model do not change what this revision creates.
+    """
+    metadata = sa.MetaData()
+    # The referenced table is needed to resolve the user_id foreign key
+    sa.Table("users", metadata, sa.Column("id", sa.Integer(), primary_key=True))
+    return sa.Table(
+        "calculations",
+        metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("a", sa.Float(), nullable=False),
+        sa.Column("b", sa.Float(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("result", sa.Float(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=utcnow()),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Index("ix_calculations_id", "id"),
+        sa.Index("ix_calculations_created_at_id", "created_at", "id"),
+        sa.Index("ix_calculations_user_id_created_at_id", "user_id", "created_at", "id"),
+        sa.Index("ix_calculations_type_created_at", "type", "created_at"),
+    )
+
+
+def _rebuild(autoincrement: bool) -> None:
+    # Offline SQL cannot reflect the table, so copy its definition at this revision
+    copy_from = _table_at_revision() if op.get_context().as_sql else None
+    with op.batch_alter_table(
+        "calculations",
+        recreate="always",
+        copy_from=copy_from,
+        table_kwargs={"sqlite_autoincrement": autoincrement},
+    ):
+        pass
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != "sqlite":
+        return
+    if op.get_context().as_sql or not _uses_autoincrement():
+        _rebuild(True)
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "sqlite":
+        return
+    _rebuild(False)
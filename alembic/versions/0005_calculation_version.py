@@ -0,0 +1,45 @@
+"""Add a version counter to calculations
+
+The version is incremented by every update and identifies the state of a
+calculation in the ETags of GET /calculations/{id} and of per-user
+calculation lists. Existing rows start at version 1.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE = "calculations"
+COLUMN = "version"
+
+
+def _has_column(table: str, column: str) -> bool:
+    """Check that a column exists; always false when generating offline SQL"""
+    if op.get_context().as_sql:
+        return False
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(existing["name"] == column for existing in columns)
+
+
+def upgrade() -> None:
+    # init_db() creates the column on new databases
+    if _has_column(TABLE, COLUMN):
+        return
+    op.add_column(TABLE, sa.Column(COLUMN, sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table(TABLE) as batch_op:
+        batch_op.drop_column(COLUMN)
@@ -0,0 +1,45 @@
+"""Add a calculations version counter to users
+
+The counter is incremented in the transaction of every write to one of the
+user's calculations and identifies the state of the user's calculation list
+in the ETag of GET /calculations?user_id=. Existing users start at 0.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE = "users"
+COLUMN = "calculations_version"
+
+
+def _has_column(table: str, column: str) -> bool:
+    """Check that a column exists; always false when generating offline SQL"""
+    if op.get_context().as_sql:
+        return False
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(existing["name"] == column for existing in columns)
+
+
+def upgrade() -> None:
+    # init_db() creates the column on new databases
+    if _has_column(TABLE, COLUMN):
+        return
+    op.add_column(TABLE, sa.Column(COLUMN, sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table(TABLE) as batch_op:
+        batch_op.drop_column(COLUMN)
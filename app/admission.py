@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Request priorities, most important first. Critical requests (health checks,
+# metrics and profiling) are never queued or rejected
+CRITICAL, READ, WRITE, BULK = range(4)
+PRIORITY_NAMES = {CRITICAL: "critical", READ: "read", WRITE: "write", BULK: "bulk"}
+
+# Fraction of the concurrency limit each priority may fill, so lower
+# priorities are shed first and always leave room for reads
+DEFAULT_SHARES = {READ: 1.0, WRITE: 0.8, BULK: 0.5}
+
+CRITICAL_PATHS = ("/", "/metrics")
+CRITICAL_PREFIXES = ("/health", "/debug/profile")
+BULK_PATHS = ("/calculations/batch", "/calculations/import", "/calculations/export")
+
+def request_priority(method: str, path: str) -> int:
+    """Classify a request as critical, read, write or bulk"""
+    if path in CRITICAL_PATHS or path.startswith(CRITICAL_PREFIXES):
+        return CRITICAL
+    if path in BULK_PATHS:
+        return BULK
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return READ
+    return WRITE
+
+class AdmissionController:
+    """
+    Adaptive concurrency limit with priority queueing
+
+    The limit follows AIMD: while requests finish within target_latency and
+    the limit is in use it grows by about one per limit completions; a read
+    or write slower than target_latency, or failing with a 5xx other than
+    503, multiplies it by backoff. Only requests that started after the
+    last decrease can decrease it again, so a burst of slow responses
+    counts as one congestion signal.
+
+    A request is admitted while fewer than its priority's share of the limit
+    are in flight. Otherwise it waits in a priority queue for up to
+    queue_timeout seconds, and is rejected at once when max_queue requests
+    are already waiting. Freed slots go to the highest-priority waiter.
+    Runs on the event loop and is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 20,
+        min_limit: float = 4,
+        max_limit: float = 200,
+        target_latency: float = 0.25,
+        backoff: float = 0.9,
+        max_queue: int = 100,
+        queue_timeout: float = 0.1,
+        shares: Optional[Dict[int, float]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            initial_limit: Concurrent requests allowed before any latency is observed
+            min_limit: Lowest the limit can be decreased to
+            max_limit: Highest the limit can grow to
+            target_latency: Seconds a read or write may take before it counts as congestion
+            backoff: Factor the limit is multiplied by on congestion
+            max_queue: Requests allowed to wait for a slot
+            queue_timeout: Seconds a request may wait for a slot
+            shares: Fraction of the limit usable per priority (default DEFAULT_SHARES)
+            clock: Monotonic time source, replaceable in tests
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.shares = dict(DEFAULT_SHARES if shares is None else shares)
+        self._clock = clock
+        self.inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._last_decrease = float("-inf")
+        self._admitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._rejected = {priority: 0 for priority in PRIORITY_NAMES}
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """
+        Create a controller configured from the environment
+
+        Environment variables:
+            ADMISSION_CONTROL: Enable admission control (default false)
+            ADMISSION_INITIAL_LIMIT: Starting concurrency limit (default 20)
+            ADMISSION_MIN_LIMIT: Lowest concurrency limit (default 4)
+            ADMISSION_MAX_LIMIT: Highest concurrency limit (default 200)
+            ADMISSION_TARGET_LATENCY_MS: Read/write latency treated as congestion (default 250)
+            ADMISSION_MAX_QUEUE: Requests allowed to wait for a slot (default 100)
+            ADMISSION_QUEUE_TIMEOUT_MS: Milliseconds a request may wait for a slot (default 100)
+
+        Returns:
+            The configured controller, or None when admission control is disabled
+        """
+        if os.getenv("ADMISSION_CONTROL", "false").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            initial_limit=float(os.getenv("ADMISSION_INITIAL_LIMIT", "20")),
+            min_limit=float(os.getenv("ADMISSION_MIN_LIMIT", "4")),
+            max_limit=float(os.getenv("ADMISSION_MAX_LIMIT", "200")),
+            target_latency=int(os.getenv("ADMISSION_TARGET_LATENCY_MS", "250")) / 1000,
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+            queue_timeout=int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "100")) / 1000,
+        )
+
+    def capacity(self, priority: int) -> int:
+        """Return how many requests may be in flight when admitting a request of this priority"""
+        return max(1, int(self.limit * self.shares[priority]))
+
+    def _first_waiter(self) -> Optional[Tuple[int, int, asyncio.Future]]:
+        """Return the highest-priority waiter still waiting, dropping those that gave up"""
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return self._waiters[0] if self._waiters else None
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters in priority order"""
+        while (waiter := self._first_waiter()) is not None and self.inflight < self.capacity(waiter[0]):
+            heapq.heappop(self._waiters)
+            self.inflight += 1
+            self._queued -= 1
+            waiter[2].set_result(None)
+
+    async def acquire(self, priority: int) -> Optional[float]:
+        """
+        Wait for a slot for a request
+
+        Returns:
+            The admission time, to pass to release(), or None if the request
+            is rejected
+        """
+        if priority == CRITICAL:
+            self._admitted[priority] += 1
+            return self._clock()
+
+        waiter = self._first_waiter()
+        if self.inflight < self.capacity(priority) and (waiter is None or waiter[0] > priority):
+            self.inflight += 1
+            self._admitted[priority] += 1
+            return self._clock()
+
+        if self._queued >= self.max_queue:
+            self._rejected[priority] += 1
+            return None
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._queued -= 1
+            self._rejected[priority] += 1
+            return None
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._queued -= 1
+            else:
+                # The client went away after being granted a slot; give it back
+                self.inflight -= 1
+                self._wake()
+            raise
+        self._admitted[priority] += 1
+        return self._clock()
+
+    def release(self, priority: int, admitted_at: float, status_code: int) -> None:
+        """Free a request's slot and adapt the limit to how it went"""
+        if priority == CRITICAL:
+            return
+        self.inflight -= 1
+        now = self._clock()
+        if priority != BULK:
+            congested = now - admitted_at > self.target_latency or (status_code >= 500 and status_code != 503)
+            if congested:
+                if admitted_at > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif (self.inflight + 1) * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying"""
+        return max(1, round(self.target_latency * 4))
+
+    def stats(self) -> Dict:
+        """Return the current limit, requests in flight and waiting, and counts per priority"""
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "target_latency": self.target_latency,
+            "admitted": {PRIORITY_NAMES[priority]: count for priority, count in self._admitted.items()},
+            "rejected": {PRIORITY_NAMES[priority]: count for priority, count in self._rejected.items()},
+        }
+
+# Optional admission controller in front of the routes
+_controller: Optional[AdmissionController] = AdmissionController.from_env()
+
+def set_admission_controller(controller: Optional[AdmissionController]) -> None:
+    """Install an admission controller, or None to admit every request"""
+    global _controller
+    _controller = controller
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Return the admission controller, if admission control is enabled"""
+    return _controller
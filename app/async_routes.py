@@ -0,0 +1,421 @@
+from fastapi import APIRouter, Body, Depends, FastAPI, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from app.database import get_async_db
+from app.models import CALCULATION_COLUMNS, USER_COLUMNS
+from app.schemas import (
+    CalculationBatchResult,
+    CalculationCreate,
+    CalculationImportResult,
+    CalculationRead,
+    CalculationStats,
+    CalculationUpdate,
+    ExportFormat,
+    ExpressionEvaluate,
+    ExpressionResult,
+    StatsGroupBy,
+    StatsSource,
+    UserCreate,
+    UserRead
+)
+from app.batch import build_batch_rows, referenced_user_ids
+from app.csv_import import ImportFileError, import_calculations_async
+from app.etags import calculation_etag, calculation_version, user_collection_version
+from app.export import encode_header, encode_rows
+from app.handlers import (
+    apply_changes,
+    bad_request,
+    batch_result,
+    calculation_not_modified,
+    calculations_changed,
+    collection_not_modified,
+    compute_result,
+    delete_calculation_row,
+    duplicate_user,
+    evaluate_bindings,
+    export_response,
+    found_calculation,
+    found_user,
+    insert_calculation,
+    insert_calculations,
+    insert_user,
+    is_foreign_key_violation,
+    merge_update,
+    not_found,
+    page_response,
+    referenced_user_deleted,
+    select_calculation,
+    select_calculation_for_update,
+    select_calculations,
+    select_export,
+    select_known_users,
+    select_user,
+    select_users,
+    stats_fields,
+    unknown_user,
+    update_calculation_row,
+    update_needs_current,
+    validate_batch
+)
+from app.ingest import get_write_behind, submit_calculation
+from app.stats import calculation_stats, rollups_enabled
+from app.replicas import get_async_read_db
+from app.security import hash_password
+from app.singleflight import coalesced_lookup_async
+
+# Async versions of the user and calculation routes in app.main, used when
+# DATABASE_URL selects an async driver. Checks, statements and responses come
+# from app.handlers; only running them on the session differs.
+router = APIRouter()
+
+def use_async_routes(app: FastAPI) -> None:
+    """Replace the app's sync routes with the async routes of the same path and methods"""
+    async_routes = {
+        (route.path, frozenset(route.methods)): route
+        for route in router.routes
+    }
+    app.router.routes = [
+        async_routes.get((route.path, frozenset(route.methods)), route)
+        if isinstance(route, APIRoute) else route
+        for route in app.router.routes
+    ]
+
+# User endpoints
+@router.post("/users", response_model=UserRead, status_code=status.HTTP_201_CREATED)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Create a new user
+
+    The password is hashed on the dedicated hashing pool and the user is
+    stored with a single INSERT ... RETURNING; duplicates are detected by the
+    unique constraints.
+    """
+    # Hash password on the dedicated hashing pool
+    hashed_password = await hash_password(user.password)
+
+    try:
+        db_user = (await db.execute(insert_user(user, hashed_password))).one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise duplicate_user()
+
+    return db_user
+
+@router.get("/users", response_model=List[UserRead])
+async def list_users(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    List all users
+
+    Users are ordered by (created_at, id). When a page is full, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    """
+    users = (await db.execute(select_users(skip, limit, cursor))).all()
+    return page_response(USER_COLUMNS, users, limit)
+
+@router.get("/users/{user_id}", response_model=UserRead)
+async def get_user(user_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get a specific user by ID
+
+    Concurrent requests for the same user share one query (app.singleflight).
+    """
+    async def load():
+        return (await db.execute(select_user(user_id))).first()
+
+    return found_user(await coalesced_lookup_async(request, ("user", user_id), load))
+
+# Calculation endpoints
+@router.post("/calculations", response_model=CalculationRead, status_code=status.HTTP_201_CREATED)
+async def create_calculation(
+    calculation: CalculationCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create a new calculation
+
+    Accepts operands a and b, and a calculation type (Add, Subtract, Multiply, Divide).
+    Uses the Factory Pattern to perform the calculation and stores the result
+    with a single INSERT ... RETURNING; an unknown user_id is detected by the
+    foreign key. With WRITE_BEHIND enabled the row is queued for a batched
+    write instead and 202 is returned with the calculation's reserved id.
+    """
+    result = compute_result(calculation.a, calculation.b, calculation.type)
+
+    writer = get_write_behind()
+    if writer is not None:
+        # Readable once the writer flushes, within WRITE_BEHIND_FLUSH_MS
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await run_in_threadpool(
+            submit_calculation,
+            writer, calculation.a, calculation.b, calculation.type, result, calculation.user_id
+        )
+
+    try:
+        db_calculation = (await db.execute(insert_calculation(calculation, result))).one()
+        await db.run_sync(lambda session: apply_changes(session, added=[db_calculation]))
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if not is_foreign_key_violation(e):
+            raise
+        raise unknown_user(calculation.user_id)
+    calculations_changed([db_calculation])
+
+    return db_calculation
+
+@router.post("/calculations/batch", response_model=CalculationBatchResult)
+async def create_calculations_batch(
+    items: List[Dict[str, Any]] = Body(..., description="List of CalculationCreate items"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create many calculations in a single transaction
+
+    Each item follows the CalculationCreate schema. Items that fail validation,
+    reference an unknown user or cannot be computed are reported in `errors`
+    by their position in the batch; all other items are stored with one
+    multi-row INSERT ... RETURNING. Validation and computation run on the
+    threadpool, so a large batch does not block the event loop.
+    """
+    valid, errors = await run_in_threadpool(validate_batch, items)
+
+    # Validate every referenced user with a single query
+    user_ids = referenced_user_ids(valid)
+    known_user_ids = set(await db.scalars(select_known_users(user_ids))) if user_ids else set()
+
+    rows = await run_in_threadpool(build_batch_rows, valid, known_user_ids, errors)
+
+    created = []
+    if rows:
+        try:
+            created = (await db.execute(insert_calculations(), rows)).all()
+            await db.run_sync(lambda session: apply_changes(session, added=created))
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            if not is_foreign_key_violation(e):
+                raise
+            raise referenced_user_deleted()
+        calculations_changed(created)
+
+    return batch_result(created, errors)
+
+@router.post("/calculations/import", response_model=CalculationImportResult)
+async def import_calculations_csv(
+    file: UploadFile = File(..., description="CSV file with a, b and type columns, and optionally user_id and created_at"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Import calculations from an uploaded CSV file
+
+    The file needs a header row with at least the a, b and type columns;
+    other columns (such as id and result in an export) are ignored. It is
+    parsed on the threadpool and stored in chunks, so files of any size are
+    imported in bounded memory. Lines that fail validation, reference an
+    unknown user or cannot be computed are reported in `errors` by line
+    number; all other lines are stored. A file that becomes unreadable after
+    some chunks were stored returns what was stored, with the error in
+    `failed`; one rejected before anything was stored is a 400. Chunks are
+    written with INSERT, since COPY needs psycopg2.
+    """
+    try:
+        return await import_calculations_async(db, file.file)
+    except ImportFileError as e:
+        raise bad_request(e)
+
+@router.post("/calculations/expression", response_model=ExpressionResult)
+async def evaluate_expression(request: ExpressionEvaluate):
+    """
+    Evaluate an arithmetic expression for many variable bindings
+
+    The expression may use + - * /, parentheses, numbers, variables and any
+    registered operation called as a two-argument function, e.g.
+    `Multiply(x, y) + 2`. It is evaluated on the threadpool, so large
+    binding lists do not block the event loop. Bindings whose evaluation
+    fails are reported in `errors` by their index.
+    """
+    return await run_in_threadpool(evaluate_bindings, request)
+
+@router.get("/calculations", response_model=List[CalculationRead])
+async def list_calculations(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    user_id: int = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    List all calculations, optionally filtered by user_id and creation time
+
+    Calculations are ordered by (created_at, id). When a page is full, the
+    X-Next-Cursor response header holds the cursor for the next page;
+    skip/limit paging is kept for compatibility.
+
+    Lists filtered by user_id carry an ETag that changes whenever one of the
+    user's calculations is created, updated or deleted; a matching
+    If-None-Match gets 304 Not Modified without running the page query.
+    """
+    headers = {}
+    if user_id:
+        version = await db.run_sync(lambda session: user_collection_version(session, user_id))
+        not_modified = collection_not_modified(request, f"{version}", headers)
+        if not_modified:
+            return not_modified
+
+    calculations = (await db.execute(
+        select_calculations(user_id, created_after, created_before, skip, limit, cursor)
+    )).all()
+    return page_response(CALCULATION_COLUMNS, calculations, limit, headers)
+
+@router.get("/calculations/stats", response_model=CalculationStats)
+async def get_calculation_stats(
+    group_by: List[StatsGroupBy] = Query([StatsGroupBy.TYPE]),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    source: StatsSource = StatsSource.AUTO,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Get count, sum, min, max and average of results over a time window
+
+    Results are grouped by type and/or user_id (repeat group_by for both).
+    With CALCULATION_ROLLUPS enabled, windows that fall on the hour are read
+    from the precomputed hourly rollups instead of the calculations table;
+    source=live or source=rollup forces one or the other.
+    """
+    fields = stats_fields(group_by)
+    try:
+        source, groups = await db.run_sync(
+            lambda session: calculation_stats(session, fields, created_after, created_before, source.value)
+        )
+    except ValueError as e:
+        raise bad_request(e)
+
+    return CalculationStats(source=source, group_by=fields, groups=groups)
+
+@router.get("/calculations/export", response_class=StreamingResponse)
+async def export_calculations(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    user_id: int = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Stream calculations as NDJSON or CSV
+
+    Rows are read from a server-side cursor in fixed-size chunks and written
+    to the response as they arrive, so memory use does not grow with the
+    number of rows exported. Accepts the same filters as GET /calculations.
+    """
+    export_format = ExportFormat(export_format).value
+    result = await db.stream(select_export(user_id, created_after, created_before))
+
+    async def stream():
+        yield encode_header(export_format)
+        async for rows in result.partitions():
+            yield encode_rows(export_format, rows)
+
+    return export_response(export_format, stream())
+
+@router.get("/calculations/{calculation_id}", response_model=CalculationRead)
+async def get_calculation(
+    calculation_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Get a specific calculation by ID
+
+    The response carries an ETag derived from the calculation's version. A
+    matching If-None-Match gets 304 Not Modified after reading only the
+    version, or without a query while the version is in the in-memory map.
+    Concurrent requests for the same calculation share one query
+    (app.singleflight).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = await db.run_sync(lambda session: calculation_version(session, calculation_id))
+        not_modified = calculation_not_modified(calculation_id, version, if_none_match)
+        if not_modified:
+            return not_modified
+
+    async def load():
+        return (await db.execute(select_calculation(calculation_id))).first()
+
+    calculation = await coalesced_lookup_async(request, ("calculation", calculation_id), load)
+    return found_calculation(calculation, response)
+
+@router.put("/calculations/{calculation_id}", response_model=CalculationRead)
+async def update_calculation(
+    calculation_id: int,
+    calculation_update: CalculationUpdate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Update a calculation and recalculate result
+
+    When a, b and type are all provided the row is updated with a single
+    UPDATE ... RETURNING; otherwise the current operands are read first.
+    The calculation's version is incremented and returned in the ETag header.
+    """
+    values = calculation_update.model_dump(exclude_none=True)
+
+    current = None
+    if update_needs_current(values, rollups_enabled()):
+        current = (await db.execute(select_calculation_for_update(calculation_id))).first()
+        values = merge_update(current, values)
+
+    try:
+        # Recalculate result
+        values["result"] = compute_result(values["a"], values["b"], values["type"])
+    except HTTPException:
+        await db.rollback()
+        raise
+
+    calculation = (await db.execute(update_calculation_row(calculation_id, values))).first()
+
+    if not calculation:
+        await db.rollback()
+        raise not_found("Calculation not found")
+
+    await db.run_sync(
+        lambda session: apply_changes(session, added=[calculation], removed=[current] if current else ())
+    )
+    await db.commit()
+    calculations_changed([calculation])
+
+    response.headers["ETag"] = calculation_etag(calculation.id, calculation.version)
+    return calculation
+
+@router.delete("/calculations/{calculation_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_calculation(calculation_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Delete a calculation with a single DELETE ... RETURNING"""
+    deleted = (await db.execute(delete_calculation_row(calculation_id))).first()
+
+    if not deleted:
+        await db.rollback()
+        raise not_found("Calculation not found")
+
+    await db.run_sync(lambda session: apply_changes(session, removed=[deleted]))
+    await db.commit()
+    calculations_changed([deleted])
+
+    return None
@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from pydantic import ValidationError
+
+from app.factory import perform_calculation, perform_calculations
+from app.schemas import CalculationBatchError, CalculationCreate
+
+# Upper bound on the number of items accepted by POST /calculations/batch
+MAX_BATCH_SIZE = 10000
+
+def format_validation_error(error: ValidationError) -> str:
+    """Flatten a pydantic ValidationError into a single readable message"""
+    messages = []
+    for item in error.errors():
+        location = ".".join(str(part) for part in item["loc"])
+        messages.append(f"{location}: {item['msg']}" if location else item["msg"])
+    return "; ".join(messages)
+
+def validate_batch_items(
+    items: Iterable[Dict[str, Any]]
+) -> Tuple[List[Tuple[int, CalculationCreate]], List[CalculationBatchError]]:
+    """
+    Validate raw batch items against the CalculationCreate schema
+
+    Returns:
+        Tuple of (valid, errors) where valid holds (index, calculation) pairs
+    """
+    valid = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, CalculationCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append(CalculationBatchError(index=index, detail=format_validation_error(e)))
+    return valid, errors
+
+def calculation_error(calculation: CalculationCreate) -> str:
+    """Recover the error message of a calculation the vectorized path flagged as failed"""
+    try:
+        perform_calculation(calculation.a, calculation.b, calculation.type)
+    except ValueError as e:
+        return str(e)
+    return "Calculation failed"
+
+def referenced_user_ids(valid: List[Tuple[int, CalculationCreate]]) -> Set[int]:
+    """Return the user ids referenced by a list of validated batch items"""
+    return {calculation.user_id for _, calculation in valid if calculation.user_id}
+
+def build_batch_rows(
+    valid: List[Tuple[int, CalculationCreate]],
+    known_user_ids: Set[int],
+    errors: List[CalculationBatchError]
+) -> List[Dict[str, Any]]:
+    """
+    Compute results for validated batch items and build rows to insert
+
+    Items referencing an unknown user or whose calculation fails are appended
+    to errors instead of producing a row.
+
+    Args:
+        valid: (index, calculation) pairs from validate_batch_items
+        known_user_ids: User ids confirmed to exist in the database
+        errors: List collecting per-item errors
+
+    Returns:
+        Column values for each calculation to insert
+    """
+    pending = []
+    for index, calculation in valid:
+        if calculation.user_id and calculation.user_id not in known_user_ids:
+            errors.append(CalculationBatchError(
+                index=index,
+                detail=f"User with id {calculation.user_id} not found"
+            ))
+        else:
+            pending.append((index, calculation))
+
+    # Compute all results with one vectorized pass per operation type
+    results, failed = perform_calculations(
+        [calculation.a for _, calculation in pending],
+        [calculation.b for _, calculation in pending],
+        [calculation.type for _, calculation in pending]
+    )
+
+    rows = []
+    for (index, calculation), result, has_error in zip(pending, results.tolist(), failed.tolist()):
+        if has_error:
+            errors.append(CalculationBatchError(index=index, detail=calculation_error(calculation)))
+            continue
+        rows.append({
+            "a": calculation.a,
+            "b": calculation.b,
+            "type": calculation.type,
+            "result": result,
+            "user_id": calculation.user_id
+        })
+    return rows
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+def cache_key(a: float, b: float, operation_type: str, version: int = 0) -> str:
+    """
+    Build the cache key for a calculation
+
+    Operands are encoded with float.hex() so that values which compare equal
+    but produce different results (0.0 and -0.0) get different keys. version
+    is the operation registry version, so results of an operation class that
+    has since been replaced are never served.
+    """
+    return f"{operation_type}@{version}:{float(a).hex()}:{float(b).hex()}"
+
+class CacheBackend(ABC):
+    """Abstract base class for calculation result caches"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[float]:
+        """Return the cached value for key, or None if it is missing or expired"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: float) -> None:
+        """Store a value under key"""
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every entry from the cache"""
+        pass
+
+    def get(self, key: str) -> Optional[float]:
+        """Look up a key, counting the hit or miss"""
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def stats(self) -> Dict:
+        """Return hit/miss/eviction counters"""
+        with self._stats_lock:
+            return {
+                "backend": type(self).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+class LocalCache(CacheBackend):
+    """In-process cache with LRU and TTL eviction"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_size: Maximum number of entries kept
+            ttl: Seconds an entry stays valid, 0 for no expiry
+            clock: Monotonic time source, replaceable in tests
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: float) -> None:
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """Remove an entry if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        with self._lock:
+            stats.update(size=len(self._entries), max_size=self.max_size, ttl=self.ttl)
+        return stats
+
+class RedisCache(CacheBackend):
+    """
+    Cache stored in a Redis-compatible server
+
+    Works with any client exposing get(key), set(key, value, ex=seconds) and
+    delete(*keys) / scan_iter(match=pattern), such as redis.Redis. Eviction
+    is handled by the server (TTL plus its maxmemory policy), so evictions
+    are not counted here.
+    """
+
+    def __init__(self, client, ttl: float = 300, prefix: str = "calc:"):
+        """
+        Args:
+            client: Redis-compatible client
+            ttl: Seconds an entry stays valid, 0 for no expiry
+            prefix: Namespace prepended to every key
+        """
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _get(self, key: str) -> Optional[float]:
+        value = self.client.get(self.prefix + key)
+        return None if value is None else float(value)
+
+    def set(self, key: str, value: float) -> None:
+        self.client.set(self.prefix + key, repr(value), ex=int(self.ttl) or None)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update(evictions=None, ttl=self.ttl)
+        return stats
+
+def cache_from_env() -> Optional[CacheBackend]:
+    """
+    Create the calculation result cache configured in the environment
+
+    Environment variables:
+        CALCULATION_CACHE: "off" (default), "local" or "redis"
+        CALCULATION_CACHE_MAX_SIZE: Entries kept by the local cache (default 10000)
+        CALCULATION_CACHE_TTL: Seconds an entry stays valid (default 300)
+        CALCULATION_CACHE_URL: Redis URL for the redis backend
+
+    Returns:
+        The configured cache, or None when caching is off
+    """
+    kind = os.getenv("CALCULATION_CACHE", "off").strip().lower()
+    ttl = float(os.getenv("CALCULATION_CACHE_TTL", "300"))
+
+    if kind == "off":
+        return None
+    if kind == "local":
+        return LocalCache(max_size=int(os.getenv("CALCULATION_CACHE_MAX_SIZE", "10000")), ttl=ttl)
+    if kind == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CALCULATION_CACHE=redis requires the redis package") from e
+        url = os.getenv("CALCULATION_CACHE_URL", "redis://localhost:6379/0")
+        return RedisCache(redis.Redis.from_url(url), ttl=ttl)
+    raise ValueError(f"Unsupported calculation cache: {kind}")
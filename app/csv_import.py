@@ -0,0 +1,271 @@
+import csv
+import io
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.batch import calculation_error, format_validation_error
+from app.etags import forget_collections
+from app.factory import perform_calculations
+from app.handlers import apply_changes
+from app.models import Calculation, User
+from app.schemas import CalculationCreate, CalculationImportError, CalculationImportResult
+
+# Columns that must appear in the header; created_at and user_id are optional
+# and any other column (e.g. id and result from an export) is ignored
+REQUIRED_COLUMNS = ("a", "b", "type")
+
+# Columns written for each imported row, in COPY order
+IMPORT_COLUMNS = ("a", "b", "type", "result", "created_at", "user_id")
+
+# Rows parsed, validated and written per transaction
+IMPORT_CHUNK_SIZE = 5000
+
+# Rejected lines listed in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+class ImportFileError(ValueError):
+    """The upload is not a readable calculations CSV file"""
+
+    def __init__(self, detail: str, line: int):
+        super().__init__(detail)
+        self.line = line
+
+class ImportReport:
+    """Counts imported and rejected lines, keeping the first MAX_REPORTED_ERRORS errors"""
+
+    def __init__(self, max_errors: Optional[int] = None):
+        self.imported = 0
+        self.rejected = 0
+        self.committed_line = 0
+        self.failed: Optional[CalculationImportError] = None
+        self.errors: List[CalculationImportError] = []
+        self.max_errors = MAX_REPORTED_ERRORS if max_errors is None else max_errors
+
+    def reject(self, line: int, detail: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(CalculationImportError(line=line, detail=detail))
+
+    def fail(self, error: "ImportFileError") -> None:
+        """
+        Record the error that stopped an import part way
+
+        Re-raises the error when nothing was stored yet, so that the upload
+        is rejected as a whole and can be retried as is.
+        """
+        if not self.imported:
+            raise error
+        self.failed = CalculationImportError(line=error.line, detail=str(error))
+
+    def result(self) -> CalculationImportResult:
+        return CalculationImportResult(
+            imported=self.imported,
+            rejected=self.rejected,
+            errors=self.errors,
+            errors_truncated=self.rejected > len(self.errors),
+            committed_line=self.committed_line,
+            failed=self.failed,
+        )
+
+def read_chunks(file: BinaryIO, chunk_size: int) -> Iterator[List[Tuple[int, Dict[str, str]]]]:
+    """
+    Parse a CSV file incrementally into chunks of (line number, record) pairs
+
+    Only one chunk of records is held in memory at a time.
+
+    Raises:
+        ImportFileError: If the file is not UTF-8 CSV or lacks a required column
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    try:
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportFileError(f"CSV header is missing columns: {', '.join(missing)}", line=1)
+
+        chunk = []
+        for record in reader:
+            chunk.append((reader.line_num, record))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    except UnicodeDecodeError:
+        raise ImportFileError(f"File is not valid UTF-8 text (after line {reader.line_num})", line=reader.line_num + 1)
+    except csv.Error as e:
+        raise ImportFileError(f"Malformed CSV at line {reader.line_num}: {e}", line=reader.line_num)
+    finally:
+        # Leave the upload open for its owner to close
+        text.detach()
+
+def _parse_created_at(value: Optional[str]) -> Optional[datetime]:
+    """Parse an optional ISO 8601 timestamp, converting aware values to naive UTC"""
+    if not value:
+        return None
+    created_at = datetime.fromisoformat(value)
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+def build_rows(
+    db: Session,
+    chunk: List[Tuple[int, Dict[str, str]]],
+    report: ImportReport,
+    now: datetime
+) -> List[Dict]:
+    """
+    Validate a chunk of records and compute their results
+
+    Records are validated against CalculationCreate, user ids are checked
+    with one query per chunk and results are computed with one vectorized
+    pass per operation type. Rejected records are added to the report.
+
+    Args:
+        db: Session used to check user ids
+        chunk: (line number, record) pairs from read_chunks
+        report: Collects rejected lines
+        now: created_at of records that do not have one
+
+    Returns:
+        Column values for the rows to insert, in IMPORT_COLUMNS order
+    """
+    pending = []
+    for line, record in chunk:
+        try:
+            calculation = CalculationCreate.model_validate({
+                "a": record["a"],
+                "b": record["b"],
+                "type": record["type"],
+                "user_id": record.get("user_id") or None,
+            })
+            created_at = _parse_created_at(record.get("created_at"))
+        except ValidationError as e:
+            report.reject(line, format_validation_error(e))
+            continue
+        except ValueError:
+            report.reject(line, f"created_at: invalid datetime {record.get('created_at')!r}")
+            continue
+        pending.append((line, calculation, created_at or now))
+
+    user_ids = {calculation.user_id for _, calculation, _ in pending if calculation.user_id}
+    known_user_ids = set()
+    if user_ids:
+        known_user_ids = set(db.scalars(select(User.id).where(User.id.in_(user_ids))))
+
+    results, failed = perform_calculations(
+        [calculation.a for _, calculation, _ in pending],
+        [calculation.b for _, calculation, _ in pending],
+        [calculation.type for _, calculation, _ in pending]
+    )
+
+    rows = []
+    for (line, calculation, created_at), result, has_error in zip(pending, results.tolist(), failed.tolist()):
+        if calculation.user_id and calculation.user_id not in known_user_ids:
+            report.reject(line, f"User with id {calculation.user_id} not found")
+        elif has_error:
+            report.reject(line, calculation_error(calculation))
+        else:
+            rows.append({
+                "a": calculation.a,
+                "b": calculation.b,
+                "type": calculation.type,
+                "result": result,
+                "created_at": created_at,
+                "user_id": calculation.user_id,
+            })
+    return rows
+
+def copy_rows(db: Session, rows: List[Dict]) -> None:
+    """Load rows with COPY FROM STDIN on psycopg2, or a batched executemany INSERT elsewhere"""
+    if db.get_bind().dialect.driver != "psycopg2":
+        db.execute(insert(Calculation), rows)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # An unquoted empty field is NULL in COPY's CSV format
+        writer.writerow([
+            row["a"], row["b"], row["type"], repr(row["result"]),
+            row["created_at"].isoformat(sep=" "), row["user_id"]
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {Calculation.__tablename__} ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def import_chunk(db: Session, chunk: List[Tuple[int, Dict[str, str]]], report: ImportReport, now: datetime) -> None:
+    """Validate, compute and store one chunk from read_chunks in its own transaction"""
+    rows = build_rows(db, chunk, report, now)
+    if not rows:
+        report.committed_line = chunk[-1][0]
+        return
+    copy_rows(db, rows)
+    apply_changes(db, added=[SimpleNamespace(**row) for row in rows])
+    db.commit()
+    forget_collections({row["user_id"] for row in rows})
+    report.imported += len(rows)
+    report.committed_line = chunk[-1][0]
+
+def import_calculations(db: Session, file: BinaryIO, chunk_size: Optional[int] = None) -> CalculationImportResult:
+    """
+    Import calculations from a CSV file
+
+    The file is read and written chunk by chunk, each chunk in its own
+    transaction, so memory use does not grow with the file size. Lines that
+    fail validation, reference an unknown user or cannot be computed are
+    skipped and reported by line number; all other lines are stored.
+
+    A file that turns out to be unreadable after some chunks were committed
+    (e.g. invalid UTF-8 further down) returns the partial result, with the
+    error in failed and the last stored line in committed_line, so the
+    client can resume after it instead of importing the same rows twice.
+
+    Raises:
+        ImportFileError: If the file is not a readable calculations CSV and
+            nothing was stored
+    """
+    report = ImportReport()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    try:
+        for chunk in read_chunks(file, chunk_size or IMPORT_CHUNK_SIZE):
+            import_chunk(db, chunk, report, now)
+    except ImportFileError as e:
+        report.fail(e)
+    return report.result()
+
+async def import_calculations_async(
+    db: AsyncSession,
+    file: BinaryIO,
+    chunk_size: Optional[int] = None
+) -> CalculationImportResult:
+    """
+    Async version of import_calculations, for the routes in app.async_routes
+
+    The file is read and parsed on the threadpool; each chunk is stored
+    through the async session. The session's connection is not a psycopg2
+    one even on PostgreSQL (asyncpg), so copy_rows always falls back to an
+    executemany INSERT here and never uses COPY.
+    """
+    report = ImportReport()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    chunks = read_chunks(file, chunk_size or IMPORT_CHUNK_SIZE)
+    try:
+        while (chunk := await run_in_threadpool(next, chunks, None)) is not None:
+            await db.run_sync(import_chunk, chunk, report, now)
+    except ImportFileError as e:
+        report.fail(e)
+    return report.result()
@@ -0,0 +1,110 @@
+import hashlib
+import os
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.cache import LocalCache
+from app.models import Calculation, User
+
+# Seconds a version read from the database is reused to answer conditional
+# requests without a query; 0 (default) always asks the database. Writes
+# made by this process are forgotten immediately, writes made by other
+# processes are noticed after at most this long.
+ETAG_VERSION_TTL = float(os.getenv("ETAG_VERSION_TTL", "0"))
+ETAG_VERSION_MAX_SIZE = int(os.getenv("ETAG_VERSION_MAX_SIZE", "10000"))
+
+# Calculation versions and per-user collection versions
+_versions: Optional[LocalCache] = (
+    LocalCache(max_size=ETAG_VERSION_MAX_SIZE, ttl=ETAG_VERSION_TTL) if ETAG_VERSION_TTL > 0 else None
+)
+
+def set_version_map(versions: Optional[LocalCache]) -> None:
+    """Install the in-memory version map, or None to always read versions from the database"""
+    global _versions
+    _versions = versions
+
+def get_version_map() -> Optional[LocalCache]:
+    """Return the in-memory version map, if any"""
+    return _versions
+
+def calculation_etag(calculation_id: int, version: int) -> str:
+    """Return the ETag of a calculation at a given version"""
+    return f'"c{calculation_id}.{version}"'
+
+def collection_etag(fingerprint: str, query: str) -> str:
+    """Return the ETag of a calculation list from its collection fingerprint and query string"""
+    digest = hashlib.blake2b(f"{fingerprint}?{query}".encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, using weak comparison"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+def _cached(key: str, load):
+    """Return the value for key from the version map, loading and remembering it on a miss"""
+    if _versions is not None:
+        value = _versions.get(key)
+        if value is not None:
+            return value
+    value = load()
+    if value is not None and _versions is not None:
+        _versions.set(key, value)
+    return value
+
+def calculation_version(db: Session, calculation_id: int) -> Optional[int]:
+    """Return the current version of a calculation, or None if it does not exist"""
+    return _cached(
+        f"calculation:{calculation_id}",
+        lambda: db.scalar(select(Calculation.version).where(Calculation.id == calculation_id))
+    )
+
+def remember_version(calculation_id: int, version: int) -> None:
+    """Record a version read along with the rest of a calculation"""
+    if _versions is not None:
+        _versions.set(f"calculation:{calculation_id}", version)
+
+def user_collection_version(db: Session, user_id: int) -> Optional[int]:
+    """Return the version of a user's calculations, or None if the user does not exist"""
+    return _cached(
+        f"user:{user_id}",
+        lambda: db.scalar(select(User.calculations_version).where(User.id == user_id))
+    )
+
+def bump_collection_versions(db: Session, calculations: Iterable) -> None:
+    """
+    Increment the collection versions of the owners of calculations written in the current transaction
+
+    Every write path calls this before committing, so a user's version
+    changes with each write to their calculations whatever the ids and
+    versions of the rows involved. Users are updated in id order so that
+    concurrent batches lock them in the same order.
+    """
+    user_ids = sorted({calculation.user_id for calculation in calculations if calculation.user_id is not None})
+    if user_ids:
+        db.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(calculations_version=User.calculations_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+def forget_versions(calculations: Iterable) -> None:
+    """Drop the versions of changed calculations and their owners' collections from the map"""
+    if _versions is None:
+        return
+    for calculation in calculations:
+        _versions.delete(f"calculation:{calculation.id}")
+        _versions.delete(f"user:{calculation.user_id}")
+
+def forget_collections(user_ids: Iterable[Optional[int]]) -> None:
+    """Drop the collection versions of users who gained calculations"""
+    if _versions is None:
+        return
+    for user_id in user_ids:
+        _versions.delete(f"user:{user_id}")
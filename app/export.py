@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import select
+
+from app.models import Calculation
+from app.pagination import keyset_order
+
+# Columns written by the export, in output order
+EXPORT_COLUMNS = ("id", "a", "b", "type", "result", "created_at", "user_id")
+
+# Rows fetched from the server-side cursor per round-trip
+EXPORT_CHUNK_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def export_statement():
+    """Build the column-only select used by the export, in stable order"""
+    columns = [getattr(Calculation, name) for name in EXPORT_COLUMNS]
+    return (
+        select(*columns)
+        .order_by(*keyset_order(Calculation))
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+def _plain(value):
+    """Convert a column value into a JSON/CSV friendly value"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def encode_header(export_format: str) -> bytes:
+    """Return the bytes written before the first row"""
+    if export_format == "csv":
+        return encode_rows(export_format, [EXPORT_COLUMNS])
+    return b""
+
+def encode_rows(export_format: str, rows: Sequence[Sequence]) -> bytes:
+    """
+    Encode a chunk of rows for the export
+    
+    Args:
+        export_format: "ndjson" or "csv"
+        rows: Row tuples with values in EXPORT_COLUMNS order
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([map(_plain, row) for row in rows])
+        return buffer.getvalue().encode()
+    
+    lines = [
+        json.dumps(dict(zip(EXPORT_COLUMNS, map(_plain, row))), separators=(",", ":"))
+        for row in rows
+    ]
+    return "".join(line + "\n" for line in lines).encode()
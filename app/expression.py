@@ -0,0 +1,177 @@
+import ast
+import os
+from functools import lru_cache
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from app.factory import CalculationFactory
+
+# Longest expression accepted, to bound parse time and program size
+MAX_EXPRESSION_LENGTH = 1000
+
+# Number of compiled expressions kept in memory
+EXPRESSION_CACHE_SIZE = int(os.getenv("EXPRESSION_CACHE_SIZE", "1024"))
+
+# Infix operators and the registered operations implementing them
+OPERATOR_SYMBOLS = {
+    ast.Add: "Add",
+    ast.Sub: "Subtract",
+    ast.Mult: "Multiply",
+    ast.Div: "Divide",
+}
+
+# Instruction opcodes of a compiled expression
+CONST, LOAD, APPLY = "const", "load", "apply"
+
+Instruction = Tuple[str, object]
+
+class CompiledExpression:
+    """
+    An arithmetic expression compiled to a postfix program
+
+    Each instruction pushes a constant, pushes a variable, or pops two
+    operands and pushes the result of a registered operation. Evaluation
+    runs the program once over arrays holding every binding, so each
+    operation is applied with a single calculate_many call.
+    """
+
+    def __init__(self, expression: str, instructions: Sequence[Instruction], variables: Sequence[str]):
+        self.expression = expression
+        self.instructions = tuple(instructions)
+        self.variables = tuple(variables)
+
+    def _check_bindings(self, bindings: Sequence[Mapping[str, float]]) -> None:
+        """Raise ValueError if a binding lacks one of the expression's variables"""
+        for index, binding in enumerate(bindings):
+            missing = [name for name in self.variables if name not in binding]
+            if missing:
+                raise ValueError(f"Binding {index} is missing variables: {', '.join(missing)}")
+
+    def evaluate(self, bindings: Sequence[Mapping[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate the expression for many variable bindings at once
+
+        Args:
+            bindings: One mapping of variable name to value per evaluation
+
+        Returns:
+            Tuple of (results, errors) as float and boolean arrays. Elements
+            where any operation failed are flagged in errors and have a NaN
+            result
+
+        Raises:
+            ValueError: If a binding is missing a variable or an operation is
+                no longer registered
+        """
+        self._check_bindings(bindings)
+        count = len(bindings)
+        columns = {
+            name: np.fromiter((binding[name] for binding in bindings), dtype=float, count=count)
+            for name in self.variables
+        }
+
+        stack: List[np.ndarray] = []
+        errors = np.zeros(count, dtype=bool)
+        for opcode, argument in self.instructions:
+            if opcode == CONST:
+                stack.append(np.full(count, argument))
+            elif opcode == LOAD:
+                stack.append(columns[argument])
+            else:
+                b = stack.pop()
+                a = stack.pop()
+                operation = CalculationFactory.get_operation(argument)
+                results, failed = operation.calculate_many(a, b)
+                errors |= failed
+                stack.append(np.asarray(results, dtype=float))
+
+        results = stack.pop()
+        results[errors] = np.nan
+        return results, errors
+
+    def evaluate_one(self, binding: Mapping[str, float]) -> float:
+        """
+        Evaluate the expression for a single binding with the scalar operations
+
+        Raises:
+            ValueError: If the binding is missing a variable or an operation fails
+        """
+        self._check_bindings([binding])
+        stack: List[float] = []
+        for opcode, argument in self.instructions:
+            if opcode == CONST:
+                stack.append(argument)
+            elif opcode == LOAD:
+                stack.append(float(binding[argument]))
+            else:
+                b = stack.pop()
+                a = stack.pop()
+                stack.append(CalculationFactory.get_operation(argument).calculate(a, b))
+        return stack.pop()
+
+class _Compiler:
+    """Translate a parsed expression into postfix instructions"""
+
+    def __init__(self):
+        self.instructions: List[Instruction] = []
+        self.variables: Dict[str, None] = {}
+
+    def emit_operation(self, operation_type: str) -> None:
+        if operation_type not in CalculationFactory.get_available_operations():
+            raise ValueError(f"Unsupported operation: {operation_type}")
+        self.instructions.append((APPLY, operation_type))
+
+    def visit(self, node: ast.AST) -> None:
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            self.instructions.append((CONST, float(node.value)))
+        elif isinstance(node, ast.Name):
+            self.variables.setdefault(node.id)
+            self.instructions.append((LOAD, node.id))
+        elif isinstance(node, ast.BinOp) and type(node.op) in OPERATOR_SYMBOLS:
+            self.visit(node.left)
+            self.visit(node.right)
+            self.emit_operation(OPERATOR_SYMBOLS[type(node.op)])
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+            self.visit(node.operand)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            # -x is evaluated as Subtract(0, x)
+            self.instructions.append((CONST, 0.0))
+            self.visit(node.operand)
+            self.emit_operation(OPERATOR_SYMBOLS[ast.Sub])
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            if len(node.args) != 2:
+                raise ValueError(f"{node.func.id}() takes exactly 2 arguments")
+            for argument in node.args:
+                self.visit(argument)
+            self.emit_operation(node.func.id)
+        else:
+            raise ValueError(f"Unsupported syntax in expression: {ast.unparse(node)}")
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression: str) -> CompiledExpression:
+    """
+    Compile an arithmetic expression, caching the result by its text
+
+    Expressions may use numbers, variables, parentheses, the infix operators
+    + - * / (the Add, Subtract, Multiply and Divide operations) and any
+    registered operation called as a function of two arguments, e.g.
+    `Multiply(x, y) + 2`.
+
+    Raises:
+        ValueError: If the expression is too long, malformed or uses an
+            unknown operation
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression exceeds the limit of {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except (SyntaxError, RecursionError, MemoryError):
+        raise ValueError("Invalid expression")
+
+    compiler = _Compiler()
+    try:
+        compiler.visit(tree.body)
+    except RecursionError:
+        raise ValueError("Expression is nested too deeply")
+    return CompiledExpression(expression, compiler.instructions, list(compiler.variables))
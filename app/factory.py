@@ -1,9 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Type
+from typing import Dict, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+from app.cache import CacheBackend, cache_from_env, cache_key
 
 class Operation(ABC):
     """Abstract base class for calculation operations"""
     
+    # Whether the result depends only on (a, b). Operations that are not pure
+    # (e.g. random or time dependent) must set this to False so their
+    # results bypass the result cache.
+    pure = True
+    
     @abstractmethod
     def calculate(self, a: float, b: float) -> float:
         """Perform the calculation and return the result"""
@@ -13,6 +22,30 @@ class Operation(ABC):
     def get_operation_name(self) -> str:
         """Return the name of the operation"""
         pass
+    
+    def calculate_many(self, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Perform the calculation element-wise over arrays of operands
+        
+        Subclasses can override this with a vectorized kernel. The default
+        implementation falls back to calling calculate() for each pair.
+        
+        Args:
+            a: Array of first operands
+            b: Array of second operands
+            
+        Returns:
+            Tuple of (results, errors) where errors is a boolean mask of the
+            elements that could not be computed; their result is NaN
+        """
+        results = np.full(len(a), np.nan)
+        errors = np.zeros(len(a), dtype=bool)
+        for i, (x, y) in enumerate(zip(a.tolist(), b.tolist())):
+            try:
+                results[i] = self.calculate(x, y)
+            except (ValueError, ArithmeticError):
+                errors[i] = True
+        return results, errors
 
 class AddOperation(Operation):
     """Addition operation"""
@@ -20,6 +53,9 @@ class AddOperation(Operation):
     def calculate(self, a: float, b: float) -> float:
         return a + b
     
+    def calculate_many(self, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.add(a, b), np.zeros(len(a), dtype=bool)
+    
     def get_operation_name(self) -> str:
         return "Add"
 
@@ -29,6 +65,9 @@ class SubtractOperation(Operation):
     def calculate(self, a: float, b: float) -> float:
         return a - b
     
+    def calculate_many(self, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.subtract(a, b), np.zeros(len(a), dtype=bool)
+    
     def get_operation_name(self) -> str:
         return "Subtract"
 
@@ -38,6 +77,9 @@ class MultiplyOperation(Operation):
     def calculate(self, a: float, b: float) -> float:
         return a * b
     
+    def calculate_many(self, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.multiply(a, b), np.zeros(len(a), dtype=bool)
+    
     def get_operation_name(self) -> str:
         return "Multiply"
 
@@ -49,6 +91,12 @@ class DivideOperation(Operation):
             raise ValueError("Division by zero is not allowed")
         return a / b
     
+    def calculate_many(self, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        errors = b == 0
+        results = np.divide(a, np.where(errors, 1.0, b))
+        results[errors] = np.nan
+        return results, errors
+    
     def get_operation_name(self) -> str:
         return "Divide"
 
@@ -63,6 +111,22 @@ class CalculationFactory:
         "Divide": DivideOperation,
     }
     
+    # Incremented by register_operation to invalidate the dispatch table
+    _version = 0
+    
+    # Shared operation instances by type, with the registry version and
+    # dictionary they were built from
+    _dispatch: Tuple[int, Optional[dict], Dict[str, Operation]] = (-1, None, {})
+    
+    @classmethod
+    def _unsupported(cls, operation_type: str) -> ValueError:
+        """Build the error raised for an unknown operation type"""
+        available_operations = ", ".join(cls._operations.keys())
+        return ValueError(
+            f"Unsupported operation type: {operation_type}. "
+            f"Available operations: {available_operations}"
+        )
+    
     @classmethod
     def create_operation(cls, operation_type: str) -> Operation:
         """
@@ -80,14 +144,32 @@ class CalculationFactory:
         operation_class = cls._operations.get(operation_type)
         
         if operation_class is None:
-            available_operations = ", ".join(cls._operations.keys())
-            raise ValueError(
-                f"Unsupported operation type: {operation_type}. "
-                f"Available operations: {available_operations}"
-            )
+            raise cls._unsupported(operation_type)
         
         return operation_class()
     
+    @classmethod
+    def get_operation(cls, operation_type: str) -> Operation:
+        """
+        Return the shared instance of an operation type
+        
+        Instances are created once per registry version instead of on every
+        call, so operations must be stateless. The dispatch table is rebuilt
+        after register_operation (or when the registry is replaced).
+        
+        Raises:
+            ValueError: If the operation type is not supported
+        """
+        version, source, instances = cls._dispatch
+        if version != cls._version or source is not cls._operations:
+            instances = {name: operation_class() for name, operation_class in cls._operations.items()}
+            cls._dispatch = (cls._version, cls._operations, instances)
+        
+        operation = instances.get(operation_type)
+        if operation is None:
+            raise cls._unsupported(operation_type)
+        return operation
+    
     @classmethod
     def get_available_operations(cls) -> list:
         """Return a list of available operation types"""
@@ -105,11 +187,15 @@ class CalculationFactory:
         if not issubclass(operation_class, Operation):
             raise TypeError(f"{operation_class} must be a subclass of Operation")
         cls._operations[operation_name] = operation_class
+        cls._version += 1
 
 def perform_calculation(a: float, b: float, operation_type: str) -> float:
     """
     Convenience function to perform a calculation using the factory
     
+    When a result cache is installed, results of pure operations are served
+    from it; operations with pure = False always run.
+    
     Args:
         a: First operand
         b: Second operand
@@ -118,5 +204,69 @@ def perform_calculation(a: float, b: float, operation_type: str) -> float:
     Returns:
         Result of the calculation
     """
-    operation = CalculationFactory.create_operation(operation_type)
-    return operation.calculate(a, b)
+    operation = CalculationFactory.get_operation(operation_type)
+    cache = _result_cache
+    if cache is None or not operation.pure:
+        return operation.calculate(a, b)
+    
+    key = cache_key(a, b, operation_type, CalculationFactory._version)
+    result = cache.get(key)
+    if result is None:
+        result = operation.calculate(a, b)
+        cache.set(key, result)
+    return result
+
+# Optional cache of results for pure operations, keyed on (a, b, type, registry version)
+_result_cache: Optional[CacheBackend] = cache_from_env()
+
+def set_result_cache(cache: Optional[CacheBackend]) -> None:
+    """Install a result cache for perform_calculation, or None to disable caching"""
+    global _result_cache
+    _result_cache = cache
+
+def get_result_cache() -> Optional[CacheBackend]:
+    """Return the result cache used by perform_calculation, if any"""
+    return _result_cache
+
+def perform_calculations(
+    a_values: Sequence[float],
+    b_values: Sequence[float],
+    operation_types: Sequence[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Perform many calculations at once using the factory
+    
+    Inputs are grouped by operation type and each group is evaluated with a
+    single call to the operation's calculate_many kernel.
+    
+    Args:
+        a_values: First operands
+        b_values: Second operands
+        operation_types: Type of operation to perform for each pair
+        
+    Returns:
+        Tuple of (results, errors) as float and boolean arrays. Elements that
+        could not be computed (e.g. division by zero) are flagged in errors
+        and have a NaN result
+        
+    Raises:
+        ValueError: If the inputs differ in length or an operation type is not supported
+    """
+    a = np.asarray(a_values, dtype=float)
+    b = np.asarray(b_values, dtype=float)
+    types = np.asarray(operation_types, dtype=object)
+    
+    if not len(a) == len(b) == len(types):
+        raise ValueError("Operands and operation types must have the same length")
+    
+    results = np.full(len(a), np.nan)
+    errors = np.zeros(len(a), dtype=bool)
+    
+    for operation_type in dict.fromkeys(types.tolist()):
+        operation = CalculationFactory.get_operation(operation_type)
+        indices = np.flatnonzero(types == operation_type)
+        group_results, group_errors = operation.calculate_many(a[indices], b[indices])
+        results[indices] = group_results
+        errors[indices] = group_errors
+    
+    return results, errors
@@ -0,0 +1,328 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.batch import MAX_BATCH_SIZE, validate_batch_items
+from app.etags import (
+    bump_collection_versions,
+    calculation_etag,
+    collection_etag,
+    etag_matches,
+    forget_versions,
+    remember_version
+)
+from app.expression import compile_expression
+from app.export import MEDIA_TYPES, export_statement
+from app.factory import perform_calculation
+from app.models import CALCULATION_COLUMNS, USER_COLUMNS, Calculation, User
+from app.pagination import NEXT_CURSOR_HEADER, next_cursor, paginate
+from app.queries import filter_calculations
+from app.responses import RowsResponse, column_names
+from app.schemas import (
+    CalculationBatchError,
+    CalculationBatchResult,
+    CalculationCreate,
+    ExpressionEvaluate,
+    ExpressionResult,
+    StatsGroupBy,
+    UserCreate
+)
+from app.singleflight import forget_calculations
+from app.stats import apply_rollup
+
+# Request handling shared by the sync routes in app.main and the async routes
+# in app.async_routes: input checks, statements and response shaping. The
+# routes only differ in how they run the statements on their session.
+
+def not_found(detail: str) -> HTTPException:
+    """Build a 404 error"""
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+def bad_request(error: Exception) -> HTTPException:
+    """Build a 400 error carrying an error's message"""
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+def check_batch_size(count: int, detail: str) -> None:
+    """
+    Reject requests with more than MAX_BATCH_SIZE items
+
+    Args:
+        count: Number of items in the request
+        detail: Error message, formatted with the limit as {limit}
+
+    Raises:
+        HTTPException: 413 when the request is too large
+    """
+    if count > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=detail.format(limit=MAX_BATCH_SIZE)
+        )
+
+def page_response(columns: Sequence, rows: Sequence, limit: int, headers: Optional[Dict] = None) -> RowsResponse:
+    """Encode a page of rows, adding the X-Next-Cursor header when the page is full"""
+    headers = dict(headers or {})
+    token = next_cursor(rows, limit)
+    if token:
+        headers[NEXT_CURSOR_HEADER] = token
+    return RowsResponse(column_names(columns), rows, headers=headers or None)
+
+# Users
+
+def insert_user(user: UserCreate, hashed_password: str):
+    """Build the INSERT ... RETURNING storing a new user"""
+    return (
+        insert(User)
+        .values(username=user.username, email=user.email, hashed_password=hashed_password)
+        .returning(*USER_COLUMNS)
+    )
+
+def duplicate_user() -> HTTPException:
+    """Build the error for a username or email that is already taken"""
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Username or email already registered"
+    )
+
+def select_users(skip: int, limit: int, cursor: Optional[str]):
+    """Build the query for a page of users"""
+    return paginate(select(*USER_COLUMNS), User, skip, limit, cursor)
+
+def select_user(user_id: int):
+    """Build the lookup of one user"""
+    return select(*USER_COLUMNS).where(User.id == user_id)
+
+def found_user(user):
+    """Return a looked up user, or raise 404 if there was none"""
+    if not user:
+        raise not_found("User not found")
+    return user
+
+# Calculations
+
+def compute_result(a: float, b: float, operation_type: str) -> float:
+    """
+    Perform a calculation for a write path
+
+    Raises:
+        HTTPException: 400 when the calculation fails
+    """
+    try:
+        return perform_calculation(a, b, operation_type)
+    except ValueError as e:
+        raise bad_request(e)
+
+def insert_calculation(calculation: CalculationCreate, result: float):
+    """Build the INSERT ... RETURNING storing a new calculation"""
+    return (
+        insert(Calculation)
+        .values(
+            a=calculation.a,
+            b=calculation.b,
+            type=calculation.type,
+            result=result,
+            user_id=calculation.user_id
+        )
+        .returning(*CALCULATION_COLUMNS)
+    )
+
+def is_foreign_key_violation(error: IntegrityError) -> bool:
+    """
+    Return whether an IntegrityError is a foreign key violation
+
+    user_id is the only foreign key of calculations, so on their write paths
+    this means the referenced user does not exist.
+    """
+    code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    if code is not None:
+        return code == "23503"
+    return "FOREIGN KEY constraint failed" in str(error.orig)
+
+def unknown_user(user_id: Optional[int]) -> HTTPException:
+    """Build the error for a calculation referencing a user that does not exist"""
+    return not_found(f"User with id {user_id} not found")
+
+def apply_changes(db: Session, added: Iterable = (), removed: Iterable = ()) -> None:
+    """
+    Update the rollups and the owners' collection versions for calculations written in the current transaction
+
+    Args:
+        db: Session holding the write's transaction
+        added: Inserted rows, or updated rows with their new values
+        removed: Deleted rows, or updated rows with their previous values
+    """
+    added, removed = list(added), list(removed)
+    apply_rollup(db, added=added, removed=removed)
+    bump_collection_versions(db, added + removed)
+
+def calculations_changed(calculations: Iterable) -> None:
+    """Drop cached versions and in-flight lookups of calculations after their transaction commits"""
+    calculations = list(calculations)
+    forget_versions(calculations)
+    forget_calculations(calculation.id for calculation in calculations)
+
+def validate_batch(items: List[Dict[str, Any]]) -> Tuple[List[Tuple[int, CalculationCreate]], List[CalculationBatchError]]:
+    """
+    Check the size of a batch and validate its items
+
+    Raises:
+        HTTPException: 413 when the batch is too large
+    """
+    check_batch_size(len(items), "Batch size exceeds the limit of {limit} items")
+    return validate_batch_items(items)
+
+def select_known_users(user_ids: Iterable[int]):
+    """Build the query for which of user_ids exist"""
+    return select(User.id).where(User.id.in_(user_ids))
+
+def insert_calculations():
+    """Build the multi-row INSERT ... RETURNING of a batch, returning rows in parameter order"""
+    return insert(Calculation).returning(*CALCULATION_COLUMNS, sort_by_parameter_order=True)
+
+def referenced_user_deleted() -> HTTPException:
+    """Build the error for a batch whose user was deleted between the user check and the INSERT"""
+    return not_found("A referenced user was deleted while the batch was being stored")
+
+def batch_result(created: Sequence, errors: List[CalculationBatchError]) -> CalculationBatchResult:
+    """Build the batch response, with errors in item order"""
+    errors.sort(key=lambda error: error.index)
+    return CalculationBatchResult(created=created, errors=errors)
+
+def evaluate_bindings(request: ExpressionEvaluate) -> ExpressionResult:
+    """
+    Evaluate an expression for every binding of a request
+
+    Raises:
+        HTTPException: 413 for too many bindings, 400 for an invalid expression
+    """
+    check_batch_size(len(request.bindings), "Number of bindings exceeds the limit of {limit}")
+
+    try:
+        compiled = compile_expression(request.expression)
+        results, failed = compiled.evaluate(request.bindings)
+    except ValueError as e:
+        raise bad_request(e)
+
+    errors = []
+    for index in failed.nonzero()[0].tolist():
+        # Re-run the scalar path to recover the error message
+        try:
+            compiled.evaluate_one(request.bindings[index])
+            detail = "Evaluation failed"
+        except (ValueError, ArithmeticError) as e:
+            detail = str(e)
+        errors.append(CalculationBatchError(index=index, detail=detail))
+
+    return ExpressionResult(
+        expression=request.expression,
+        variables=list(compiled.variables),
+        results=[None if error else result for result, error in zip(results.tolist(), failed.tolist())],
+        errors=errors
+    )
+
+def collection_not_modified(request: Request, fingerprint: str, headers: Dict) -> Optional[Response]:
+    """
+    Check a filtered list's ETag against If-None-Match
+
+    Adds the ETag to headers, and returns a 304 response when it matches.
+    """
+    etag = collection_etag(fingerprint, request.url.query)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    headers["ETag"] = etag
+    return None
+
+def select_calculations(
+    user_id: Optional[int],
+    created_after: Optional[datetime],
+    created_before: Optional[datetime],
+    skip: int,
+    limit: int,
+    cursor: Optional[str]
+):
+    """Build the query for a page of calculations"""
+    query = filter_calculations(select(*CALCULATION_COLUMNS), user_id, created_after, created_before)
+    return paginate(query, Calculation, skip, limit, cursor)
+
+def stats_fields(group_by: List[StatsGroupBy]) -> List[str]:
+    """Return the requested group_by fields without duplicates"""
+    return list(dict.fromkeys(field.value for field in group_by))
+
+def select_export(user_id: Optional[int], created_after: Optional[datetime], created_before: Optional[datetime]):
+    """Build the streamed query of an export"""
+    return filter_calculations(export_statement(), user_id, created_after, created_before)
+
+def export_response(export_format: str, body) -> StreamingResponse:
+    """Wrap an export's chunks in a download response"""
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=calculations.{export_format}"}
+    )
+
+def calculation_not_modified(calculation_id: int, version: Optional[int], if_none_match: str) -> Optional[Response]:
+    """Return a 304 response when If-None-Match matches the calculation's current version"""
+    if version is not None:
+        etag = calculation_etag(calculation_id, version)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
+def select_calculation(calculation_id: int):
+    """Build the lookup of one calculation, with its version"""
+    return select(*CALCULATION_COLUMNS, Calculation.version).where(Calculation.id == calculation_id)
+
+def found_calculation(calculation, response: Response):
+    """
+    Return a looked up or written calculation with its ETag set on response
+
+    Raises:
+        HTTPException: 404 when there was no calculation
+    """
+    if not calculation:
+        raise not_found("Calculation not found")
+    remember_version(calculation.id, calculation.version)
+    response.headers["ETag"] = calculation_etag(calculation.id, calculation.version)
+    return calculation
+
+def update_needs_current(values: Dict, rollups: bool) -> bool:
+    """
+    Return whether an update must read the calculation first
+
+    The previous row is needed to fill in missing operands and to move the
+    calculation out of its old rollup bucket.
+    """
+    return rollups or values.keys() != {"a", "b", "type"}
+
+def select_calculation_for_update(calculation_id: int):
+    """Build the locking read of the calculation an update changes"""
+    return select(*CALCULATION_COLUMNS).where(Calculation.id == calculation_id).with_for_update()
+
+def merge_update(current, values: Dict) -> Dict:
+    """
+    Fill in the operands an update leaves out from the current row
+
+    Raises:
+        HTTPException: 404 when there is no current row
+    """
+    if not current:
+        raise not_found("Calculation not found")
+    return {"a": current.a, "b": current.b, "type": current.type, **values}
+
+def update_calculation_row(calculation_id: int, values: Dict):
+    """Build the UPDATE ... RETURNING of a calculation, incrementing its version"""
+    return (
+        update(Calculation)
+        .where(Calculation.id == calculation_id)
+        .values(**values, version=Calculation.version + 1)
+        .returning(*CALCULATION_COLUMNS, Calculation.version)
+    )
+
+def delete_calculation_row(calculation_id: int):
+    """Build the DELETE ... RETURNING of a calculation"""
+    return delete(Calculation).where(Calculation.id == calculation_id).returning(*CALCULATION_COLUMNS)
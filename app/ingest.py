@@ -0,0 +1,363 @@
+import csv
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.handlers import apply_changes, calculations_changed
+from app.metrics import Histogram
+from app.models import Calculation, User
+
+logger = logging.getLogger(__name__)
+
+# Buckets for the number of rows written per flush
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Columns of the dead-letter file: the export columns, which POST
+# /calculations/import accepts, plus the error that dropped the row
+DEAD_LETTER_COLUMNS = ("id", "a", "b", "type", "result", "created_at", "user_id", "error")
+
+class IngestQueueFull(RuntimeError):
+    """Raised when the write-behind queue is over its limit"""
+
+class UnknownUser(LookupError):
+    """Raised when a calculation references a user that does not exist"""
+
+class InvalidRow(ValueError):
+    """Raised when a calculation would violate a column constraint of the table"""
+
+class IdBlockAllocator:
+    """
+    Hands out calculation ids reserved from the database in blocks
+
+    Ids come from the same sequence as regular inserts, so rows written
+    behind never collide with rows inserted directly: the serial sequence on
+    PostgreSQL, and the AUTOINCREMENT counter in sqlite_sequence on SQLite.
+    One round trip reserves block_size ids.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], block_size: int = 1000):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._ids: Deque[int] = deque()
+        self._lock = threading.Lock()
+
+    def _reserve(self, db: Session) -> List[int]:
+        """Reserve block_size ids in the database"""
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            return list(db.scalars(
+                text("SELECT nextval(pg_get_serial_sequence('calculations', 'id')) FROM generate_series(1, :n)"),
+                {"n": self.block_size}
+            ))
+        if dialect == "sqlite":
+            # The counter row only exists once a row has been inserted
+            db.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) "
+                "SELECT 'calculations', COALESCE(MAX(id), 0) FROM calculations "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'calculations')"
+            ))
+            last = db.scalar(
+                text("UPDATE sqlite_sequence SET seq = seq + :n WHERE name = 'calculations' RETURNING seq"),
+                {"n": self.block_size}
+            )
+            return list(range(last - self.block_size + 1, last + 1))
+        raise RuntimeError(f"Write-behind ingestion is not supported on {dialect}")
+
+    def next_id(self) -> int:
+        """Return an unused calculation id, reserving a new block when needed"""
+        with self._lock:
+            if not self._ids:
+                with self.session_factory() as db:
+                    self._ids.extend(self._reserve(db))
+                    db.commit()
+            return self._ids.popleft()
+
+class WriteBehindWriter:
+    """
+    Buffers calculation rows in memory and writes them in batches
+
+    Requests get their id from an IdBlockAllocator and return as soon as the
+    row is queued. A flusher thread writes the queue with multi-row INSERTs
+    once batch_size rows are waiting or flush_interval seconds after the
+    first row of a batch arrived. Rows still queued are written by shutdown().
+
+    submit() checks every constraint the INSERT enforces (NOT NULL operands
+    and type, the user_id foreign key; ids are reserved), so a row is only
+    accepted when it can be written. A row that still fails, e.g. because
+    the database is unreachable, is counted as dropped, logged, and appended
+    to the dead-letter CSV file when one is configured.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        id_block_size: int = 1000,
+        dead_letter_path: Optional[str] = None
+    ):
+        """
+        Args:
+            session_factory: Creates the sessions used for ids and flushes
+            max_queue: Rows allowed to wait for a flush before requests are rejected
+            batch_size: Rows written per INSERT
+            flush_interval: Seconds a row may wait for its batch to fill
+            id_block_size: Ids reserved per round trip to the database
+            dead_letter_path: CSV file rows that cannot be written are appended to
+        """
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dead_letter_path = dead_letter_path
+        self.ids = IdBlockAllocator(session_factory, id_block_size)
+        self.flush_seconds = Histogram()
+        self.batch_rows = Histogram(BATCH_SIZE_BUCKETS)
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_queue)
+        self._known_users: Set[int] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_env(cls, session_factory: Callable[[], Session]) -> Optional["WriteBehindWriter"]:
+        """
+        Create a writer configured from the environment
+
+        Environment variables:
+            WRITE_BEHIND: Enable write-behind ingestion for POST /calculations (default false)
+            WRITE_BEHIND_MAX_QUEUE: Rows allowed to wait for a flush (default 10000)
+            WRITE_BEHIND_BATCH_SIZE: Rows written per INSERT (default 500)
+            WRITE_BEHIND_FLUSH_MS: Milliseconds a row may wait for its batch (default 50)
+            WRITE_BEHIND_ID_BLOCK: Ids reserved per round trip (default 1000)
+            WRITE_BEHIND_DEAD_LETTER: CSV file rows that cannot be written are appended to (default none)
+
+        Returns:
+            The configured writer, or None when write-behind is disabled
+        """
+        if os.getenv("WRITE_BEHIND", "false").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            session_factory,
+            max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000")),
+            batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500")),
+            flush_interval=int(os.getenv("WRITE_BEHIND_FLUSH_MS", "50")) / 1000,
+            id_block_size=int(os.getenv("WRITE_BEHIND_ID_BLOCK", "1000")),
+            dead_letter_path=os.getenv("WRITE_BEHIND_DEAD_LETTER") or None,
+        )
+
+    def _check_user(self, user_id: int) -> None:
+        """Raise UnknownUser unless the user exists; users are never deleted, so hits are cached"""
+        if user_id in self._known_users:
+            return
+        with self.session_factory() as db:
+            if db.scalar(select(User.id).where(User.id == user_id)) is None:
+                raise UnknownUser(f"User with id {user_id} not found")
+        self._known_users.add(user_id)
+
+    def _start(self) -> None:
+        """Start the flusher thread on first use"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, a: float, b: float, operation_type: str, result: float, user_id: Optional[int]) -> Dict:
+        """
+        Queue a calculation for writing and return the row it will be stored as
+
+        Raises:
+            InvalidRow: If an operand or the type is missing, or an operand is not finite
+            UnknownUser: If user_id does not reference an existing user
+            IngestQueueFull: If the queue is at its limit
+        """
+        if a is None or b is None or not operation_type:
+            raise InvalidRow("Calculations need a, b and type")
+        if not (math.isfinite(a) and math.isfinite(b)):
+            raise InvalidRow("Operands must be finite numbers")
+        if user_id:
+            self._check_user(user_id)
+        if self._queue.qsize() >= self.max_queue:
+            with self._lock:
+                self._rejected += 1
+            raise IngestQueueFull("Write-behind queue is full")
+
+        row = {
+            "id": self.ids.next_id(),
+            "a": a,
+            "b": b,
+            "type": operation_type,
+            "result": result,
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            "user_id": user_id,
+        }
+        self._start()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise IngestQueueFull("Write-behind queue is full")
+        with self._lock:
+            self._enqueued += 1
+        return row
+
+    def _run(self) -> None:
+        """Flusher loop: collect a batch, write it, repeat until stopped"""
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(row)
+            self._flush(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, rows: List[Dict]) -> None:
+        """Insert rows and update the rollups and collection versions in one transaction"""
+        added = [SimpleNamespace(**row) for row in rows]
+        with self.session_factory() as db:
+            db.execute(insert(Calculation), rows)
+            apply_changes(db, added=added)
+            db.commit()
+        calculations_changed(added)
+
+    def _dead_letter(self, row: Dict, error: Exception) -> None:
+        """Record a row that could not be written, so it can be replayed"""
+        logger.error("Dropping calculation %s: %s", row["id"], error)
+        if self.dead_letter_path is None:
+            return
+        try:
+            with open(self.dead_letter_path, "a", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                if file.tell() == 0:
+                    writer.writerow(DEAD_LETTER_COLUMNS)
+                writer.writerow([
+                    row["id"], row["a"], row["b"], row["type"], row["result"],
+                    row["created_at"].isoformat(), row["user_id"], str(error).splitlines()[0]
+                ])
+        except OSError:
+            logger.exception("Could not write calculation %s to %s", row["id"], self.dead_letter_path)
+
+    def _flush(self, batch: List[Dict]) -> None:
+        """Write a batch, falling back to row by row so one bad row does not lose the rest"""
+        start = time.perf_counter()
+        flushed = 0
+        try:
+            self._write(batch)
+            flushed = len(batch)
+        except SQLAlchemyError:
+            logger.exception("Write-behind batch of %d rows failed; retrying row by row", len(batch))
+            for row in batch:
+                try:
+                    self._write([row])
+                    flushed += 1
+                except SQLAlchemyError as e:
+                    self._dead_letter(row, e)
+        self.flush_seconds.observe(time.perf_counter() - start)
+        self.batch_rows.observe(len(batch))
+        with self._lock:
+            self._flushed += flushed
+            self._dropped += len(batch) - flushed
+
+    def flush(self) -> None:
+        """Block until every row queued so far has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self) -> Dict:
+        """Return queue and flush statistics, including the current queue depth"""
+        with self._lock:
+            counters = {
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+            }
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            **counters,
+            "flush_seconds": self.flush_seconds.snapshot(),
+            "batch_rows": self.batch_rows.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        """Write every queued row and stop the flusher thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+# Optional write-behind writer used by POST /calculations
+_writer: Optional[WriteBehindWriter] = WriteBehindWriter.from_env(SessionLocal)
+
+def set_write_behind(writer: Optional[WriteBehindWriter]) -> None:
+    """Install a write-behind writer for POST /calculations, or None to write synchronously"""
+    global _writer
+    _writer = writer
+
+def get_write_behind() -> Optional[WriteBehindWriter]:
+    """Return the write-behind writer, if write-behind ingestion is enabled"""
+    return _writer
+
+def submit_calculation(
+    writer: WriteBehindWriter,
+    a: float,
+    b: float,
+    operation_type: str,
+    result: float,
+    user_id: Optional[int]
+) -> Dict:
+    """
+    Queue a calculation on the writer, mapping its errors to HTTP errors
+
+    Raises:
+        HTTPException: 400 for an invalid row, 404 for an unknown user, 503
+            with Retry-After when the queue is full
+    """
+    try:
+        return writer.submit(a, b, operation_type, result, user_id)
+    except InvalidRow as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UnknownUser as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except IngestQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
@@ -1,20 +1,78 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Body, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db, init_db
-from app.models import Calculation, User
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from app.database import ASYNC_MODE, get_db, get_pool_stats, init_db, init_db_on_startup
+from app.models import CALCULATION_COLUMNS, USER_COLUMNS
 from app.schemas import (
+    CalculationBatchResult,
     CalculationCreate, 
+    CalculationImportResult,
     CalculationRead, 
+    CalculationStats,
     CalculationUpdate,
+    ExportFormat,
+    ExpressionEvaluate,
+    ExpressionResult,
+    StatsGroupBy,
+    StatsSource,
     UserCreate,
     UserRead
 )
-from app.factory import perform_calculation
-from passlib.context import CryptContext
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.factory import get_result_cache
+from app.batch import build_batch_rows, referenced_user_ids
+from app.csv_import import ImportFileError, import_calculations
+from app.expression import compile_expression
+from app.etags import calculation_etag, calculation_version, get_version_map, user_collection_version
+from app.export import encode_header, encode_rows
+from app.handlers import (
+    apply_changes,
+    bad_request,
+    batch_result,
+    calculation_not_modified,
+    calculations_changed,
+    collection_not_modified,
+    compute_result,
+    delete_calculation_row,
+    duplicate_user,
+    evaluate_bindings,
+    export_response,
+    found_calculation,
+    found_user,
+    insert_calculation,
+    insert_calculations,
+    insert_user,
+    is_foreign_key_violation,
+    merge_update,
+    not_found,
+    page_response,
+    referenced_user_deleted,
+    select_calculation,
+    select_calculation_for_update,
+    select_calculations,
+    select_export,
+    select_known_users,
+    select_user,
+    select_users,
+    stats_fields,
+    unknown_user,
+    update_calculation_row,
+    update_needs_current,
+    validate_batch
+)
+from app.ingest import get_write_behind, submit_calculation
+from app.partitioning import get_partition_maintainer
+from app.stats import calculation_stats, rollups_enabled
+from app.security import hash_password, password_hasher
+from app.singleflight import coalesced_lookup, get_lookups, single_flight_enabled
+from app.admission import get_admission_controller
+from app.metrics import render_counter, render_gauge, render_histogram, request_metrics
+from app.middleware import AdmissionMiddleware, MetricsMiddleware, ProfilingMiddleware, ReadYourWritesMiddleware
+from app.profiling import profiling_enabled, router as profiling_router
+from app.replicas import get_read_db, get_replicas
 
 app = FastAPI(
     title="Calculation API",
@@ -22,10 +80,33 @@ app = FastAPI(
     version="1.0.0"
 )
 
+if profiling_enabled():
+    # Admin-only profiling under /debug/profile; absent unless PROFILING_TOKEN is set
+    app.include_router(profiling_router)
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 @app.on_event("startup")
 def startup_event():
-    """Initialize database on startup"""
-    init_db()
+    """Initialize database on startup, unless a migrate step already did, and start partition maintenance"""
+    if init_db_on_startup():
+        init_db()
+    maintainer = get_partition_maintainer()
+    if maintainer is not None:
+        maintainer.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Stop the password hashing pool and partition maintenance, and write any calculations still queued"""
+    password_hasher.shutdown()
+    writer = get_write_behind()
+    if writer is not None:
+        writer.shutdown()
+    maintainer = get_partition_maintainer()
+    if maintainer is not None:
+        maintainer.shutdown()
 
 @app.get("/")
 def read_root():
@@ -45,182 +126,433 @@ def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/health/pool")
+def pool_health():
+    """Connection pool statistics: checked-out connections, overflow and checkout wait times"""
+    replicas = get_replicas()
+    return {**get_pool_stats(), "replicas": replicas.stats() if replicas else []}
+
+@app.get("/health/hashing")
+def hashing_health():
+    """Password hashing pool statistics: workers, queue depth and hash latency"""
+    return password_hasher.stats()
+
+@app.get("/health/cache")
+def cache_health():
+    """Calculation result, compiled expression, ETag version map and single-flight statistics"""
+    cache = get_result_cache()
+    versions = get_version_map()
+    return {
+        "enabled": cache is not None,
+        **(cache.stats() if cache else {}),
+        "expressions": compile_expression.cache_info()._asdict(),
+        "etag_versions": versions.stats() if versions else None,
+        "single_flight": {"enabled": single_flight_enabled(), "lookups": get_lookups().stats()},
+    }
+
+@app.get("/health/admission")
+def admission_health():
+    """Admission control statistics: concurrency limit, requests in flight and queued, admitted and rejected counts"""
+    controller = get_admission_controller()
+    return {"enabled": controller is not None, **(controller.stats() if controller else {})}
+
+@app.get("/health/ingest")
+def ingest_health():
+    """Write-behind ingestion statistics: queue depth, flushed and dropped rows, flush latency"""
+    writer = get_write_behind()
+    return {"enabled": writer is not None, **(writer.stats() if writer else {})}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, database, connection pool, password hashing, admission and single-flight metrics in Prometheus format"""
+    pools = [
+        ({"engine": name}, stats["checkout_wait_seconds"])
+        for name, stats in get_pool_stats().items()
+        if "checkout_wait_seconds" in stats
+    ]
+    body = (
+        request_metrics.render()
+        + render_histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", pools)
+        + render_histogram(
+            "password_hash_seconds",
+            "Time to hash a password, including queueing",
+            [({}, password_hasher.hash_seconds.snapshot())]
+        )
+    )
+    writer = get_write_behind()
+    if writer is not None:
+        stats = writer.stats()
+        body += (
+            render_gauge("write_behind_queue_depth", "Calculations waiting to be written", stats["queue_depth"])
+            + render_histogram("write_behind_flush_seconds", "Time to write one batch", [({}, stats["flush_seconds"])])
+            + render_histogram("write_behind_batch_rows", "Rows written per batch", [({}, stats["batch_rows"])])
+            + render_counter(
+                "write_behind_rows_total",
+                "Calculations queued, written, dropped after a failed write, or rejected with a full queue",
+                [({"outcome": outcome}, stats[outcome]) for outcome in ("enqueued", "flushed", "dropped", "rejected")]
+            )
+        )
+    controller = get_admission_controller()
+    if controller is not None:
+        stats = controller.stats()
+        body += (
+            render_gauge("admission_concurrency_limit", "Current adaptive concurrency limit", stats["limit"])
+            + render_gauge("admission_inflight_requests", "Admitted requests in flight", stats["inflight"])
+            + render_gauge("admission_queued_requests", "Requests waiting for a slot", stats["queued"])
+            + render_counter(
+                "admission_requests_total",
+                "Requests admitted or rejected by admission control",
+                [
+                    ({"priority": priority, "outcome": outcome}, count)
+                    for outcome in ("admitted", "rejected")
+                    for priority, count in stats[outcome].items()
+                ]
+            )
+        )
+    body += render_counter(
+        "single_flight_lookups_total",
+        "Detail lookups executed against the database or coalesced into one in flight",
+        [
+            ({"lookup": lookup, "outcome": outcome}, count)
+            for lookup, counts in get_lookups().stats().items()
+            for outcome, count in counts.items()
+        ]
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 # User endpoints
 @app.post("/users", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    """Create a new user"""
-    # Check if user already exists
-    existing_user = db.query(User).filter(
-        (User.username == user.username) | (User.email == user.email)
-    ).first()
-    
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username or email already registered"
-        )
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+    """
+    Create a new user
     
+    The password is hashed on the dedicated hashing pool, so bcrypt does not
+    hold a threadpool slot. The user is stored with a single INSERT ...
+    RETURNING; duplicates are detected by the unique constraints.
+    """
     # Hash password
-    hashed_password = pwd_context.hash(user.password)
-    
-    # Create new user
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
-    )
+    hashed_password = await hash_password(user.password)
     
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    def save():
+        try:
+            db_user = db.execute(insert_user(user, hashed_password)).one()
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise duplicate_user()
+        return db_user
     
-    return db_user
+    return await run_in_threadpool(save)
 
 @app.get("/users", response_model=List[UserRead])
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """List all users"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+def list_users(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    List all users
+    
+    Users are ordered by (created_at, id). When a page is full, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    """
+    users = db.execute(select_users(skip, limit, cursor)).all()
+    return page_response(USER_COLUMNS, users, limit)
 
 @app.get("/users/{user_id}", response_model=UserRead)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    """Get a specific user by ID"""
-    user = db.query(User).filter(User.id == user_id).first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+def get_user(user_id: int, request: Request, db: Session = Depends(get_read_db)):
+    """
+    Get a specific user by ID
     
-    return user
+    Concurrent requests for the same user share one query (app.singleflight).
+    """
+    return found_user(coalesced_lookup(request, ("user", user_id), lambda: db.execute(select_user(user_id)).first()))
 
 # Calculation endpoints
 @app.post("/calculations", response_model=CalculationRead, status_code=status.HTTP_201_CREATED)
-def create_calculation(calculation: CalculationCreate, db: Session = Depends(get_db)):
+def create_calculation(
+    calculation: CalculationCreate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
     """
     Create a new calculation
     
     Accepts operands a and b, and a calculation type (Add, Subtract, Multiply, Divide).
-    Uses the Factory Pattern to perform the calculation and stores the result.
-    """
-    # Validate user_id if provided
-    if calculation.user_id:
-        user = db.query(User).filter(User.id == calculation.user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User with id {calculation.user_id} not found"
-            )
+    Uses the Factory Pattern to perform the calculation and stores the result
+    with a single INSERT ... RETURNING; an unknown user_id is detected by the
+    foreign key. With WRITE_BEHIND enabled the row is queued for a batched
+    write instead and 202 is returned with the calculation's reserved id.
+    """
+    result = compute_result(calculation.a, calculation.b, calculation.type)
     
-    try:
-        # Use factory pattern to perform calculation
-        result = perform_calculation(calculation.a, calculation.b, calculation.type)
-        
-        # Create calculation record
-        db_calculation = Calculation(
-            a=calculation.a,
-            b=calculation.b,
-            type=calculation.type,
-            result=result,
-            user_id=calculation.user_id
+    writer = get_write_behind()
+    if writer is not None:
+        # Readable once the writer flushes, within WRITE_BEHIND_FLUSH_MS
+        response.status_code = status.HTTP_202_ACCEPTED
+        return submit_calculation(
+            writer, calculation.a, calculation.b, calculation.type, result, calculation.user_id
         )
-        
-        db.add(db_calculation)
+    
+    try:
+        db_calculation = db.execute(insert_calculation(calculation, result)).one()
+        apply_changes(db, added=[db_calculation])
         db.commit()
-        db.refresh(db_calculation)
-        
-        return db_calculation
-        
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+    except IntegrityError as e:
+        db.rollback()
+        if not is_foreign_key_violation(e):
+            raise
+        raise unknown_user(calculation.user_id)
+    calculations_changed([db_calculation])
+    
+    return db_calculation
+
+@app.post("/calculations/batch", response_model=CalculationBatchResult)
+def create_calculations_batch(
+    items: List[Dict[str, Any]] = Body(..., description="List of CalculationCreate items"),
+    db: Session = Depends(get_db)
+):
+    """
+    Create many calculations in a single transaction
+    
+    Each item follows the CalculationCreate schema. Items that fail validation,
+    reference an unknown user or cannot be computed are reported in `errors`
+    by their position in the batch; all other items are stored with one
+    multi-row INSERT ... RETURNING.
+    """
+    valid, errors = validate_batch(items)
+    
+    # Validate every referenced user with a single query
+    user_ids = referenced_user_ids(valid)
+    known_user_ids = set(db.scalars(select_known_users(user_ids))) if user_ids else set()
+    
+    rows = build_batch_rows(valid, known_user_ids, errors)
+    
+    created = []
+    if rows:
+        try:
+            created = db.execute(insert_calculations(), rows).all()
+            apply_changes(db, added=created)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            if not is_foreign_key_violation(e):
+                raise
+            raise referenced_user_deleted()
+        calculations_changed(created)
+    
+    return batch_result(created, errors)
+
+@app.post("/calculations/import", response_model=CalculationImportResult)
+def import_calculations_csv(
+    file: UploadFile = File(..., description="CSV file with a, b and type columns, and optionally user_id and created_at"),
+    db: Session = Depends(get_db)
+):
+    """
+    Import calculations from an uploaded CSV file
+    
+    The file needs a header row with at least the a, b and type columns;
+    other columns (such as id and result in an export) are ignored. It is
+    parsed and stored in chunks, with COPY on PostgreSQL, so files of any
+    size are imported in bounded memory. Lines that fail validation,
+    reference an unknown user or cannot be computed are reported in `errors`
+    by line number; all other lines are stored. A file that becomes
+    unreadable after some chunks were stored returns what was stored, with
+    the error in `failed`; one rejected before anything was stored is a 400.
+    """
+    try:
+        return import_calculations(db, file.file)
+    except ImportFileError as e:
+        raise bad_request(e)
+
+@app.post("/calculations/expression", response_model=ExpressionResult)
+def evaluate_expression(request: ExpressionEvaluate):
+    """
+    Evaluate an arithmetic expression for many variable bindings
+    
+    The expression may use + - * /, parentheses, numbers, variables and any
+    registered operation called as a two-argument function, e.g.
+    `Multiply(x, y) + 2`. It is compiled once (and cached by its text), then
+    run over all bindings with one vectorized call per operation. Bindings
+    whose evaluation fails are reported in `errors` by their index.
+    """
+    return evaluate_bindings(request)
 
 @app.get("/calculations", response_model=List[CalculationRead])
 def list_calculations(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
     user_id: int = None,
-    db: Session = Depends(get_db)
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    """List all calculations, optionally filtered by user_id"""
-    query = db.query(Calculation)
+    """
+    List all calculations, optionally filtered by user_id and creation time
     
+    Calculations are ordered by (created_at, id). When a page is full, the
+    X-Next-Cursor response header holds the cursor for the next page;
+    skip/limit paging is kept for compatibility.
+    
+    Lists filtered by user_id carry an ETag that changes whenever one of the
+    user's calculations is created, updated or deleted; a matching
+    If-None-Match gets 304 Not Modified without running the page query.
+    """
+    headers = {}
     if user_id:
-        query = query.filter(Calculation.user_id == user_id)
+        version = user_collection_version(db, user_id)
+        not_modified = collection_not_modified(request, f"{version}", headers)
+        if not_modified:
+            return not_modified
+    
+    calculations = db.execute(
+        select_calculations(user_id, created_after, created_before, skip, limit, cursor)
+    ).all()
+    return page_response(CALCULATION_COLUMNS, calculations, limit, headers)
+
+@app.get("/calculations/stats", response_model=CalculationStats)
+def get_calculation_stats(
+    group_by: List[StatsGroupBy] = Query([StatsGroupBy.TYPE]),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    source: StatsSource = StatsSource.AUTO,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get count, sum, min, max and average of results over a time window
+    
+    Results are grouped by type and/or user_id (repeat group_by for both).
+    With CALCULATION_ROLLUPS enabled, windows that fall on the hour are read
+    from the precomputed hourly rollups instead of the calculations table;
+    source=live or source=rollup forces one or the other.
+    """
+    fields = stats_fields(group_by)
+    try:
+        source, groups = calculation_stats(db, fields, created_after, created_before, source.value)
+    except ValueError as e:
+        raise bad_request(e)
+    
+    return CalculationStats(source=source, group_by=fields, groups=groups)
+
+@app.get("/calculations/export", response_class=StreamingResponse)
+def export_calculations(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    user_id: int = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Stream calculations as NDJSON or CSV
+    
+    Rows are read from a server-side cursor in fixed-size chunks and written
+    to the response as they arrive, so memory use does not grow with the
+    number of rows exported. Accepts the same filters as GET /calculations.
+    """
+    export_format = ExportFormat(export_format).value
+    result = db.execute(select_export(user_id, created_after, created_before))
+    
+    def stream():
+        yield encode_header(export_format)
+        for rows in result.partitions():
+            yield encode_rows(export_format, rows)
     
-    calculations = query.offset(skip).limit(limit).all()
-    return calculations
+    return export_response(export_format, stream())
 
 @app.get("/calculations/{calculation_id}", response_model=CalculationRead)
-def get_calculation(calculation_id: int, db: Session = Depends(get_db)):
-    """Get a specific calculation by ID"""
-    calculation = db.query(Calculation).filter(Calculation.id == calculation_id).first()
+def get_calculation(
+    calculation_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get a specific calculation by ID
     
-    if not calculation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Calculation not found"
-        )
+    The response carries an ETag derived from the calculation's version. A
+    matching If-None-Match gets 304 Not Modified after reading only the
+    version, or without a query while the version is in the in-memory map.
+    Concurrent requests for the same calculation share one query
+    (app.singleflight).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = calculation_version(db, calculation_id)
+        not_modified = calculation_not_modified(calculation_id, version, if_none_match)
+        if not_modified:
+            return not_modified
     
-    return calculation
+    calculation = coalesced_lookup(
+        request,
+        ("calculation", calculation_id),
+        lambda: db.execute(select_calculation(calculation_id)).first()
+    )
+    return found_calculation(calculation, response)
 
 @app.put("/calculations/{calculation_id}", response_model=CalculationRead)
 def update_calculation(
     calculation_id: int,
     calculation_update: CalculationUpdate,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Update a calculation and recalculate result"""
-    calculation = db.query(Calculation).filter(Calculation.id == calculation_id).first()
+    """
+    Update a calculation and recalculate result
     
-    if not calculation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Calculation not found"
-        )
+    When a, b and type are all provided the row is updated with a single
+    UPDATE ... RETURNING; otherwise the current operands are read first.
+    The calculation's version is incremented and returned in the ETag header.
+    """
+    values = calculation_update.model_dump(exclude_none=True)
     
-    # Update fields if provided
-    if calculation_update.a is not None:
-        calculation.a = calculation_update.a
-    if calculation_update.b is not None:
-        calculation.b = calculation_update.b
-    if calculation_update.type is not None:
-        calculation.type = calculation_update.type
+    current = None
+    if update_needs_current(values, rollups_enabled()):
+        current = db.execute(select_calculation_for_update(calculation_id)).first()
+        values = merge_update(current, values)
     
     try:
         # Recalculate result
-        calculation.result = perform_calculation(calculation.a, calculation.b, calculation.type)
-        
-        db.commit()
-        db.refresh(calculation)
-        
-        return calculation
-        
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+        values["result"] = compute_result(values["a"], values["b"], values["type"])
+    except HTTPException:
+        db.rollback()
+        raise
+    
+    calculation = db.execute(update_calculation_row(calculation_id, values)).first()
+    
+    if not calculation:
+        db.rollback()
+        raise not_found("Calculation not found")
+    
+    apply_changes(db, added=[calculation], removed=[current] if current else ())
+    db.commit()
+    calculations_changed([calculation])
+    
+    response.headers["ETag"] = calculation_etag(calculation.id, calculation.version)
+    return calculation
 
 @app.delete("/calculations/{calculation_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_calculation(calculation_id: int, db: Session = Depends(get_db)):
-    """Delete a calculation"""
-    calculation = db.query(Calculation).filter(Calculation.id == calculation_id).first()
+    """Delete a calculation with a single DELETE ... RETURNING"""
+    deleted = db.execute(delete_calculation_row(calculation_id)).first()
     
-    if not calculation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Calculation not found"
-        )
+    if not deleted:
+        db.rollback()
+        raise not_found("Calculation not found")
     
-    db.delete(calculation)
+    apply_changes(db, removed=[deleted])
     db.commit()
+    calculations_changed([deleted])
     
     return None
 
+if ASYNC_MODE:
+    # Serve the user and calculation routes from async handlers
+    from app.async_routes import use_async_routes
+    use_async_routes(app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,168 @@
+import bisect
+import threading
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+# Default bucket upper bounds in seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket upper bounds"""
+    
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float) -> None:
+        """Record a single observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+    
+    def snapshot(self) -> Dict:
+        """
+        Return the current state of the histogram
+        
+        Returns:
+            Dictionary with cumulative counts per upper bound ("+Inf" last),
+            the total count and the sum of all observations
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "count": count, "sum": total}
+
+# Buckets for the number of database queries made by one request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+class RequestStats:
+    """Database work attributed to the request being served"""
+    
+    __slots__ = ("queries", "query_seconds")
+    
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+# Stats of the current request; copied into the threadpool with the context
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def start_request() -> RequestStats:
+    """Begin attributing database queries to a new request in this context"""
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+def render_histogram(name: str, help_text: str, series: Iterable[Tuple[Dict[str, str], Dict]]) -> str:
+    """
+    Render histogram snapshots in the Prometheus text exposition format
+    
+    Args:
+        name: Metric name
+        help_text: Description for the HELP line
+        series: (labels, Histogram.snapshot()) pairs
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, snapshot in series:
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+    return "\n".join(lines) + "\n"
+
+def render_gauge(name: str, help_text: str, value: float) -> str:
+    """Render a single gauge value in the Prometheus text exposition format"""
+    return f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {value}\n"
+
+def render_counter(name: str, help_text: str, series: Iterable[Tuple[Dict[str, str], float]]) -> str:
+    """Render labelled counter values in the Prometheus text exposition format"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for labels, value in series:
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Format a label set as {name="value",...}"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class RequestMetrics:
+    """Per-route request latency, status and database query metrics"""
+    
+    def __init__(self):
+        self.query_seconds = Histogram()
+        self._request_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self._request_queries: Dict[Tuple[str, str], Histogram] = {}
+        self._responses: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+    
+    def record_query(self, seconds: float) -> None:
+        """Record one database statement and attribute it to the current request"""
+        self.query_seconds.observe(seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += seconds
+    
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        """Record a served request under its route template"""
+        key = (method, route)
+        with self._lock:
+            if key not in self._request_seconds:
+                self._request_seconds[key] = Histogram()
+                self._request_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            status_key = (method, route, str(status))
+            self._responses[status_key] = self._responses.get(status_key, 0) + 1
+        self._request_seconds[key].observe(seconds)
+        self._request_queries[key].observe(stats.queries)
+    
+    def render(self) -> str:
+        """Render all request metrics in the Prometheus text exposition format"""
+        with self._lock:
+            request_seconds = sorted(self._request_seconds.items())
+            request_queries = sorted(self._request_queries.items())
+            responses = sorted(self._responses.items())
+        
+        def labels(key):
+            return {"method": key[0], "route": key[1]}
+        
+        lines = ["# HELP http_requests_total Requests served", "# TYPE http_requests_total counter"]
+        for (method, route, status), count in responses:
+            lines.append(
+                f"http_requests_total{_format_labels({'method': method, 'route': route, 'status': status})} {count}"
+            )
+        return "\n".join(lines) + "\n" + "".join([
+            render_histogram(
+                "http_request_duration_seconds",
+                "Time to serve a request",
+                [(labels(key), histogram.snapshot()) for key, histogram in request_seconds]
+            ),
+            render_histogram(
+                "http_request_db_queries",
+                "Database statements executed per request",
+                [(labels(key), histogram.snapshot()) for key, histogram in request_queries]
+            ),
+            render_histogram(
+                "db_query_duration_seconds",
+                "Time to execute a database statement",
+                [({}, self.query_seconds.snapshot())]
+            ),
+        ])
+
+request_metrics = RequestMetrics()
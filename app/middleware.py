@@ -0,0 +1,216 @@
+import math
+import os
+import time
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.admission import get_admission_controller, request_priority
+from app.metrics import RequestMetrics, request_metrics, start_request
+from app.profiling import PROFILE_HEADER, PROFILE_ID_HEADER, StackSampler, request_profiles, token_matches
+from app.replicas import READ_PRIMARY_COOKIE, READ_YOUR_WRITES_SECONDS, get_replicas
+
+# Add Server-Timing headers with app and database time to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# Route label for requests that did not match any route, to bound label cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+# Methods that do not write, and so do not start a read-your-writes window
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and database usage
+
+    Requests are labelled with their route template (e.g.
+    /calculations/{calculation_id}) rather than the raw path. Database
+    statements executed while serving a request are attributed to it through
+    the engine hooks installed by app.database.instrument_engine.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        metrics: RequestMetrics = request_metrics,
+        server_timing: bool = SERVER_TIMING_ENABLED
+    ):
+        """
+        Args:
+            app: Application to wrap
+            metrics: Registry the requests are recorded in
+            server_timing: Whether to add a Server-Timing response header
+        """
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = start_request()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        f'app;dur={elapsed:.3f}, '
+                        f'db;dur={stats.query_seconds * 1000:.3f};desc="{stats.queries} queries"'
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.metrics.record_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status_code,
+                time.perf_counter() - start,
+                stats
+            )
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware keeping a client's reads on the primary after it writes
+
+    Successful responses to writes set a cookie holding the end of the
+    read-your-writes window; app.replicas.get_read_db serves the client from
+    the primary until then, so it never reads from a replica that has not
+    caught up with its own write. Does nothing unless read replicas are
+    configured.
+    """
+
+    def __init__(self, app: ASGIApp, window: Optional[float] = None):
+        """
+        Args:
+            app: Application to wrap
+            window: Seconds reads stay on the primary after a write
+                (default READ_YOUR_WRITES_SECONDS)
+        """
+        self.app = app
+        self.window = READ_YOUR_WRITES_SECONDS if window is None else window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or self.window <= 0
+            or get_replicas() is None
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_PRIMARY_COOKIE}={until:.3f}; Max-Age={math.ceil(self.window)}; "
+                    f"Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests through the admission controller
+
+    Requests are classified by app.admission.request_priority. Requests the
+    controller rejects get 503 with Retry-After without reaching the route,
+    so an overloaded database sheds bulk writes first and never builds an
+    unbounded backlog in the threadpool or the connection pool. Does nothing
+    unless ADMISSION_CONTROL is enabled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = get_admission_controller()
+        if scope["type"] != "http" or controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        priority = request_priority(scope["method"], scope["path"])
+        admitted_at = await controller.acquire(priority)
+        if admitted_at is None:
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(controller.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            controller.release(priority, admitted_at, status_code)
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests that carry the X-Profile header
+
+    When the header holds the profiling token, every thread is sampled while
+    the request is served (including other requests' work in the same
+    process) and the collapsed stacks are kept under the id returned in the
+    X-Profile-Id response header, for GET /debug/profile/requests/{id}.
+    Only installed when PROFILING_TOKEN is set.
+    """
+
+    def __init__(self, app: ASGIApp, interval: float = 0.001):
+        """
+        Args:
+            app: Application to wrap
+            interval: Seconds between stack samples
+        """
+        self.app = app
+        self.interval = interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = next(
+            (value.decode("latin-1") for name, value in scope["headers"] if name == PROFILE_HEADER.encode()),
+            None
+        )
+        if not token_matches(token):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(self.interval).start()
+        profile_id = request_profiles.add("")
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_profiles.set(profile_id, sampler.stop())
@@ -0,0 +1,99 @@
+import contextlib
+import logging
+import os
+import time
+from typing import Iterator, Optional
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool
+
+from app.database import Base, engine as app_engine
+from app.partitioning import get_partition_maintainer
+import app.models  # noqa: F401  (registers the models on Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_ID = 0x63616c63  # "calc"
+
+# Alembic configuration, relative to the project root
+ALEMBIC_CONFIG = os.getenv("ALEMBIC_CONFIG", "alembic.ini")
+
+@contextlib.contextmanager
+def migration_lock(engine: Engine) -> Iterator[Connection]:
+    """
+    Open a connection holding the migration lock
+
+    On PostgreSQL a session-level advisory lock makes concurrent migrate
+    steps (e.g. several containers starting at once) wait for each other.
+    Other databases rely on a single process running the step.
+    """
+    with engine.connect() as connection:
+        locked = connection.dialect.name == "postgresql"
+        if locked:
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+        try:
+            yield connection
+        finally:
+            if locked:
+                connection.rollback()
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                connection.commit()
+
+def migrate(engine: Optional[Engine] = None, config_path: str = ALEMBIC_CONFIG) -> str:
+    """
+    Bring the database schema up to date, once, under the migration lock
+
+    A new database is created from the models and stamped with the latest
+    revision; an existing one is upgraded with Alembic. With
+    CALCULATION_PARTITIONING enabled the calculations partitions are then
+    maintained (see app.partitioning), converting the table on first run.
+
+    Args:
+        engine: Engine to migrate; defaults to a pool-less engine on the
+            application's database, so no connections outlive the step
+            (the server forks its workers afterwards)
+        config_path: Path of alembic.ini
+
+    Returns:
+        "created" or "upgraded"
+    """
+    owned = engine is None
+    if owned:
+        engine = create_engine(app_engine.url, poolclass=NullPool)
+
+    config = Config(config_path)
+    config.attributes["configure_logger"] = False
+    try:
+        with migration_lock(engine) as connection:
+            config.attributes["connection"] = connection
+            if not inspect(connection).has_table("calculations"):
+                Base.metadata.create_all(connection)
+                connection.commit()
+                command.stamp(config, "head")
+                outcome = "created"
+            else:
+                command.upgrade(config, "head")
+                outcome = "upgraded"
+            connection.commit()
+
+            maintainer = get_partition_maintainer()
+            if maintainer is not None:
+                maintainer.maintain(connection, convert=True)
+                connection.commit()
+            return outcome
+    finally:
+        if owned:
+            engine.dispose()
+
+if __name__ == "__main__":
+    # Create or upgrade the schema before starting the server:
+    #   python -m app.migrate
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    outcome = migrate()
+    logger.info("Database %s in %.2fs", outcome, time.perf_counter() - start)
@@ -1,8 +1,28 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql.functions import FunctionElement
 from app.database import Base
 
+class utcnow(FunctionElement):
+    """Current UTC time evaluated by the database, used as a server-side default"""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+@compiles(utcnow, "postgresql")
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+@compiles(utcnow, "sqlite")
+def _utcnow_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP only has second precision in SQLite; pad milliseconds
+    # to the microsecond format SQLAlchemy uses so stored values compare correctly
+    return "(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW') || '000')"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -10,10 +30,17 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    # Incremented by every write to the user's calculations, used for list ETags
+    calculations_version = Column(Integer, nullable=False, server_default="0")
     
     # Relationship with calculations
     calculations = relationship("Calculation", back_populates="owner")
+    
+    # Supports keyset pagination ordered by (created_at, id)
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 
 class Calculation(Base):
     __tablename__ = "calculations"
@@ -23,8 +50,45 @@ class Calculation(Base):
     b = Column(Float, nullable=False)
     type = Column(String, nullable=False)  # Add, Subtract, Multiply, Divide
     result = Column(Float, nullable=True)  # Store computed result
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    version = Column(Integer, nullable=False, server_default="1")  # Incremented on every update, used for ETags
     
     # Relationship with user
     owner = relationship("User", back_populates="calculations")
+    
+    # Index strategy:
+    # - (created_at, id) supports keyset pagination over all calculations
+    # - (user_id, created_at, id) supports per-user listing and the user_id foreign key
+    # - (type, created_at) supports filtering and grouping by operation type over time
+    # AUTOINCREMENT gives SQLite a sequence that write-behind ids are reserved from
+    __table_args__ = (
+        Index("ix_calculations_created_at_id", "created_at", "id"),
+        Index("ix_calculations_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_calculations_type_created_at", "type", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+class CalculationRollup(Base):
+    """Hourly aggregates of calculation results, maintained on every write"""
+    __tablename__ = "calculation_rollups"
+
+    bucket_start = Column(DateTime, primary_key=True)  # Start of the hour
+    type = Column(String, primary_key=True)
+    user_key = Column(Integer, primary_key=True)  # user_id, or 0 for no user
+    result_count = Column(Integer, nullable=False)
+    result_sum = Column(Float, nullable=False)
+    result_min = Column(Float, nullable=True)
+    result_max = Column(Float, nullable=True)
+
+# Columns returned by INSERT/UPDATE ... RETURNING on the write paths
+USER_COLUMNS = (User.id, User.username, User.email, User.created_at)
+CALCULATION_COLUMNS = (
+    Calculation.id,
+    Calculation.a,
+    Calculation.b,
+    Calculation.type,
+    Calculation.result,
+    Calculation.created_at,
+    Calculation.user_id,
+)
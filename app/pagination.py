@@ -0,0 +1,78 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode the (created_at, id) position of a row as an opaque cursor"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def keyset_order(model) -> tuple:
+    """Return the stable ordering used for paging over a model"""
+    return (model.created_at, model.id)
+
+def keyset_after(model, cursor: str):
+    """
+    Build a filter selecting the rows that come after the cursor position
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    created_at, row_id = decode_cursor(cursor)
+    return tuple_(model.created_at, model.id) > tuple_(created_at, row_id)
+
+def paginate(query, model, skip: int, limit: int, cursor: Optional[str]):
+    """
+    Apply stable ordering plus cursor or skip/limit paging to a query
+    
+    Works with both ORM Query objects and select() statements.
+    
+    Raises:
+        HTTPException: If the cursor is malformed or combined with skip
+    """
+    if cursor is not None:
+        if skip:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Use either cursor or skip, not both"
+            )
+        try:
+            query = query.filter(keyset_after(model, cursor))
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    query = query.order_by(*keyset_order(model))
+    if skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+def next_cursor(rows: Sequence, limit: int) -> Optional[str]:
+    """Return the cursor for the page after rows, or None if this was the last page"""
+    if limit <= 0 or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,416 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database import engine as app_engine
+from app.models import Calculation, CalculationRollup
+
+logger = logging.getLogger(__name__)
+
+TABLE = Calculation.__tablename__
+PARTITION_KEY = "created_at"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Name of the table the rows are copied from while converting
+UNPARTITIONED_TABLE = f"{TABLE}_unpartitioned"
+
+# Key of the PostgreSQL advisory lock held while maintaining partitions
+PARTITION_LOCK_ID = 0x70617274  # "part"
+
+RETENTION_ACTIONS = ("drop", "detach")
+
+_PARTITION_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+def month_start(timestamp: datetime) -> datetime:
+    """Return the first instant of the month containing timestamp"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def add_months(month: datetime, months: int) -> datetime:
+    """Return the start of the month months after (or before) month"""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(month: datetime) -> str:
+    """Return the name of the partition holding a month, e.g. calculations_y2026m10"""
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+def partition_month(name: str) -> Optional[datetime]:
+    """Return the month a partition holds, or None if the name is not a monthly partition"""
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+def missing_partitions(existing: Sequence[str], first: datetime, last: datetime) -> List[datetime]:
+    """Return the months from first to last (inclusive) that have no partition yet"""
+    months = []
+    month = month_start(first)
+    while month <= last:
+        if partition_name(month) not in existing:
+            months.append(month)
+        month = add_months(month, 1)
+    return months
+
+def expired_partitions(existing: Sequence[str], cutoff: datetime) -> List[str]:
+    """Return the monthly partitions whose rows are all older than cutoff, oldest first"""
+    expired = [
+        (month, name) for name in existing
+        if (month := partition_month(name)) is not None and add_months(month, 1) <= cutoff
+    ]
+    return [name for _, name in sorted(expired)]
+
+def is_partitioned(connection: Connection) -> bool:
+    """Check whether the calculations table is a partitioned table"""
+    kind = connection.scalar(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": TABLE}
+    )
+    return kind == "p"
+
+def list_partitions(connection: Connection) -> List[str]:
+    """Return the names of the partitions attached to the calculations table"""
+    return list(connection.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": TABLE}
+    ))
+
+def create_partition(connection: Connection, month: datetime) -> str:
+    """
+    Create and attach the partition for a month
+
+    Rows of the month that landed in the default partition are moved into
+    the new partition first, since the default partition may not overlap
+    an attached one. Indexes and the foreign key are added by ATTACH.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(sep=" "), add_months(month, 1).isoformat(sep=" ")
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE {PARTITION_KEY} >= :start AND {PARTITION_KEY} < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": month, "end": add_months(month, 1)}
+    )
+    connection.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    return name
+
+def convert_to_partitioned(connection: Connection, now: datetime, months_ahead: int) -> int:
+    """
+    Replace the calculations table with a partitioned table holding the same rows
+
+    The existing table is renamed, a parent with the same columns and
+    defaults is created with PRIMARY KEY (id, created_at) (a partitioned
+    table's unique keys must include the partition key), one partition is
+    created per month from the oldest row up to months_ahead months from
+    now, and the rows are copied over. The id sequence is kept, so ids
+    continue where they were. This rewrites the table once and blocks
+    writes while it runs.
+
+    Returns:
+        Number of rows copied
+    """
+    old_indexes = connection.scalars(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname <> :pkey"),
+        {"table": TABLE, "pkey": f"{TABLE}_pkey"}
+    ).all()
+    for index in old_indexes:
+        connection.execute(text(f"DROP INDEX {index}"))
+    connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED_TABLE}"))
+    connection.execute(text(f"ALTER TABLE {UNPARTITIONED_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {UNPARTITIONED_TABLE}_pkey"))
+    # Rows without a timestamp cannot be routed to a partition
+    connection.execute(text(
+        f"UPDATE {UNPARTITIONED_TABLE} SET {PARTITION_KEY} = TIMEZONE('utc', CURRENT_TIMESTAMP) "
+        f"WHERE {PARTITION_KEY} IS NULL"
+    ))
+
+    connection.execute(text(
+        f"CREATE TABLE {TABLE} (LIKE {UNPARTITIONED_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE ({PARTITION_KEY})"
+    ))
+    connection.execute(text(
+        f"ALTER TABLE {TABLE} ALTER COLUMN {PARTITION_KEY} SET NOT NULL, "
+        f"ADD PRIMARY KEY (id, {PARTITION_KEY})"
+    ))
+    for constraint in Calculation.__table__.foreign_key_constraints:
+        columns = ", ".join(column.name for column in constraint.columns)
+        referred = ", ".join(element.column.name for element in constraint.elements)
+        connection.execute(text(
+            f"ALTER TABLE {TABLE} ADD FOREIGN KEY ({columns}) "
+            f"REFERENCES {constraint.referred_table.name} ({referred})"
+        ))
+    for index in Calculation.__table__.indexes:
+        index.create(connection)
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+    oldest = connection.scalar(text(f"SELECT min({PARTITION_KEY}) FROM {UNPARTITIONED_TABLE}"))
+    last = add_months(month_start(now), months_ahead)
+    for month in missing_partitions([], min(oldest or now, now), last):
+        create_partition(connection, month)
+
+    copied = connection.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {UNPARTITIONED_TABLE}")).rowcount
+    # Move the sequence to the new table before the old one (its owner) is dropped
+    sequence = connection.scalar(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": UNPARTITIONED_TABLE}
+    )
+    connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    connection.execute(text(f"DROP TABLE {UNPARTITIONED_TABLE}"))
+    return copied
+
+def default_partition_months(connection: Connection) -> List[datetime]:
+    """Return the months of the rows in the default partition, oldest first"""
+    return list(connection.scalars(text(
+        f"SELECT DISTINCT date_trunc('month', {PARTITION_KEY}) FROM {DEFAULT_PARTITION} ORDER BY 1"
+    )))
+
+def archive_partition(connection: Connection, name: str, archive_dir: str) -> Optional[Path]:
+    """
+    Export a detached partition to {archive_dir}/{name}.csv with COPY TO
+
+    Returns:
+        The written file, or None if the driver cannot stream COPY output
+    """
+    if connection.dialect.driver != "psycopg2":
+        return None
+    path = Path(archive_dir) / f"{name}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cursor = connection.connection.cursor()
+    try:
+        with path.open("w", newline="") as file:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", file)
+    finally:
+        cursor.close()
+    return path
+
+class PartitionMaintainer:
+    """
+    Keeps the calculations table partitioned by month on PostgreSQL
+
+    The table becomes a parent partitioned by RANGE (created_at), with one
+    partition per month and a default partition for rows outside every
+    month. The ORM keeps mapping the parent; PostgreSQL routes inserts to
+    the partition of their month and prunes partitions from created_at
+    range scans.
+
+    Each run creates the partitions for the current month and months_ahead
+    months after it, gives the rows that landed in the default partition
+    (e.g. imported with an old created_at) a partition of their own month,
+    and detaches the partitions older than retention_months. Detaching and
+    dropping a partition removes a month of rows without a DELETE, whatever
+    its size. Converting the table is left to the migrate step and the
+    command line (convert=True), since it rewrites the table and blocks
+    writes; the background thread only maintains an already partitioned
+    table. Does nothing on databases other than PostgreSQL.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        months_ahead: int = 3,
+        retention_months: Optional[int] = None,
+        retention_action: str = "drop",
+        archive_dir: Optional[str] = None,
+        interval: float = 3600
+    ):
+        """
+        Args:
+            engine: Sync engine of the primary database
+            months_ahead: Months after the current one that always have a partition
+            retention_months: Full months kept before the current one, or
+                None to keep every partition
+            retention_action: "drop" expired partitions, or "detach" them
+                and keep them as standalone tables
+            archive_dir: Export expired partitions to CSV files here before
+                dropping them
+            interval: Seconds between maintenance runs of the background thread
+        """
+        if retention_action not in RETENTION_ACTIONS:
+            raise ValueError(
+                f"Unknown retention action: {retention_action}. "
+                f"Available actions: {', '.join(RETENTION_ACTIONS)}"
+            )
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.retention_action = retention_action
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, engine: Engine) -> Optional["PartitionMaintainer"]:
+        """
+        Create a maintainer configured from the environment
+
+        Environment variables:
+            CALCULATION_PARTITIONING: Partition calculations by month on PostgreSQL (default false)
+            CALCULATION_PARTITIONS_AHEAD: Months created ahead of the current one (default 3)
+            CALCULATION_RETENTION_MONTHS: Full months kept before the current one (default: keep all)
+            CALCULATION_RETENTION_ACTION: "drop" (default) or "detach" expired partitions
+            CALCULATION_ARCHIVE_DIR: Export expired partitions as CSV files to this directory
+            CALCULATION_PARTITION_MAINTENANCE_SECONDS: Seconds between runs (default 3600)
+
+        Returns:
+            The configured maintainer, or None when partitioning is disabled
+        """
+        if os.getenv("CALCULATION_PARTITIONING", "false").strip().lower() not in ("1", "true", "yes", "on"):
+            return None
+        retention_months = os.getenv("CALCULATION_RETENTION_MONTHS", "").strip()
+        return cls(
+            engine,
+            months_ahead=int(os.getenv("CALCULATION_PARTITIONS_AHEAD", "3")),
+            retention_months=int(retention_months) if retention_months else None,
+            retention_action=os.getenv("CALCULATION_RETENTION_ACTION", "drop").strip().lower(),
+            archive_dir=os.getenv("CALCULATION_ARCHIVE_DIR") or None,
+            interval=float(os.getenv("CALCULATION_PARTITION_MAINTENANCE_SECONDS", "3600")),
+        )
+
+    def retention_cutoff(self, now: datetime) -> Optional[datetime]:
+        """Return the time before which partitions expire, or None without a retention policy"""
+        if self.retention_months is None:
+            return None
+        return add_months(month_start(now), -self.retention_months)
+
+    def maintain(
+        self,
+        connection: Connection,
+        now: Optional[datetime] = None,
+        convert: bool = False
+    ) -> Dict[str, List[str]]:
+        """
+        Run one maintenance pass in the connection's transaction
+
+        Skips the pass when another process holds the partition lock, or
+        when the table is not partitioned yet and convert is not set. The
+        caller commits.
+
+        Args:
+            connection: Connection to the primary database
+            now: Current time, defaulting to the current UTC time
+            convert: Convert the table to a partitioned table if it is not one
+
+        Returns:
+            Names of the partitions created and expired
+        """
+        outcome = {"created": [], "expired": []}
+        if connection.dialect.name != "postgresql":
+            return outcome
+        if not connection.scalar(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID}):
+            return outcome
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+
+        if not is_partitioned(connection):
+            if not convert:
+                logger.warning(
+                    "%s is not partitioned; convert it with python -m app.migrate or python -m app.partitioning",
+                    TABLE
+                )
+                return outcome
+            copied = convert_to_partitioned(connection, now, self.months_ahead)
+            logger.info("Converted %s to a partitioned table (%d rows)", TABLE, copied)
+
+        existing = list_partitions(connection)
+        last = add_months(month_start(now), self.months_ahead)
+        for month in missing_partitions(existing, now, last):
+            outcome["created"].append(create_partition(connection, month))
+        # The default partition only catches inserts until the next pass, so
+        # that expiring its rows never takes a DELETE
+        for month in default_partition_months(connection):
+            outcome["created"].append(create_partition(connection, month))
+
+        cutoff = self.retention_cutoff(now)
+        if cutoff is not None:
+            for name in expired_partitions(existing + outcome["created"], cutoff):
+                self._expire(connection, name)
+                outcome["expired"].append(name)
+            connection.execute(delete(CalculationRollup).where(CalculationRollup.bucket_start < cutoff))
+        return outcome
+
+    def _expire(self, connection: Connection, name: str) -> None:
+        """Detach an expired partition, then archive and drop it as configured"""
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if self.archive_dir:
+            path = archive_partition(connection, name, self.archive_dir)
+            if path is None:
+                logger.warning("Cannot export %s with the %s driver; keeping it detached", name, connection.dialect.driver)
+                return
+            logger.info("Exported %s to %s", name, path)
+        if self.retention_action == "drop":
+            connection.execute(text(f"DROP TABLE {name}"))
+
+    def run_once(self, convert: bool = False) -> Dict[str, List[str]]:
+        """Run one maintenance pass in its own transaction"""
+        with self.engine.connect() as connection:
+            outcome = self.maintain(connection, convert=convert)
+            connection.commit()
+        if outcome["created"] or outcome["expired"]:
+            logger.info("Partitions created: %s; expired: %s", outcome["created"], outcome["expired"])
+        return outcome
+
+    def _run(self) -> None:
+        """Maintenance loop: run a pass, then wait interval seconds, until stopped"""
+        while True:
+            try:
+                self.run_once()
+            except (SQLAlchemyError, OSError):
+                logger.exception("Partition maintenance failed")
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self) -> None:
+        """Start the maintenance thread"""
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+                self._thread.start()
+
+    def shutdown(self) -> None:
+        """Stop the maintenance thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+# Optional maintainer of the calculations partitions
+_maintainer: Optional[PartitionMaintainer] = PartitionMaintainer.from_env(app_engine)
+
+def set_partition_maintainer(maintainer: Optional[PartitionMaintainer]) -> None:
+    """Install the partition maintainer, or None to leave the calculations table unpartitioned"""
+    global _maintainer
+    _maintainer = maintainer
+
+def get_partition_maintainer() -> Optional[PartitionMaintainer]:
+    """Return the partition maintainer, if partitioning is enabled"""
+    return _maintainer
+
+if __name__ == "__main__":
+    # Run one maintenance pass, converting the table on first run, e.g. from cron:
+    #   CALCULATION_PARTITIONING=true python -m app.partitioning
+    logging.basicConfig(level=logging.INFO)
+    maintainer = get_partition_maintainer()
+    if maintainer is None:
+        logger.info("CALCULATION_PARTITIONING is disabled")
+    else:
+        start = time.perf_counter()
+        outcome = maintainer.run_once(convert=True)
+        logger.info("Partitions maintained in %.2fs: %s", time.perf_counter() - start, outcome)
@@ -0,0 +1,252 @@
+import asyncio
+import functools
+import os
+import secrets
+import sys
+import threading
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+# Bearer token for the profiling endpoints and the X-Profile header; unset
+# (the default) leaves profiling out of the app entirely
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+
+# Header carrying the token to profile a single request
+PROFILE_HEADER = "x-profile"
+# Response header with the id of the request's profile
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+MAX_CPU_PROFILE_SECONDS = 60
+# Request profiles and tracemalloc snapshots kept in memory
+PROFILE_HISTORY = 20
+
+# Leaf functions of threads that are waiting rather than running
+IDLE_FUNCTIONS = frozenset(("wait", "select", "poll", "accept", "_wait_for_tstate_lock"))
+
+# Leaf (module file, function) pairs of threads blocked in C code, where the
+# function name alone would also match running code. An idle executor
+# worker (e.g. the password hash pool) waits in SimpleQueue.get, which has
+# no Python frame, so its leaf frame is _worker itself.
+IDLE_FRAMES = frozenset((
+    (os.path.join("concurrent", "futures", "thread.py"), "_worker"),
+))
+
+def is_idle(frame) -> bool:
+    """Return whether a thread's leaf frame is waiting rather than running"""
+    code = frame.f_code
+    if code.co_name in IDLE_FUNCTIONS:
+        return True
+    return any(
+        code.co_name == function and code.co_filename.endswith(os.sep + module)
+        for module, function in IDLE_FRAMES
+    )
+
+def profiling_enabled() -> bool:
+    """Return whether the profiling endpoints and middleware are installed"""
+    return bool(PROFILING_TOKEN)
+
+def token_matches(token: Optional[str]) -> bool:
+    """Compare a presented token with PROFILING_TOKEN in constant time"""
+    return bool(PROFILING_TOKEN) and token is not None and secrets.compare_digest(token, PROFILING_TOKEN)
+
+def require_profiling_token(request: Request) -> None:
+    """Dependency rejecting requests without the profiling bearer token"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token_matches(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Profiling token required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+@functools.lru_cache(maxsize=4096)
+def _short_filename(filename: str) -> str:
+    """Strip the longest sys.path entry from a source path"""
+    prefixes = [path for path in sys.path if path and filename.startswith(path.rstrip(os.sep) + os.sep)]
+    if not prefixes:
+        return filename
+    return filename[len(max(prefixes, key=len).rstrip(os.sep)) + 1:]
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """Format a thread's stack as one collapsed line, root first: thread;func (file);..."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_short_filename(code.co_filename)})".replace(";", ":"))
+        frame = frame.f_back
+    names.append(thread_name.replace(";", ":"))
+    return ";".join(reversed(names))
+
+class StackSampler:
+    """
+    Sampling CPU profiler over every thread of the process
+
+    A background thread records the stack of each other thread every
+    interval seconds. Threads waiting in IDLE_FUNCTIONS or IDLE_FRAMES are
+    skipped unless include_idle is set. The result is in the collapsed-stack
+    format read by flamegraph.pl and speedscope: one "frame;frame;frame
+    count" line per distinct stack.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self, exclude: int) -> None:
+        """Record the current stack of every thread except exclude"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            if not self.include_idle and is_idle(frame):
+                continue
+            self.counts[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        """Sampling loop: sample, then wait interval seconds, until stopped"""
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own)
+
+    def start(self) -> "StackSampler":
+        """Start sampling in a background thread"""
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        """Return the stacks sampled so far in collapsed-stack format"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+class ProfileStore:
+    """The most recent PROFILE_HISTORY entries by id"""
+
+    def __init__(self, size: int = PROFILE_HISTORY):
+        self.size = size
+        self._entries: "OrderedDict[str, object]" = OrderedDict()
+
+    def add(self, entry) -> str:
+        key = uuid.uuid4().hex[:12]
+        self._entries[key] = entry
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return key
+
+    def set(self, key: str, entry) -> None:
+        """Replace an entry, unless it has already been evicted"""
+        if key in self._entries:
+            self._entries[key] = entry
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Profile {key} not found")
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+request_profiles = ProfileStore()
+memory_snapshots = ProfileStore()
+_cpu_profile_lock = asyncio.Lock()
+
+router = APIRouter(prefix="/debug/profile", tags=["profiling"], dependencies=[Depends(require_profiling_token)])
+
+@router.post("/cpu", response_class=PlainTextResponse)
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=MAX_CPU_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    idle: bool = Query(False, description="Include threads waiting on locks, sockets or queues")
+):
+    """
+    Sample every thread's stack for a number of seconds
+
+    Returns collapsed stacks (one "frame;frame;frame count" line per stack)
+    for flamegraph.pl or speedscope. One CPU profile runs at a time.
+    """
+    if _cpu_profile_lock.locked():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A CPU profile is already running")
+    async with _cpu_profile_lock:
+        sampler = StackSampler(interval_ms / 1000, include_idle=idle).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            collapsed = sampler.stop()
+    return PlainTextResponse(collapsed, headers={"X-Profile-Samples": str(sampler.samples)})
+
+@router.get("/requests/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str):
+    """Collapsed stacks sampled while a request sent with the X-Profile header was served"""
+    return PlainTextResponse(request_profiles.get(profile_id))
+
+def _snapshot_summary(snapshot_id: str) -> Dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {"id": snapshot_id, "traced_bytes": current, "peak_traced_bytes": peak}
+
+@router.post("/memory/snapshots")
+async def take_memory_snapshot(frames: int = Query(1, ge=1, le=50)):
+    """
+    Take a tracemalloc snapshot, starting tracing on first use
+
+    Only allocations made after tracing started are traced; take a baseline
+    snapshot, let the worker run, then diff a second snapshot against it.
+    Tracing slows allocations down until DELETE /debug/profile/memory.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    snapshot = await run_in_threadpool(tracemalloc.take_snapshot)
+    return _snapshot_summary(memory_snapshots.add(snapshot))
+
+@router.get("/memory/diff")
+async def diff_memory_snapshots(
+    base: str,
+    target: Optional[str] = Query(None, description="Snapshot to compare; a new one when omitted"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=1000)
+):
+    """Allocation sites that grew the most between two tracemalloc snapshots"""
+    base_snapshot = memory_snapshots.get(base)
+    if target is not None:
+        target_snapshot = memory_snapshots.get(target)
+    elif tracemalloc.is_tracing():
+        target_snapshot = await run_in_threadpool(tracemalloc.take_snapshot)
+    else:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Memory tracing is not running")
+
+    def compare():
+        return target_snapshot.compare_to(base_snapshot, group_by)[:limit]
+
+    return [
+        {
+            "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        }
+        for stat in await run_in_threadpool(compare)
+    ]
+
+@router.delete("/memory", status_code=status.HTTP_204_NO_CONTENT)
+async def stop_memory_tracing():
+    """Stop tracemalloc and discard the snapshots"""
+    tracemalloc.stop()
+    memory_snapshots.clear()
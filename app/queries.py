@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from app.models import Calculation
+
+def filter_calculations(
+    query,
+    user_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
+    """
+    Apply the common calculation filters to a query
+    
+    Works with both ORM Query objects and select() statements.
+    
+    Args:
+        query: Query over the calculations table
+        user_id: Only include calculations owned by this user
+        created_after: Only include calculations created at or after this time
+        created_before: Only include calculations created before this time
+    """
+    if user_id:
+        query = query.filter(Calculation.user_id == user_id)
+    if created_after is not None:
+        query = query.filter(Calculation.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(Calculation.created_at < created_before)
+    return query
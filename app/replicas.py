@@ -0,0 +1,258 @@
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import ASYNC_MODE, engine_options, get_async_db, get_db, instrument_engine, pool_stats
+
+# Cookie set on responses to writes; holds the time (seconds since the epoch)
+# until which the client's reads are served by the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Seconds after a write during which the writing client reads from the primary
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+BALANCING_STRATEGIES = ("round_robin", "least_connections")
+
+class Replica:
+    """A read replica, its session factory and its health"""
+
+    def __init__(self, name: str, engine, session_factory: Callable):
+        """
+        Args:
+            name: Replica URL without the password, for statistics
+            engine: Engine (sync or async) connected to the replica
+            session_factory: Creates sessions bound to the engine
+        """
+        self.name = name
+        self.engine = engine
+        self.session_factory = session_factory
+        self.in_use = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+class ReplicaSet:
+    """
+    Balances read-only sessions over a set of read replicas
+
+    A replica whose connection fails is ejected for eject_seconds, after
+    which it is tried again. When every replica is ejected reads fall back
+    to the primary.
+    """
+
+    def __init__(
+        self,
+        replicas: Sequence[Replica],
+        balancing: str = "round_robin",
+        eject_seconds: float = 30,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            replicas: Replicas to balance over
+            balancing: "round_robin" or "least_connections" (fewest sessions in use)
+            eject_seconds: How long a failed replica is skipped
+            clock: Monotonic time source, replaceable in tests
+        """
+        if balancing not in BALANCING_STRATEGIES:
+            raise ValueError(
+                f"Unknown read balancing strategy: {balancing}. "
+                f"Available strategies: {', '.join(BALANCING_STRATEGIES)}"
+            )
+        self.replicas = list(replicas)
+        self.balancing = balancing
+        self.eject_seconds = eject_seconds
+        self._clock = clock
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls: Sequence[str], use_async: bool = False, **kwargs) -> "ReplicaSet":
+        """Create engines for replica URLs, pooled and instrumented like the primary's"""
+        replicas = []
+        for url in map(make_url, urls):
+            if use_async:
+                engine = create_async_engine(url, **engine_options(url, use_async=True))
+                instrument_engine(engine.sync_engine)
+                session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+            else:
+                engine = create_engine(url, **engine_options(url))
+                instrument_engine(engine)
+                session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            replicas.append(Replica(url.render_as_string(hide_password=True), engine, session_factory))
+        return cls(replicas, **kwargs)
+
+    @classmethod
+    def from_env(cls) -> Optional["ReplicaSet"]:
+        """
+        Build the replica set from the environment
+
+        Environment variables:
+            DATABASE_READ_URLS: Comma-separated replica URLs; unset or empty
+                sends every read to the primary. Use the same driver as
+                DATABASE_URL (e.g. postgresql+asyncpg:// in async mode)
+            READ_BALANCING: "round_robin" (default) or "least_connections"
+            READ_REPLICA_EJECT_SECONDS: Seconds a failed replica is skipped (default 30)
+
+        Returns:
+            The replica set, or None if no replicas are configured
+        """
+        urls = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+        if not urls:
+            return None
+        return cls.from_urls(
+            urls,
+            use_async=ASYNC_MODE,
+            balancing=os.getenv("READ_BALANCING", "round_robin").strip().lower(),
+            eject_seconds=float(os.getenv("READ_REPLICA_EJECT_SECONDS", "30")),
+        )
+
+    def acquire(self, exclude: Sequence[Replica] = ()) -> Optional[Replica]:
+        """Pick a healthy replica and count a session against it, or return None if none is healthy"""
+        now = self._clock()
+        with self._lock:
+            healthy = [
+                replica for replica in self.replicas
+                if replica.ejected_until <= now and replica not in exclude
+            ]
+            if not healthy:
+                return None
+            if self.balancing == "least_connections":
+                replica = min(healthy, key=lambda candidate: candidate.in_use)
+            else:
+                replica = healthy[next(self._counter) % len(healthy)]
+            replica.in_use += 1
+            return replica
+
+    def release(self, replica: Replica) -> None:
+        """Stop counting a session against a replica"""
+        with self._lock:
+            replica.in_use -= 1
+
+    def eject(self, replica: Replica) -> None:
+        """Skip a replica whose connection failed for eject_seconds"""
+        with self._lock:
+            replica.failures += 1
+            replica.ejected_until = self._clock() + self.eject_seconds
+
+    def stats(self) -> List[Dict]:
+        """Return the balancing and pool statistics of every replica"""
+        now = self._clock()
+        with self._lock:
+            states = [
+                (replica, replica.in_use, replica.failures, replica.ejected_until > now)
+                for replica in self.replicas
+            ]
+        return [
+            {
+                "replica": replica.name,
+                "in_use": in_use,
+                "failures": failures,
+                "ejected": ejected,
+                **pool_stats(replica.engine.pool),
+            }
+            for replica, in_use, failures, ejected in states
+        ]
+
+# Read replicas used by the GET routes, if configured
+_replicas: Optional[ReplicaSet] = ReplicaSet.from_env()
+
+def set_replicas(replicas: Optional[ReplicaSet]) -> None:
+    """Install the read replicas, or None to serve every read from the primary"""
+    global _replicas
+    _replicas = replicas
+
+def get_replicas() -> Optional[ReplicaSet]:
+    """Return the read replicas, if any"""
+    return _replicas
+
+def reads_from_primary(request: Request) -> bool:
+    """Check whether the client wrote recently enough that it must read its own writes"""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, "")) > time.time()
+    except ValueError:
+        return False
+
+def get_read_db(request: Request, db: Session = Depends(get_db)):
+    """
+    Dependency to get a session for read-only routes
+
+    Returns a replica session when DATABASE_READ_URLS is set, otherwise (or
+    while the client is within its read-your-writes window, or when every
+    replica is ejected) the primary session from get_db. A replica that
+    cannot be connected to is ejected and the next one tried; one that
+    fails mid-request is ejected for later requests.
+    """
+    replicas = _replicas
+    if replicas is None or reads_from_primary(request):
+        yield db
+        return
+
+    tried = []
+    while True:
+        replica = replicas.acquire(exclude=tried)
+        if replica is None:
+            yield db
+            return
+        session = replica.session_factory()
+        try:
+            session.connection()
+        except DBAPIError:
+            session.close()
+            replicas.release(replica)
+            replicas.eject(replica)
+            tried.append(replica)
+            continue
+
+        try:
+            yield session
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                replicas.eject(replica)
+            raise
+        finally:
+            session.close()
+            replicas.release(replica)
+        return
+
+async def get_async_read_db(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Async version of get_read_db, for the routes in app.async_routes"""
+    replicas = _replicas
+    if replicas is None or reads_from_primary(request):
+        yield db
+        return
+
+    tried = []
+    while True:
+        replica = replicas.acquire(exclude=tried)
+        if replica is None:
+            yield db
+            return
+        session = replica.session_factory()
+        try:
+            await session.connection()
+        except DBAPIError:
+            await session.close()
+            replicas.release(replica)
+            replicas.eject(replica)
+            tried.append(replica)
+            continue
+
+        try:
+            yield session
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                replicas.eject(replica)
+            raise
+        finally:
+            await session.close()
+            replicas.release(replica)
+        return
@@ -0,0 +1,30 @@
+from typing import Iterable, Optional, Sequence
+
+import orjson
+from fastapi.responses import Response
+
+class RowsResponse(Response):
+    """
+    JSON array of objects encoded straight from row tuples with orjson
+
+    Read endpoints select only the columns of their response schema, so the
+    rows already have the types the schema guarantees. Returning this
+    response skips validating each row into a pydantic model and encoding it
+    again; the route's response_model is still used for the OpenAPI schema.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        rows: Iterable[Sequence],
+        status_code: int = 200,
+        headers: Optional[dict] = None
+    ):
+        body = orjson.dumps([dict(zip(columns, row)) for row in rows])
+        super().__init__(content=body, status_code=status_code, headers=headers)
+
+def column_names(columns: Sequence) -> tuple:
+    """Return the output names of selected columns, e.g. CALCULATION_COLUMNS"""
+    return tuple(column.key for column in columns)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -10,10 +10,26 @@ class CalculationType(str, Enum):
     MULTIPLY = "Multiply"
     DIVIDE = "Divide"
 
+class ExportFormat(str, Enum):
+    """Enumeration for calculation export formats"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class StatsGroupBy(str, Enum):
+    """Enumeration for fields calculation statistics can be grouped by"""
+    TYPE = "type"
+    USER_ID = "user_id"
+
+class StatsSource(str, Enum):
+    """Enumeration for where calculation statistics are computed from"""
+    AUTO = "auto"
+    LIVE = "live"
+    ROLLUP = "rollup"
+
 class CalculationCreate(BaseModel):
     """Schema for creating a new calculation"""
-    a: float = Field(..., description="First operand")
-    b: float = Field(..., description="Second operand")
+    a: float = Field(..., allow_inf_nan=False, description="First operand, a finite number")
+    b: float = Field(..., allow_inf_nan=False, description="Second operand, a finite number")
     type: CalculationType = Field(..., description="Type of calculation: Add, Subtract, Multiply, or Divide")
     user_id: Optional[int] = Field(None, description="Optional user ID")
 
@@ -61,13 +77,86 @@ class CalculationRead(BaseModel):
 
 class CalculationUpdate(BaseModel):
     """Schema for updating a calculation"""
-    a: Optional[float] = None
-    b: Optional[float] = None
+    a: Optional[float] = Field(None, allow_inf_nan=False)
+    b: Optional[float] = Field(None, allow_inf_nan=False)
     type: Optional[CalculationType] = None
 
     class Config:
         use_enum_values = True
 
+class CalculationBatchError(BaseModel):
+    """Schema for a batch item that could not be stored"""
+    index: int = Field(..., description="Position of the item in the submitted batch")
+    detail: str
+
+class CalculationBatchResult(BaseModel):
+    """Schema for the outcome of a batch calculation request"""
+    created: List[CalculationRead]
+    errors: List[CalculationBatchError]
+
+class CalculationImportError(BaseModel):
+    """Schema for a CSV line that could not be imported"""
+    line: int = Field(..., description="Line number in the uploaded file, counting the header as line 1")
+    detail: str
+
+class CalculationImportResult(BaseModel):
+    """Schema for the outcome of a CSV import"""
+    imported: int
+    rejected: int
+    errors: List[CalculationImportError]
+    errors_truncated: bool = Field(False, description="Whether only the first rejected lines are listed")
+    committed_line: int = Field(
+        0, description="Last line of the last stored chunk; every line up to it was stored or is counted as rejected"
+    )
+    failed: Optional[CalculationImportError] = Field(
+        None, description="Error that stopped the import after earlier chunks were stored; no later line was stored"
+    )
+
+class CalculationStatsGroup(BaseModel):
+    """Schema for the result statistics of one group of calculations"""
+    type: Optional[str] = None
+    user_id: Optional[int] = None
+    count: int
+    sum: float
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+
+class CalculationStats(BaseModel):
+    """Schema for grouped calculation result statistics"""
+    source: str = Field(..., description="Where the statistics were computed from: live or rollup")
+    group_by: List[StatsGroupBy]
+    groups: List[CalculationStatsGroup]
+
+    class Config:
+        use_enum_values = True
+
+class ExpressionEvaluate(BaseModel):
+    """Schema for evaluating an expression against many variable bindings"""
+    expression: str = Field(..., min_length=1, description="Arithmetic expression, e.g. (x + y) * 2")
+    bindings: List[Dict[str, float]] = Field(
+        default_factory=lambda: [{}],
+        description="Variable values, one mapping per evaluation"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "expression": "Divide(x + y, 2) * z",
+                "bindings": [
+                    {"x": 1, "y": 3, "z": 10},
+                    {"x": 2, "y": 4, "z": -1}
+                ]
+            }
+        }
+
+class ExpressionResult(BaseModel):
+    """Schema for the results of an expression evaluation"""
+    expression: str
+    variables: List[str]
+    results: List[Optional[float]] = Field(..., description="One result per binding, null where evaluation failed")
+    errors: List[CalculationBatchError]
+
 class UserCreate(BaseModel):
     """Schema for creating a new user"""
     username: str = Field(..., min_length=3, max_length=50)
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.metrics import Histogram
+
+# bcrypt cost factor; lower it in tests and load tests to skip production cost
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashingPoolFull(RuntimeError):
+    """Raised when the password hashing queue is over its limit"""
+
+def _hash_password(password: str) -> str:
+    """Hash a password; module-level so it can run in a worker process"""
+    return pwd_context.hash(password)
+
+class PasswordHasher:
+    """
+    Runs password hashing on a dedicated, bounded worker pool
+
+    bcrypt is CPU bound, so hashing on the request threadpool holds a worker
+    slot for the whole computation. This pool has its own concurrency limit
+    (the number of workers) and a bounded queue in front of it.
+    """
+
+    def __init__(self, executor_kind: str = "thread", max_workers: int = 2, max_queue: int = 100):
+        """
+        Args:
+            executor_kind: "thread" or "process"
+            max_workers: Maximum number of concurrent hashing operations
+            max_queue: Maximum number of requests waiting for a worker, 0 for no limit
+        """
+        if executor_kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported executor kind: {executor_kind}")
+        self.executor_kind = executor_kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.hash_seconds = Histogram()
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        """
+        Create a hasher configured from the environment
+
+        Environment variables:
+            PASSWORD_HASH_EXECUTOR: "thread" (default) or "process"
+            PASSWORD_HASH_WORKERS: Concurrent hashing operations (default: min(4, CPU count))
+            PASSWORD_HASH_MAX_QUEUE: Requests allowed to wait for a worker (default 100, 0 = unbounded)
+        """
+        return cls(
+            executor_kind=os.getenv("PASSWORD_HASH_EXECUTOR", "thread").strip().lower(),
+            max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "100")),
+        )
+
+    def _get_executor(self) -> Executor:
+        """Create the worker pool on first use so importing the app stays cheap"""
+        with self._lock:
+            if self._executor is None:
+                if self.executor_kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="password-hash"
+                    )
+            return self._executor
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password on the worker pool without blocking the caller's thread
+
+        Raises:
+            HashingPoolFull: If the queue in front of the workers is full
+        """
+        with self._lock:
+            if self.max_queue and self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise HashingPoolFull("Password hashing queue is full")
+            self._pending += 1
+
+        start = time.perf_counter()
+        try:
+            future = self._get_executor().submit(_hash_password, password)
+            return await asyncio.wrap_future(future)
+        finally:
+            self.hash_seconds.observe(time.perf_counter() - start)
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def stats(self) -> Dict:
+        """Return hashing pool statistics, including the current queue depth"""
+        with self._lock:
+            pending, completed, rejected = self._pending, self._completed, self._rejected
+        return {
+            "executor": self.executor_kind,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(pending, self.max_workers),
+            "queue_depth": max(pending - self.max_workers, 0),
+            "completed": completed,
+            "rejected": rejected,
+            "hash_seconds": self.hash_seconds.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker pool, waiting for running hashes to finish"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher.from_env()
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a password on the shared hashing pool
+
+    Raises:
+        HTTPException: 503 with Retry-After when the hashing queue is full
+    """
+    try:
+        return await password_hasher.hash(password)
+    except HashingPoolFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
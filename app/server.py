@@ -0,0 +1,47 @@
+import math
+import os
+from typing import Optional
+
+# cgroup v2 CPU limit of the container, "<quota> <period>" or "max <period>"
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+def cgroup_cpu_limit(path: str = CGROUP_CPU_MAX) -> Optional[float]:
+    """Return the CPU quota of the current cgroup in CPUs, or None if unlimited or unknown"""
+    try:
+        with open(path) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return int(quota) / int(period)
+
+def available_cpus(cgroup_path: str = CGROUP_CPU_MAX) -> int:
+    """
+    Count the CPUs this process may run on
+
+    Honours the CPU affinity mask (e.g. taskset, docker --cpuset-cpus) and
+    the cgroup quota (docker --cpus), either of which can be far below
+    os.cpu_count() inside a container.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(cgroup_path)
+    if limit is not None:
+        cpus = min(cpus, max(math.ceil(limit), 1))
+    return cpus
+
+def worker_count() -> int:
+    """
+    Number of server worker processes
+
+    WEB_CONCURRENCY overrides the default of one worker per available CPU;
+    each worker runs its own event loop and threadpool, so more workers than
+    CPUs only adds memory and database connections.
+    """
+    value = os.getenv("WEB_CONCURRENCY")
+    if value:
+        return max(int(value), 1)
+    return available_cpus()
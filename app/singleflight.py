@@ -0,0 +1,171 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Tuple
+
+from fastapi import Request
+
+from app.replicas import reads_from_primary
+
+# Share identical in-flight detail lookups between concurrent requests
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "true").strip().lower() in ("1", "true", "yes", "on")
+
+class _Call:
+    """A lookup in flight and, once done, its result or error"""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class _LeaderCancelled(Exception):
+    """The leader of an async call was cancelled before the call finished"""
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution
+
+    The first caller of a key (the leader) runs the function; callers that
+    arrive while it runs wait for it and receive the same result, or the
+    same exception. Nothing is cached: the next call after the leader
+    finishes runs the function again. Keys are (namespace, id) pairs, and
+    executed and coalesced calls are counted per namespace.
+
+    Threadpool routes use do(); async routes use do_async(), which
+    coalesces within the event loop.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        key = (namespace, outcome)
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def do(self, key: Tuple[str, Hashable], function: Callable[[], Any]) -> Any:
+        """Run function for key, or wait for the call already running for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(key[0], "executed" if leader else "coalesced")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = function()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Tuple[str, Hashable], function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await function() for key, or the call already running for key
+
+        When the leader is cancelled (e.g. its client disconnected) its
+        waiters are not: the first of them to resume runs the call again and
+        the others wait for that call instead.
+        """
+        while True:
+            future = self._async_calls.get(key)
+            with self._lock:
+                self._count(key[0], "executed" if future is None else "coalesced")
+            if future is None:
+                return await self._lead_async(key, function)
+            try:
+                # Shield the shared call from the cancellation of one waiter
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+
+    async def _lead_async(self, key: Tuple[str, Hashable], function: Callable[[], Awaitable[Any]]) -> Any:
+        """Await function() as the leader of key, sharing its outcome with the waiters"""
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            value = await function()
+        except asyncio.CancelledError:
+            # Wake the waiters to retry rather than cancelling them too
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so it is not reported when nobody waited
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._async_calls.get(key) is future:
+                del self._async_calls[key]
+
+    def forget(self, key: Tuple[str, Hashable]) -> None:
+        """
+        Stop sharing the call in flight for key
+
+        Callers arriving afterwards start a new call, so a lookup that began
+        before a write is never shared with a reader that started after it.
+        """
+        with self._lock:
+            self._calls.pop(key, None)
+        self._async_calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the executed and coalesced call counts per namespace"""
+        with self._lock:
+            counts = dict(self._counts)
+        stats: Dict[str, Dict[str, int]] = {}
+        for (namespace, outcome), count in sorted(counts.items()):
+            stats.setdefault(namespace, {"executed": 0, "coalesced": 0})[outcome] = count
+        return stats
+
+# Coalesces the lookups of GET /users/{id} and GET /calculations/{id}
+_lookups = SingleFlight()
+
+def get_lookups() -> SingleFlight:
+    """Return the single-flight group of the detail lookups"""
+    return _lookups
+
+def single_flight_enabled() -> bool:
+    """Return whether detail lookups are coalesced"""
+    return SINGLE_FLIGHT_ENABLED
+
+def coalesced_lookup(request: Request, key: Tuple[str, Hashable], function: Callable[[], Any]) -> Any:
+    """
+    Run a detail lookup, sharing it with identical concurrent lookups
+
+    Clients in their read-your-writes window (see app.replicas) always run
+    their own lookup, so they never receive a result read before their write.
+    """
+    if not SINGLE_FLIGHT_ENABLED or reads_from_primary(request):
+        return function()
+    return _lookups.do(key, function)
+
+async def coalesced_lookup_async(request: Request, key: Tuple[str, Hashable], function: Callable[[], Awaitable[Any]]) -> Any:
+    """Async version of coalesced_lookup, for the routes in app.async_routes"""
+    if not SINGLE_FLIGHT_ENABLED or reads_from_primary(request):
+        return await function()
+    return await _lookups.do_async(key, function)
+
+def forget_calculations(calculation_ids: Iterable[int]) -> None:
+    """Stop sharing in-flight lookups of calculations that were just changed"""
+    for calculation_id in calculation_ids:
+        _lookups.forget(("calculation", calculation_id))
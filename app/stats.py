@@ -0,0 +1,287 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import Calculation, CalculationRollup
+from app.queries import filter_calculations
+
+# Maintain the calculation_rollups table on every write when enabled
+ROLLUPS_ENABLED = os.getenv("CALCULATION_ROLLUPS", "false").strip().lower() in ("1", "true", "yes", "on")
+
+BUCKET_SIZE = timedelta(hours=1)
+
+# Fields calculations can be grouped by, mapped to their column in each source
+GROUP_COLUMNS = {
+    "type": (Calculation.type, CalculationRollup.type),
+    "user_id": (Calculation.user_id, CalculationRollup.user_key),
+}
+
+BucketKey = Tuple[datetime, str, int]
+
+def rollups_enabled() -> bool:
+    """Return whether the rollup table is maintained on writes"""
+    return ROLLUPS_ENABLED
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """Return the start of the rollup bucket containing timestamp"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def is_bucket_aligned(timestamp: Optional[datetime]) -> bool:
+    """Return whether a window bound falls on a bucket boundary"""
+    return timestamp is None or bucket_start(timestamp) == timestamp
+
+def bucket_key(row) -> BucketKey:
+    """Return the rollup bucket a calculation row belongs to"""
+    return (bucket_start(row.created_at), row.type, row.user_id or 0)
+
+def _upsert(db: Session, values: List[Dict], accumulate: bool):
+    """
+    Insert rollup rows, merging into existing buckets
+
+    Args:
+        db: Session to execute on
+        values: Rollup rows keyed by CalculationRollup column names
+        accumulate: Add counts and sums to the existing bucket instead of
+            replacing it
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(CalculationRollup)
+        least, greatest = func.least, func.greatest
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(CalculationRollup)
+        least, greatest = func.min, func.max
+    else:
+        raise RuntimeError(f"Calculation rollups are not supported on {dialect}")
+
+    excluded = stmt.excluded
+    if accumulate:
+        table = CalculationRollup.__table__.c
+        updates = {
+            "result_count": table.result_count + excluded.result_count,
+            "result_sum": table.result_sum + excluded.result_sum,
+            "result_min": func.coalesce(least(table.result_min, excluded.result_min), excluded.result_min),
+            "result_max": func.coalesce(greatest(table.result_max, excluded.result_max), excluded.result_max),
+        }
+    else:
+        updates = {
+            name: getattr(excluded, name)
+            for name in ("result_count", "result_sum", "result_min", "result_max")
+        }
+
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["bucket_start", "type", "user_key"],
+            set_=updates
+        ),
+        values
+    )
+
+def _recompute_bucket(db: Session, key: BucketKey) -> None:
+    """Rebuild one bucket from the calculations table"""
+    start, operation_type, user_key = key
+    user_filter = Calculation.user_id.is_(None) if user_key == 0 else Calculation.user_id == user_key
+    count, total, minimum, maximum = db.execute(
+        select(
+            func.count(Calculation.id),
+            func.coalesce(func.sum(Calculation.result), 0.0),
+            func.min(Calculation.result),
+            func.max(Calculation.result),
+        ).where(
+            Calculation.type == operation_type,
+            user_filter,
+            Calculation.created_at >= start,
+            Calculation.created_at < start + BUCKET_SIZE,
+        )
+    ).one()
+
+    if count == 0:
+        db.execute(delete(CalculationRollup).where(
+            CalculationRollup.bucket_start == start,
+            CalculationRollup.type == operation_type,
+            CalculationRollup.user_key == user_key,
+        ))
+        return
+
+    _upsert(db, [{
+        "bucket_start": start,
+        "type": operation_type,
+        "user_key": user_key,
+        "result_count": count,
+        "result_sum": total,
+        "result_min": minimum,
+        "result_max": maximum,
+    }], accumulate=False)
+
+def apply_rollup(db: Session, added: Iterable = (), removed: Iterable = ()) -> None:
+    """
+    Update the rollup table for calculations written in the current transaction
+
+    Added rows are merged into their buckets as deltas. Buckets that lost a
+    row are rebuilt from the calculations table instead, since min and max
+    cannot be decremented; call this after the write has been executed.
+    Does nothing unless CALCULATION_ROLLUPS is enabled.
+
+    Args:
+        db: Session holding the write's transaction
+        added: Inserted rows, or updated rows with their new values
+        removed: Deleted rows, or updated rows with their previous values
+    """
+    if not rollups_enabled():
+        return
+
+    recompute = {bucket_key(row) for row in removed}
+
+    deltas: Dict[BucketKey, Dict] = {}
+    for row in added:
+        key = bucket_key(row)
+        if key in recompute:
+            continue
+        delta = deltas.setdefault(key, {
+            "bucket_start": key[0],
+            "type": key[1],
+            "user_key": key[2],
+            "result_count": 0,
+            "result_sum": 0.0,
+            "result_min": None,
+            "result_max": None,
+        })
+        delta["result_count"] += 1
+        if row.result is not None:
+            delta["result_sum"] += row.result
+            delta["result_min"] = row.result if delta["result_min"] is None else min(delta["result_min"], row.result)
+            delta["result_max"] = row.result if delta["result_max"] is None else max(delta["result_max"], row.result)
+
+    if deltas:
+        _upsert(db, list(deltas.values()), accumulate=True)
+    for key in recompute:
+        _recompute_bucket(db, key)
+
+def rebuild_rollups(db: Session) -> None:
+    """Rebuild the whole rollup table from the calculations table"""
+    hour = func.strftime("%Y-%m-%d %H:00:00.000000", Calculation.created_at) \
+        if db.get_bind().dialect.name == "sqlite" else func.date_trunc("hour", Calculation.created_at)
+    db.execute(delete(CalculationRollup))
+    db.execute(insert(CalculationRollup).from_select(
+        ["bucket_start", "type", "user_key", "result_count", "result_sum", "result_min", "result_max"],
+        select(
+            hour,
+            Calculation.type,
+            func.coalesce(Calculation.user_id, literal(0)),
+            func.count(Calculation.id),
+            func.coalesce(func.sum(Calculation.result), 0.0),
+            func.min(Calculation.result),
+            func.max(Calculation.result),
+        ).group_by(hour, Calculation.type, func.coalesce(Calculation.user_id, literal(0)))
+    ))
+
+def _format_groups(rows, group_by: Sequence[str]) -> List[Dict]:
+    """Convert aggregate rows into response dictionaries"""
+    groups = []
+    for row in rows:
+        group = dict(zip(group_by, row[:len(group_by)]))
+        if "user_id" in group and group["user_id"] == 0:
+            group["user_id"] = None
+        count, total, minimum, maximum = row[len(group_by):]
+        group.update(
+            count=count,
+            sum=total,
+            min=minimum,
+            max=maximum,
+            avg=total / count if count else None,
+        )
+        groups.append(group)
+    return groups
+
+def live_stats(
+    db: Session,
+    group_by: Sequence[str],
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> List[Dict]:
+    """Aggregate results with a GROUP BY over the calculations table"""
+    columns = [GROUP_COLUMNS[name][0] for name in group_by]
+    query = select(
+        *columns,
+        func.count(Calculation.id),
+        func.coalesce(func.sum(Calculation.result), 0.0),
+        func.min(Calculation.result),
+        func.max(Calculation.result),
+    )
+    query = filter_calculations(query, created_after=created_after, created_before=created_before)
+    query = query.group_by(*columns).order_by(*columns)
+    return _format_groups(db.execute(query).all(), group_by)
+
+def rollup_stats(
+    db: Session,
+    group_by: Sequence[str],
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+) -> List[Dict]:
+    """
+    Aggregate results from the precomputed hourly buckets
+
+    Window bounds are applied to bucket start times, so they are exact only
+    when they fall on the hour.
+    """
+    columns = [GROUP_COLUMNS[name][1] for name in group_by]
+    query = select(
+        *columns,
+        func.sum(CalculationRollup.result_count),
+        func.sum(CalculationRollup.result_sum),
+        func.min(CalculationRollup.result_min),
+        func.max(CalculationRollup.result_max),
+    )
+    if created_after is not None:
+        query = query.where(CalculationRollup.bucket_start >= bucket_start(created_after))
+    if created_before is not None:
+        query = query.where(CalculationRollup.bucket_start < created_before)
+    query = query.group_by(*columns).order_by(*columns)
+    return _format_groups(db.execute(query).all(), group_by)
+
+def calculation_stats(
+    db: Session,
+    group_by: Sequence[str],
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    source: str = "auto"
+) -> Tuple[str, List[Dict]]:
+    """
+    Compute result statistics grouped by type and/or user
+
+    Args:
+        db: Session to query
+        group_by: Fields to group by, any of "type" and "user_id"
+        created_after: Start of the time window (inclusive)
+        created_before: End of the time window (exclusive)
+        source: "live", "rollup", or "auto" to use the rollups whenever they
+            are enabled and the window falls on bucket boundaries
+
+    Returns:
+        Tuple of (source used, groups)
+
+    Raises:
+        ValueError: If the rollup source is requested while rollups are disabled
+    """
+    if source == "auto":
+        aligned = is_bucket_aligned(created_after) and is_bucket_aligned(created_before)
+        source = "rollup" if rollups_enabled() and aligned else "live"
+
+    if source == "rollup":
+        if not rollups_enabled():
+            raise ValueError("Calculation rollups are not enabled")
+        return source, rollup_stats(db, group_by, created_after, created_before)
+    return source, live_stats(db, group_by, created_after, created_before)
+
+if __name__ == "__main__":
+    # Rebuild the rollups after enabling them on an existing database:
+    #   python -m app.stats
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        rebuild_rollups(session)
+        session.commit()
@@ -0,0 +1 @@
+"""Microbenchmarks and load tests for the Calculation API"""
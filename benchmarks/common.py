@@ -0,0 +1,149 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+# Fraction by which a benchmark may get slower before it counts as a regression
+DEFAULT_THRESHOLD = 0.2
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Return the given percentile of samples using the nearest-rank method"""
+    if not samples:
+        return math.nan
+    ordered = sorted(samples)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+def summarize(latencies: Sequence[float], elapsed: float, errors: int = 0) -> Dict:
+    """
+    Summarize one benchmark run
+
+    Args:
+        latencies: Seconds taken by each operation
+        elapsed: Wall-clock seconds for the whole run
+        errors: Number of failed operations
+
+    Returns:
+        Dictionary with the operation count, errors, throughput and
+        p50/p95/p99 latency in milliseconds
+    """
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "ops_per_second": len(latencies) / elapsed if elapsed > 0 else math.nan,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Compare results with a baseline
+
+    A benchmark regresses when its p95 latency grows, or its throughput
+    drops, by more than threshold (a fraction of the baseline value).
+    Benchmarks missing from either side are ignored.
+
+    Returns:
+        One message per regression
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']:.3f} ms vs baseline {previous['p95_ms']:.3f} ms"
+            )
+        if current["ops_per_second"] < previous["ops_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {current['ops_per_second']:.1f} ops/s vs baseline {previous['ops_per_second']:.1f} ops/s"
+            )
+    return regressions
+
+def load_baseline(path: str) -> Optional[Dict[str, Dict]]:
+    """Load the results of a saved baseline, or None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["results"]
+
+def save_baseline(path: str, results: Dict[str, Dict], settings: Dict) -> None:
+    """Save results with the settings and environment they were measured in"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    document = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+def add_baseline_arguments(parser: argparse.ArgumentParser, default_name: str) -> None:
+    """Add the baseline and threshold options shared by every benchmark script"""
+    parser.add_argument(
+        "--baseline",
+        default=os.path.join(BASELINE_DIR, f"{default_name}.json"),
+        help="Baseline JSON file to compare against (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results to the baseline file instead of comparing"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown as a fraction of the baseline (default: %(default)s)"
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+
+def print_results(results: Dict[str, Dict]) -> None:
+    """Print results as an aligned table"""
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'count':>7}  {'errors':>6}  {'ops/s':>11}  "
+          f"{'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<{width}}  {result['count']:>7}  {result['errors']:>6}  "
+              f"{result['ops_per_second']:>11.1f}  {result['p50_ms']:>9.3f}  "
+              f"{result['p95_ms']:>9.3f}  {result['p99_ms']:>9.3f}")
+
+def finish(args: argparse.Namespace, results: Dict[str, Dict], settings: Dict) -> int:
+    """
+    Report results, then save or check them against the baseline
+
+    Returns:
+        Process exit code: 1 if a regression was found, otherwise 0
+    """
+    print_results(results)
+    if args.json:
+        save_baseline(args.json, results, settings)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, settings)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0%} of {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 0
@@ -0,0 +1,132 @@
+"""
+Microbenchmarks for the calculation factory and the pydantic schemas
+
+Usage:
+    python -m benchmarks.micro [--iterations N] [--save-baseline] [--threshold 0.2]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from benchmarks.common import add_baseline_arguments, finish, summarize
+
+from app.cache import CacheBackend, LocalCache
+from app.expression import compile_expression
+from app.models import CALCULATION_COLUMNS
+from app.responses import RowsResponse, column_names
+from app.factory import (
+    CalculationFactory,
+    get_result_cache,
+    perform_calculation,
+    perform_calculations,
+    set_result_cache
+)
+from app.schemas import CalculationBatchResult, CalculationCreate, CalculationRead
+
+# Size of the inputs for the vectorized benchmarks
+VECTOR_SIZE = 1000
+
+# Rows in a page of GET /calculations
+PAGE_SIZE = 100
+
+class Benchmark(NamedTuple):
+    """A benchmarked callable and the conditions it runs under"""
+    function: Callable[[], object]
+    # Result cache installed while the benchmark runs
+    cache: Optional[CacheBackend] = None
+    # Divides the iteration count for benchmarks doing many operations per call
+    scale: int = 1
+
+def measure(function: Callable[[], object], iterations: int, warmup: int = 100) -> Dict:
+    """Time each call of function and summarize the latencies"""
+    for _ in range(warmup):
+        function()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+def benchmarks() -> Dict[str, Benchmark]:
+    """Return the benchmarked callables by name"""
+    row = SimpleNamespace(
+        id=1, a=10.5, b=5.2, type="Add", result=15.7, created_at=datetime(2024, 1, 1), user_id=1
+    )
+    read = CalculationRead.model_validate(row)
+    created = [read.model_dump() for _ in range(100)]
+    types = ["Add", "Subtract", "Multiply", "Divide"] * (VECTOR_SIZE // 4)
+    a_values = [float(i) for i in range(VECTOR_SIZE)]
+    b_values = [float(i % 7 + 1) for i in range(VECTOR_SIZE)]
+    expression = compile_expression("(x + y) * 2 - Divide(x, y)")
+    bindings = [{"x": a, "y": b} for a, b in zip(a_values, b_values)]
+    # A page of calculations as ORM-like objects and as selected row tuples
+    page_adapter = TypeAdapter(List[CalculationRead])
+    columns = column_names(CALCULATION_COLUMNS)
+    object_page = [row] * PAGE_SIZE
+    tuple_page = [tuple(getattr(row, name) for name in columns)] * PAGE_SIZE
+
+    def response_model_page():
+        # What FastAPI does with a response_model: validate, dump, encode
+        page = page_adapter.validate_python(object_page, from_attributes=True)
+        return JSONResponse(page_adapter.dump_python(page, mode="json"))
+
+    return {
+        "perform_calculation[Add]": Benchmark(lambda: perform_calculation(10.5, 5.2, "Add")),
+        "perform_calculation[Divide]": Benchmark(lambda: perform_calculation(10.5, 5.2, "Divide")),
+        # Dispatch overhead: a new instance per call versus the shared dispatch table
+        "create_operation().calculate[Add]": Benchmark(
+            lambda: CalculationFactory.create_operation("Add").calculate(10.5, 5.2)
+        ),
+        "get_operation().calculate[Add]": Benchmark(
+            lambda: CalculationFactory.get_operation("Add").calculate(10.5, 5.2)
+        ),
+        "perform_calculation[Add, local cache]": Benchmark(
+            lambda: perform_calculation(10.5, 5.2, "Add"), cache=LocalCache()
+        ),
+        "perform_calculations[1000 mixed]": Benchmark(
+            lambda: perform_calculations(a_values, b_values, types), scale=100
+        ),
+        "CalculationCreate.model_validate": Benchmark(lambda: CalculationCreate.model_validate(
+            {"a": 10.5, "b": 5.2, "type": "Divide", "user_id": 1}
+        )),
+        "CalculationRead.model_validate[attributes]": Benchmark(lambda: CalculationRead.model_validate(row)),
+        "CalculationRead.model_dump_json": Benchmark(read.model_dump_json),
+        "CalculationBatchResult[100 items]": Benchmark(
+            lambda: CalculationBatchResult(created=created, errors=[]), scale=10
+        ),
+        "list page[100, response_model]": Benchmark(response_model_page, scale=100),
+        "list page[100, RowsResponse]": Benchmark(lambda: RowsResponse(columns, tuple_page), scale=100),
+        "compile_expression[cached]": Benchmark(lambda: compile_expression("(x + y) * 2 - Divide(x, y)")),
+        "expression.evaluate[1000 bindings]": Benchmark(lambda: expression.evaluate(bindings), scale=100),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="Calls per benchmark (default: %(default)s)")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    add_baseline_arguments(parser, "micro")
+    args = parser.parse_args(argv)
+
+    previous_cache = get_result_cache()
+    results = {}
+    try:
+        for name, benchmark in benchmarks().items():
+            if args.filter not in name:
+                continue
+            set_result_cache(benchmark.cache)
+            results[name] = measure(benchmark.function, max(args.iterations // benchmark.scale, 1))
+    finally:
+        set_result_cache(previous_cache)
+
+    return finish(args, results, {"iterations": args.iterations})
+
+if __name__ == "__main__":
+    sys.exit(main())
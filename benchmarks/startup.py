@@ -0,0 +1,144 @@
+"""
+Startup-time benchmark for the server launch modes
+
+Each mode is started repeatedly against a fresh SQLite database (or
+--database-url) and timed until GET /health answers and every worker has
+finished its application startup.
+
+Usage:
+    python -m benchmarks.startup [--workers 4] [--repeats 5] [--save-baseline] [--threshold 0.2]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+from benchmarks.common import add_baseline_arguments, finish, summarize
+
+# Logged by uvicorn in every worker once the startup event has run
+STARTUP_COMPLETE = "Application startup complete"
+
+class LaunchMode(NamedTuple):
+    """A server command line and the environment it runs with; "{port}" is filled in per start"""
+    name: str
+    command: List[str]
+    env: Dict[str, str]
+    # Worker processes that must report startup before the server counts as ready
+    workers: int
+
+def launch_modes(workers: int) -> List[LaunchMode]:
+    """Return the benchmarked launch modes"""
+    uvicorn = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", "{port}"]
+    gunicorn = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"]
+    gunicorn_env = {"WEB_CONCURRENCY": str(workers), "PORT": "{port}"}
+    return [
+        LaunchMode("uvicorn[1 worker, init_db]", uvicorn, {}, 1),
+        LaunchMode(
+            f"uvicorn[{workers} workers, init_db per worker]",
+            uvicorn + ["--workers", str(workers)], {}, workers
+        ),
+        LaunchMode(
+            f"gunicorn[{workers} workers, preload, migrate once]",
+            gunicorn, {**gunicorn_env, "GUNICORN_PRELOAD": "true"}, workers
+        ),
+        LaunchMode(
+            f"gunicorn[{workers} workers, no preload, migrate once]",
+            gunicorn, {**gunicorn_env, "GUNICORN_PRELOAD": "false"}, workers
+        ),
+    ]
+
+def free_port() -> int:
+    """Return a TCP port that is currently free on localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_startup(mode: LaunchMode, port: int, database_url: str, timeout: float) -> Optional[float]:
+    """
+    Start a server and return the seconds until it is ready, or None if it never was
+
+    The server is stopped before returning.
+    """
+    command = [part.format(port=port) for part in mode.command]
+    env = {**os.environ, **{name: value.format(port=port) for name, value in mode.env.items()}}
+    env["DATABASE_URL"] = database_url
+    started = threading.Event()
+    ready_workers = 0
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+
+    def watch_log():
+        nonlocal ready_workers
+        for line in process.stderr:
+            if STARTUP_COMPLETE in line:
+                ready_workers += 1
+                if ready_workers >= mode.workers:
+                    started.set()
+
+    threading.Thread(target=watch_log, daemon=True).start()
+    try:
+        deadline = start + timeout
+        healthy = False
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() < deadline and process.poll() is None:
+                try:
+                    healthy = healthy or client.get("/health").status_code == 200
+                except httpx.TransportError:
+                    pass
+                if healthy and started.is_set():
+                    return time.perf_counter() - start
+                time.sleep(0.01)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def run(args: argparse.Namespace) -> Dict[str, Dict]:
+    """Start every launch mode args.repeats times and summarize the startup times"""
+    results = {}
+    for mode in launch_modes(args.workers):
+        if args.filter not in mode.name:
+            continue
+        durations, errors = [], 0
+        elapsed_start = time.perf_counter()
+        for _ in range(args.repeats):
+            with tempfile.TemporaryDirectory() as directory:
+                database_url = args.database_url or f"sqlite:///{directory}/startup.db"
+                duration = time_startup(mode, free_port(), database_url, args.timeout)
+            if duration is None:
+                errors += 1
+            else:
+                durations.append(duration)
+        results[mode.name] = summarize(durations, time.perf_counter() - elapsed_start, errors)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="Workers for the multi-process modes (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=5, help="Starts per mode (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for a server (default: %(default)s)")
+    parser.add_argument("--database-url", help="Start against this database instead of a fresh SQLite file")
+    parser.add_argument("--filter", default="", help="Only run modes whose name contains this text")
+    add_baseline_arguments(parser, "startup")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    settings = {"workers": args.workers, "repeats": args.repeats, "database": args.database_url or "sqlite"}
+    return finish(args, results, settings)
+
+if __name__ == "__main__":
+    sys.exit(main())
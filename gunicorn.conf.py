@@ -0,0 +1,38 @@
+# Production server configuration:
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# The schema is created or upgraded once, by the master process under the
+# migration lock, before the workers are forked. The app is imported once
+# in the master (preload_app) and shared copy-on-write by the workers.
+import os
+
+from app.server import worker_count
+
+def _enabled(name: str, default: str = "true") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = worker_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = _enabled("GUNICORN_PRELOAD")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+# Workers must not repeat the schema setup on startup
+os.environ["INIT_DB_ON_STARTUP"] = "false"
+
+def on_starting(server):
+    """Migrate the database before any worker starts"""
+    if _enabled("MIGRATE_ON_START"):
+        from app.migrate import migrate
+        outcome = migrate()
+        server.log.info("Database %s", outcome)
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master so workers never share sockets"""
+    from app.database import async_engine, engine
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,4 @@
+import os
+
+# Keep password hashing cheap in tests; must be set before app.security is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.admission import BULK, CRITICAL, READ, WRITE, AdmissionController, request_priority
+from app.main import app
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestRequestPriority:
+    """Test request classification"""
+
+    def test_priorities(self):
+        """Test that health checks, reads, writes and bulk requests are told apart"""
+        assert request_priority("GET", "/health/pool") == CRITICAL
+        assert request_priority("GET", "/metrics") == CRITICAL
+        assert request_priority("GET", "/calculations/7") == READ
+        assert request_priority("PUT", "/calculations/7") == WRITE
+        assert request_priority("POST", "/calculations/batch") == BULK
+        assert request_priority("GET", "/calculations/export") == BULK
+
+class TestAdaptiveLimit:
+    """Test the AIMD concurrency limit"""
+
+    def test_fast_requests_raise_the_limit(self):
+        """Test additive increase while the limit is in use"""
+        clock = FakeClock()
+        controller = AdmissionController(initial_limit=4, clock=clock)
+
+        async def run():
+            admitted = [await controller.acquire(READ) for _ in range(4)]
+            clock.now = 0.01
+            for admitted_at in admitted:
+                controller.release(READ, admitted_at, 200)
+
+        asyncio.run(run())
+        assert 4 < controller.limit < 5
+
+    def test_slow_burst_decreases_once(self):
+        """Test that requests admitted before a decrease do not decrease it again"""
+        clock = FakeClock()
+        controller = AdmissionController(initial_limit=10, backoff=0.5, clock=clock)
+
+        async def run():
+            admitted = [await controller.acquire(READ) for _ in range(3)]
+            clock.now = 1.0
+            for admitted_at in admitted:
+                controller.release(READ, admitted_at, 200)
+            assert controller.limit == 5
+            clock.now = 2.0
+            admitted_at = await controller.acquire(WRITE)
+            clock.now = 2.1
+            controller.release(WRITE, admitted_at, 500)
+            assert controller.limit == 4
+
+        asyncio.run(run())
+
+    def test_bulk_latency_is_ignored(self):
+        """Test that slow bulk requests do not count as congestion"""
+        clock = FakeClock()
+        controller = AdmissionController(initial_limit=10, clock=clock)
+
+        async def run():
+            admitted_at = await controller.acquire(BULK)
+            clock.now = 5.0
+            controller.release(BULK, admitted_at, 200)
+
+        asyncio.run(run())
+        assert controller.limit == 10
+
+class TestQueueing:
+    """Test priority queueing and load shedding"""
+
+    def test_freed_slot_goes_to_the_highest_priority(self):
+        """Test that a waiting read is admitted before an earlier bulk request"""
+        controller = AdmissionController(initial_limit=2, min_limit=1, shares={READ: 1.0, WRITE: 1.0, BULK: 1.0})
+
+        async def run():
+            held = [await controller.acquire(WRITE) for _ in range(2)]
+            bulk = asyncio.ensure_future(controller.acquire(BULK))
+            read = asyncio.ensure_future(controller.acquire(READ))
+            await asyncio.sleep(0)
+            controller.release(WRITE, held[0], 200)
+            await asyncio.sleep(0.01)
+            assert read.done() and read.result() is not None
+            assert not bulk.done()
+            assert await bulk is None
+
+        asyncio.run(run())
+        assert controller.stats()["rejected"]["bulk"] == 1
+
+    def test_full_queue_rejects_at_once(self):
+        """Test fast rejection when the queue is over budget"""
+        controller = AdmissionController(initial_limit=1, min_limit=1, max_queue=0)
+
+        async def run():
+            assert await controller.acquire(READ) is not None
+            assert await controller.acquire(READ) is None
+            assert await controller.acquire(CRITICAL) is not None
+
+        asyncio.run(run())
+        assert controller.stats()["queued"] == 0
+
+class TestAdmissionMiddleware:
+    """Test load shedding in front of the routes"""
+
+    @pytest.fixture
+    def overloaded(self, monkeypatch):
+        """A controller with every slot taken and no room to queue"""
+        controller = AdmissionController(initial_limit=4, max_queue=0)
+        controller.inflight = 4
+        monkeypatch.setattr("app.admission._controller", controller)
+        return controller
+
+    def test_overload_returns_503(self, overloaded):
+        """Test that rejected requests get 503 with Retry-After and health checks still pass"""
+        client = TestClient(app)
+        response = client.get("/calculations/1")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        assert client.get("/health").status_code == 200
+        stats = client.get("/health/admission").json()
+        assert stats["rejected"]["read"] == 1
+        assert stats["inflight"] == 4
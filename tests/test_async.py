@@ -0,0 +1,241 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.async_routes import router, use_async_routes
+from app.batch import build_batch_rows
+from app.database import Base, get_async_db
+from app.handlers import validate_batch
+from app.main import app as sync_app
+
+# Create test database; the sync engine only manages the schema
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_async.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test_async.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_async_db():
+    """Override async database dependency for testing"""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+app = FastAPI()
+app.include_router(router)
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+@pytest.fixture(scope="function")
+def client():
+    """Create test client backed by the async routes"""
+    Base.metadata.create_all(bind=engine)
+    yield TestClient(app)
+    Base.metadata.drop_all(bind=engine)
+
+class TestAsyncUserEndpoints:
+    """Test async user endpoints"""
+    
+    def test_create_and_get_user(self, client):
+        """Test creating and fetching a user"""
+        response = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpassword123"
+        })
+        assert response.status_code == 201
+        user_id = response.json()["id"]
+        
+        response = client.get(f"/users/{user_id}")
+        assert response.status_code == 200
+        assert response.json()["username"] == "testuser"
+        assert len(client.get("/users").json()) == 1
+    
+    def test_create_duplicate_user(self, client):
+        """Test that creating duplicate user fails"""
+        user_data = {
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpassword123"
+        }
+        assert client.post("/users", json=user_data).status_code == 201
+        response = client.post("/users", json=user_data)
+        assert response.status_code == 400
+    
+    def test_get_nonexistent_user(self, client):
+        """Test getting non-existent user"""
+        assert client.get("/users/9999").status_code == 404
+
+class TestAsyncCalculationEndpoints:
+    """Test async calculation endpoints"""
+    
+    def test_calculation_lifecycle(self, client):
+        """Test create, read, update and delete of a calculation"""
+        response = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"})
+        assert response.status_code == 201
+        calc_id = response.json()["id"]
+        assert response.json()["result"] == 15
+        
+        response = client.put(f"/calculations/{calc_id}", json={"type": "Multiply"})
+        assert response.status_code == 200
+        assert response.json()["result"] == 50
+        
+        response = client.get(f"/calculations/{calc_id}")
+        assert response.json()["type"] == "Multiply"
+        
+        assert client.delete(f"/calculations/{calc_id}").status_code == 204
+        assert client.get(f"/calculations/{calc_id}").status_code == 404
+    
+    def test_create_calculation_invalid_user(self, client):
+        """Test creating calculation with non-existent user"""
+        response = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": 9999})
+        assert response.status_code == 404
+    
+    def test_list_calculations_by_user(self, client):
+        """Test listing calculations filtered by user"""
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        client.post("/calculations", json={"a": 10, "b": 5, "type": "Add", "user_id": user_id})
+        client.post("/calculations", json={"a": 20, "b": 10, "type": "Add"})
+        
+        assert len(client.get("/calculations").json()) == 2
+        data = client.get(f"/calculations?user_id={user_id}").json()
+        assert len(data) == 1
+        assert data[0]["user_id"] == user_id
+    
+    def test_conditional_get(self, client):
+        """Test ETag / If-None-Match on the async detail and list routes"""
+        calc_id = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"}).json()["id"]
+        etag = client.get(f"/calculations/{calc_id}").headers["etag"]
+        assert client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag}).status_code == 304
+        
+        updated = client.put(f"/calculations/{calc_id}", json={"a": 1, "b": 2, "type": "Add"})
+        assert updated.headers["etag"] != etag
+        assert client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag}).status_code == 200
+        
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        list_etag = client.get(f"/calculations?user_id={user_id}").headers["etag"]
+        assert client.get(
+            f"/calculations?user_id={user_id}", headers={"If-None-Match": list_etag}
+        ).status_code == 304
+    
+    def test_cursor_pagination(self, client):
+        """Test following X-Next-Cursor through the async list route"""
+        for i in range(3):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        first = client.get("/calculations?limit=2")
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get(f"/calculations?limit=2&cursor={cursor}")
+        assert [calc["a"] for calc in first.json() + second.json()] == [0, 1, 2]
+    
+    def test_export_ndjson(self, client):
+        """Test streaming the export through the async route"""
+        for i in range(3):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        response = client.get("/calculations/export")
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 3
+    
+    def test_batch_create(self, client):
+        """Test the async batch endpoint"""
+        items = [
+            {"a": 10, "b": 5, "type": "Add"},
+            {"a": 1, "b": 0, "type": "Divide"},
+            {"a": 1, "b": 2, "type": "Add", "user_id": 9999}
+        ]
+        response = client.post("/calculations/batch", json=items)
+        assert response.status_code == 200
+        data = response.json()
+        assert [calc["result"] for calc in data["created"]] == [15]
+        assert [error["index"] for error in data["errors"]] == [1, 2]
+    
+    def test_batch_computes_off_the_event_loop(self, client, monkeypatch):
+        """Test that batch validation and computation run on the threadpool"""
+        loops = []
+        
+        def record(function):
+            def wrapper(*args):
+                try:
+                    loops.append(asyncio.get_running_loop())
+                except RuntimeError:
+                    loops.append(None)
+                return function(*args)
+            return wrapper
+        
+        monkeypatch.setattr("app.async_routes.validate_batch", record(validate_batch))
+        monkeypatch.setattr("app.async_routes.build_batch_rows", record(build_batch_rows))
+        response = client.post("/calculations/batch", json=[{"a": 1, "b": 2, "type": "Add"}])
+        assert response.status_code == 200
+        assert loops == [None, None]
+    
+    def test_import_csv(self, client, monkeypatch):
+        """Test the async CSV import, across chunks"""
+        monkeypatch.setattr("app.csv_import.IMPORT_CHUNK_SIZE", 2)
+        response = client.post("/calculations/import", files={"file": (
+            "calculations.csv", b"a,b,type\n1,2,Add\n3,4,Multiply\n1,0,Divide\n5,5,Subtract\n", "text/csv"
+        )})
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["imported"], data["rejected"]) == (3, 1)
+        assert [calc["result"] for calc in client.get("/calculations").json()] == [3, 12, 0]
+        
+        response = client.post("/calculations/import", files={"file": ("bad.csv", b"x,y\n1,2\n", "text/csv")})
+        assert response.status_code == 400
+    
+    def test_evaluate_expression(self, client):
+        """Test the async expression endpoint"""
+        response = client.post("/calculations/expression", json={
+            "expression": "x / y",
+            "bindings": [{"x": 6, "y": 3}, {"x": 1, "y": 0}]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"] == [2, None]
+        assert [error["index"] for error in data["errors"]] == [1]
+    
+    def test_stats_with_rollups(self, client, monkeypatch):
+        """Test that the async routes maintain and read the rollups"""
+        monkeypatch.setattr("app.stats.ROLLUPS_ENABLED", True)
+        client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"})
+        calc_id = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add"}).json()["id"]
+        client.put(f"/calculations/{calc_id}", json={"type": "Multiply"})
+        
+        live = client.get("/calculations/stats?source=live").json()
+        rollup = client.get("/calculations/stats?source=rollup").json()
+        assert rollup["groups"] == live["groups"]
+        assert [(g["type"], g["count"]) for g in rollup["groups"]] == [("Add", 1), ("Multiply", 1)]
+
+class TestUseAsyncRoutes:
+    """Test swapping the sync routes for the async ones"""
+    
+    def test_routes_are_replaced_in_place(self):
+        """Test that every async route replaces its sync counterpart"""
+        swapped = FastAPI()
+        swapped.router.routes = list(sync_app.router.routes)
+        use_async_routes(swapped)
+        
+        endpoints = {
+            (route.path, tuple(sorted(route.methods))): route.endpoint
+            for route in swapped.routes if hasattr(route, "methods")
+        }
+        for route in router.routes:
+            assert endpoints[(route.path, tuple(sorted(route.methods)))] is route.endpoint
+        assert [route.path for route in swapped.routes] == [route.path for route in sync_app.routes]
+    
+    def test_every_data_route_has_an_async_version(self):
+        """Test that no user or calculation route falls back to the sync handler in async mode"""
+        async_routes = {(route.path, frozenset(route.methods)) for route in router.routes}
+        sync_routes = {
+            (route.path, frozenset(route.methods))
+            for route in sync_app.routes
+            if hasattr(route, "methods") and route.path.startswith(("/users", "/calculations"))
+        }
+        assert sync_routes <= async_routes
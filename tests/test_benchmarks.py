@@ -0,0 +1,70 @@
+import math
+import pytest
+from benchmarks.common import compare, load_baseline, percentile, save_baseline, summarize
+from benchmarks.load import scenarios, uncovered_routes
+from benchmarks.startup import launch_modes
+from app.main import app
+
+def result(p95_ms, ops_per_second):
+    """Build a minimal benchmark result"""
+    return {"p95_ms": p95_ms, "ops_per_second": ops_per_second}
+
+class TestStatistics:
+    """Test the latency statistics used by the benchmarks"""
+    
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles"""
+        samples = list(range(1, 101))
+        assert percentile(samples, 0.50) == 50
+        assert percentile(samples, 0.95) == 95
+        assert percentile(samples, 0.99) == 99
+        assert percentile([7], 0.99) == 7
+        assert math.isnan(percentile([], 0.5))
+    
+    def test_summarize(self):
+        """Test throughput and millisecond latencies"""
+        summary = summarize([0.001] * 10, elapsed=0.5, errors=1)
+        assert summary["count"] == 10
+        assert summary["errors"] == 1
+        assert summary["ops_per_second"] == 20
+        assert summary["p99_ms"] == pytest.approx(1.0)
+
+class TestBaselines:
+    """Test saving and comparing against baselines"""
+    
+    def test_compare_flags_regressions(self):
+        """Test that slowdowns beyond the threshold are reported"""
+        baseline = {"fast": result(1.0, 1000), "slow": result(1.0, 1000), "same": result(1.0, 1000)}
+        results = {
+            "fast": result(0.5, 2000),
+            "slow": result(1.5, 600),
+            "same": result(1.1, 950),
+            "new": result(9.0, 1),
+        }
+        regressions = compare(results, baseline, threshold=0.2)
+        assert len(regressions) == 2
+        assert all(message.startswith("slow:") for message in regressions)
+    
+    def test_save_and_load(self, tmp_path):
+        """Test that saved baselines round-trip"""
+        path = str(tmp_path / "baselines" / "micro.json")
+        assert load_baseline(path) is None
+        save_baseline(path, {"bench": result(1.0, 10)}, {"iterations": 5})
+        assert load_baseline(path) == {"bench": result(1.0, 10)}
+
+class TestLoadScenarios:
+    """Test the load test scenarios"""
+    
+    def test_every_route_has_a_scenario(self):
+        """Test that the load test drives every API route"""
+        assert uncovered_routes(app, scenarios(1, [1], [1], "run")) == []
+
+class TestStartupModes:
+    """Test the startup benchmark's launch modes"""
+    
+    def test_modes_listen_on_the_given_port(self):
+        """Test that every mode waits for its workers and takes the port per start"""
+        for mode in launch_modes(3):
+            arguments = " ".join(mode.command + list(mode.env.values()))
+            assert "{port}" in arguments
+            assert mode.workers == (1 if "1 worker" in mode.name else 3)
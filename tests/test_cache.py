@@ -0,0 +1,178 @@
+import fnmatch
+import pytest
+from app.cache import LocalCache, RedisCache, cache_from_env, cache_key
+from app.factory import (
+    CalculationFactory,
+    Operation,
+    get_result_cache,
+    perform_calculation,
+    set_result_cache
+)
+
+class FakeClock:
+    """Manually advanced clock for TTL tests"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+class FakeRedis:
+    """Minimal in-memory stand-in for a Redis client"""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+@pytest.fixture
+def local_cache():
+    """Install a local result cache for the duration of a test"""
+    previous = get_result_cache()
+    cache = LocalCache(max_size=100, ttl=60)
+    set_result_cache(cache)
+    yield cache
+    set_result_cache(previous)
+
+class TestLocalCache:
+    """Test the in-process LRU + TTL cache"""
+    
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted"""
+        cache = LocalCache()
+        assert cache.get("k") is None
+        cache.set("k", 1.5)
+        assert cache.get("k") == 1.5
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["size"] == 1
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = LocalCache(max_size=2, ttl=0)
+        cache.set("a", 1.0)
+        cache.set("b", 2.0)
+        cache.get("a")
+        cache.set("c", 3.0)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1.0
+        assert cache.get("c") == 3.0
+        assert cache.evictions == 1
+    
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL"""
+        clock = FakeClock()
+        cache = LocalCache(ttl=10, clock=clock)
+        cache.set("k", 1.0)
+        clock.now = 9.9
+        assert cache.get("k") == 1.0
+        clock.now = 10.0
+        assert cache.get("k") is None
+        assert cache.evictions == 1
+    
+    def test_signed_zero_keys(self):
+        """Test that 0.0 and -0.0 get different keys"""
+        assert cache_key(0.0, 5, "Multiply") != cache_key(-0.0, 5, "Multiply")
+
+class TestRedisCache:
+    """Test the Redis-compatible backend against a fake client"""
+    
+    def test_round_trip(self):
+        """Test storing and reading values through the client"""
+        client = FakeRedis()
+        cache = RedisCache(client, prefix="test:")
+        cache.set("k", 0.1)
+        assert client.data == {"test:k": b"0.1"}
+        assert cache.get("k") == 0.1
+        assert cache.get("missing") is None
+        assert cache.stats()["hits"] == 1
+        cache.clear()
+        assert client.data == {}
+
+class TestCacheFromEnv:
+    """Test cache configuration from the environment"""
+    
+    def test_off_by_default(self, monkeypatch):
+        """Test that caching is disabled by default"""
+        monkeypatch.delenv("CALCULATION_CACHE", raising=False)
+        assert cache_from_env() is None
+    
+    def test_local(self, monkeypatch):
+        """Test configuring the local cache"""
+        monkeypatch.setenv("CALCULATION_CACHE", "local")
+        monkeypatch.setenv("CALCULATION_CACHE_MAX_SIZE", "5")
+        monkeypatch.setenv("CALCULATION_CACHE_TTL", "1")
+        cache = cache_from_env()
+        assert isinstance(cache, LocalCache)
+        assert cache.max_size == 5
+        assert cache.ttl == 1
+    
+    def test_unknown_backend(self, monkeypatch):
+        """Test that unknown backends are rejected"""
+        monkeypatch.setenv("CALCULATION_CACHE", "memcached")
+        with pytest.raises(ValueError, match="Unsupported calculation cache"):
+            cache_from_env()
+
+class TestCachedPerformCalculation:
+    """Test perform_calculation with a result cache installed"""
+    
+    def test_repeated_calculation_hits_cache(self, local_cache):
+        """Test that repeated triples are served from the cache"""
+        assert perform_calculation(10, 5, "Add") == 15
+        assert perform_calculation(10, 5, "Add") == 15
+        assert perform_calculation(10, 5, "Multiply") == 50
+        stats = local_cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+    
+    def test_errors_are_not_cached(self, local_cache):
+        """Test that failing calculations raise every time"""
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Division by zero"):
+                perform_calculation(10, 0, "Divide")
+        assert local_cache.stats()["size"] == 0
+    
+    def test_impure_operations_bypass_cache(self, local_cache, monkeypatch):
+        """Test that operations declaring pure = False are never cached"""
+        class CounterOperation(Operation):
+            pure = False
+            calls = 0
+            def calculate(self, a: float, b: float) -> float:
+                CounterOperation.calls += 1
+                return float(CounterOperation.calls)
+            def get_operation_name(self) -> str:
+                return "Counter"
+        
+        monkeypatch.setattr(CalculationFactory, "_operations", dict(CalculationFactory._operations))
+        CalculationFactory.register_operation("Counter", CounterOperation)
+        assert perform_calculation(1, 1, "Counter") == 1
+        assert perform_calculation(1, 1, "Counter") == 2
+        assert local_cache.stats()["hits"] == 0
+        assert local_cache.stats()["misses"] == 0
+    
+    def test_reregistered_operation_is_not_served_stale(self, local_cache, monkeypatch):
+        """Test that results cached for a replaced operation class are not returned"""
+        class OffsetAddOperation(Operation):
+            def calculate(self, a: float, b: float) -> float:
+                return a + b + 100
+            def get_operation_name(self) -> str:
+                return "Add"
+        
+        assert perform_calculation(2, 3, "Add") == 5
+        monkeypatch.setattr(CalculationFactory, "_operations", dict(CalculationFactory._operations))
+        CalculationFactory.register_operation("Add", OffsetAddOperation)
+        assert perform_calculation(2, 3, "Add") == 105
+        assert local_cache.stats()["hits"] == 0
@@ -0,0 +1,88 @@
+import math
+import numpy as np
+import pytest
+from app.expression import compile_expression
+from app.factory import CalculationFactory, Operation
+
+class PowerOperation(Operation):
+    """Exponentiation operation used to test custom operators"""
+    
+    def calculate(self, a: float, b: float) -> float:
+        return a ** b
+    
+    def get_operation_name(self) -> str:
+        return "Power"
+
+class TestCompileExpression:
+    """Test expression parsing and compilation"""
+    
+    def test_variables_in_order_of_appearance(self):
+        """Test that variables are collected once, in order"""
+        compiled = compile_expression("(y + x) * y")
+        assert compiled.variables == ("y", "x")
+    
+    def test_compiles_to_postfix(self):
+        """Test that operators map to the registered operations"""
+        compiled = compile_expression("a - 2 / b")
+        assert compiled.instructions == (
+            ("load", "a"), ("const", 2.0), ("load", "b"),
+            ("apply", "Divide"), ("apply", "Subtract")
+        )
+    
+    def test_compiled_expressions_are_cached(self):
+        """Test that the same text reuses the compiled program"""
+        assert compile_expression("x * 3") is compile_expression("x * 3")
+    
+    @pytest.mark.parametrize("expression", [
+        "x +",
+        "x ** 2",
+        "__import__('os')",
+        "x.y",
+        "Unknown(x, y)",
+        "Add(x)",
+        "'text'",
+        "x " * 600,
+    ])
+    def test_invalid_expressions(self, expression):
+        """Test that malformed or unsupported expressions raise ValueError"""
+        with pytest.raises(ValueError):
+            compile_expression(expression)
+
+class TestEvaluateExpression:
+    """Test evaluating compiled expressions"""
+    
+    def test_evaluate_many_bindings(self):
+        """Test vectorized evaluation over several bindings"""
+        compiled = compile_expression("Divide(x + y, 2) * -z")
+        results, errors = compiled.evaluate([{"x": 1, "y": 3, "z": 10}, {"x": 2, "y": 4, "z": -1}])
+        assert results.tolist() == [-20.0, 3.0]
+        assert not errors.any()
+    
+    def test_errors_are_flagged(self):
+        """Test that failing bindings are flagged with a NaN result"""
+        compiled = compile_expression("1 / x + 1")
+        results, errors = compiled.evaluate([{"x": 2}, {"x": 0}])
+        assert results[0] == 1.5
+        assert math.isnan(results[1])
+        assert errors.tolist() == [False, True]
+    
+    def test_evaluate_matches_scalar_path(self):
+        """Test that the vectorized and scalar evaluations agree"""
+        compiled = compile_expression("(a - b) * (a + b) / 4")
+        bindings = [{"a": float(a), "b": float(b)} for a, b in zip(range(10), range(10, 20))]
+        results, _ = compiled.evaluate(bindings)
+        assert np.allclose(results, [compiled.evaluate_one(binding) for binding in bindings])
+    
+    def test_missing_variable(self):
+        """Test that a binding without every variable raises ValueError"""
+        with pytest.raises(ValueError, match="missing variables: y"):
+            compile_expression("x + y").evaluate([{"x": 1}])
+    
+    def test_custom_operation(self, monkeypatch):
+        """Test that registered operations are callable from expressions"""
+        monkeypatch.setattr(CalculationFactory, "_operations", dict(CalculationFactory._operations))
+        CalculationFactory.register_operation("Power", PowerOperation)
+        
+        results, errors = compile_expression("Power(x, 2) + 1").evaluate([{"x": 3}, {"x": -2}])
+        assert results.tolist() == [10.0, 5.0]
+        assert not errors.any()
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from app.factory import (
     CalculationFactory,
@@ -6,6 +7,7 @@ from app.factory import (
     MultiplyOperation,
     DivideOperation,
     perform_calculation,
+    perform_calculations,
     Operation
 )
 
@@ -108,6 +110,33 @@ class TestCalculationFactory:
         op = CalculationFactory.create_operation("Power")
         assert isinstance(op, PowerOperation)
         assert op.calculate(2, 3) == 8
+    
+    def test_get_operation_returns_shared_instance(self):
+        """Test that the dispatch table reuses one instance per type"""
+        op = CalculationFactory.get_operation("Multiply")
+        assert isinstance(op, MultiplyOperation)
+        assert CalculationFactory.get_operation("Multiply") is op
+    
+    def test_get_operation_invalid(self):
+        """Test that unknown types raise the same error as create_operation"""
+        with pytest.raises(ValueError, match="Unsupported operation type: Invalid"):
+            CalculationFactory.get_operation("Invalid")
+    
+    def test_register_operation_invalidates_dispatch(self, monkeypatch):
+        """Test that registering replaces the shared instance of a type"""
+        monkeypatch.setattr(CalculationFactory, "_operations", dict(CalculationFactory._operations))
+        old = CalculationFactory.get_operation("Add")
+        
+        class SaturatingAdd(AddOperation):
+            def calculate(self, a: float, b: float) -> float:
+                return min(a + b, 10)
+        
+        CalculationFactory.register_operation("Add", SaturatingAdd)
+        assert CalculationFactory.get_operation("Add") is not old
+        assert perform_calculation(8, 8, "Add") == 10
+        
+        monkeypatch.undo()
+        assert perform_calculation(8, 8, "Add") == 16
 
 class TestPerformCalculation:
     """Test the convenience function for performing calculations"""
@@ -156,3 +185,64 @@ class TestPerformCalculation:
         assert perform_calculation(10.5, 5.5, "Subtract") == 5.0
         assert perform_calculation(2.5, 4.0, "Multiply") == 10.0
         assert perform_calculation(7.5, 2.5, "Divide") == 3.0
+
+class TestPerformCalculations:
+    """Test the vectorized batch evaluation API"""
+    
+    def test_mixed_operation_types(self):
+        """Test that each element uses its own operation type"""
+        results, errors = perform_calculations(
+            [10, 10, 10, 10],
+            [5, 5, 5, 5],
+            ["Add", "Subtract", "Multiply", "Divide"]
+        )
+        assert results.tolist() == [15, 5, 50, 2]
+        assert not errors.any()
+    
+    def test_matches_scalar_path(self):
+        """Test that batch results match perform_calculation"""
+        a = [1.5, -2.25, 7.0, 3.3]
+        b = [0.1, 4.0, -3.5, 1.1]
+        types = ["Divide", "Multiply", "Subtract", "Add"]
+        results, _ = perform_calculations(a, b, types)
+        expected = [perform_calculation(x, y, t) for x, y, t in zip(a, b, types)]
+        assert results.tolist() == expected
+    
+    def test_division_by_zero_is_masked(self):
+        """Test that division by zero is flagged instead of raised"""
+        results, errors = perform_calculations([10, 10], [0, 2], ["Divide", "Divide"])
+        assert errors.tolist() == [True, False]
+        assert np.isnan(results[0])
+        assert results[1] == 5
+    
+    def test_empty_input(self):
+        """Test that empty inputs produce empty outputs"""
+        results, errors = perform_calculations([], [], [])
+        assert len(results) == 0
+        assert len(errors) == 0
+    
+    def test_length_mismatch(self):
+        """Test that inputs of different lengths are rejected"""
+        with pytest.raises(ValueError, match="same length"):
+            perform_calculations([1, 2], [1], ["Add", "Add"])
+    
+    def test_invalid_operation(self):
+        """Test invalid operation raises error"""
+        with pytest.raises(ValueError, match="Unsupported operation type"):
+            perform_calculations([1], [1], ["InvalidOp"])
+    
+    def test_registered_operation_scalar_fallback(self, monkeypatch):
+        """Test that operations without a vectorized kernel fall back to calculate()"""
+        class ModuloOperation(Operation):
+            def calculate(self, a: float, b: float) -> float:
+                if b == 0:
+                    raise ValueError("Modulo by zero is not allowed")
+                return a % b
+            def get_operation_name(self) -> str:
+                return "Modulo"
+        
+        monkeypatch.setattr(CalculationFactory, "_operations", dict(CalculationFactory._operations))
+        CalculationFactory.register_operation("Modulo", ModuloOperation)
+        results, errors = perform_calculations([7, 7], [3, 0], ["Modulo", "Modulo"])
+        assert results[0] == 1
+        assert errors.tolist() == [False, True]
@@ -0,0 +1,154 @@
+import csv
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.etags import user_collection_version
+from app.handlers import apply_changes, delete_calculation_row
+from app.ingest import IngestQueueFull, InvalidRow, UnknownUser, WriteBehindWriter
+from app.models import Calculation, User
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_ingest.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(scope="function")
+def test_db():
+    """Create test database tables"""
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def writer(test_db):
+    """Create a writer on the test database and stop it afterwards"""
+    writer = WriteBehindWriter(TestingSessionLocal, max_queue=100, batch_size=10, flush_interval=0.01, id_block_size=5)
+    yield writer
+    writer.shutdown()
+
+def stored_ids():
+    """Return the ids of every stored calculation"""
+    with TestingSessionLocal() as db:
+        return list(db.scalars(select(Calculation.id).order_by(Calculation.id)))
+
+class TestWriteBehindWriter:
+    """Test buffered calculation ingestion"""
+    
+    def test_rows_are_written_in_batches(self, writer):
+        """Test that queued rows are written and keep their reserved ids"""
+        rows = [writer.submit(i, 2, "Add", i + 2, None) for i in range(25)]
+        writer.flush()
+        
+        assert stored_ids() == [row["id"] for row in rows]
+        stats = writer.stats()
+        assert stats["flushed"] == 25
+        assert stats["queue_depth"] == 0
+        assert stats["batch_rows"]["count"] >= 3
+    
+    def test_reserved_ids_do_not_collide_with_direct_inserts(self, writer):
+        """Test that direct inserts skip ids reserved for queued rows"""
+        queued = writer.submit(1, 2, "Add", 3, None)
+        with TestingSessionLocal() as db:
+            direct = db.execute(
+                insert(Calculation).values(a=1, b=1, type="Add", result=2).returning(Calculation.id)
+            ).scalar_one()
+            db.commit()
+        writer.flush()
+        
+        assert direct > queued["id"] + 4
+        assert len(stored_ids()) == 2
+    
+    def test_unknown_user(self, writer):
+        """Test that rows for a missing user are rejected up front"""
+        with pytest.raises(UnknownUser):
+            writer.submit(1, 2, "Add", 3, 9999)
+    
+    def test_invalid_rows_are_rejected_up_front(self, writer):
+        """Test that rows violating a column constraint are never accepted"""
+        with pytest.raises(InvalidRow):
+            writer.submit(1, None, "Add", None, None)
+        with pytest.raises(InvalidRow):
+            writer.submit(float("nan"), 2, "Add", float("nan"), None)
+        assert writer.stats()["enqueued"] == 0
+    
+    def test_failed_rows_go_to_the_dead_letter_file(self, writer, tmp_path, monkeypatch):
+        """Test that rows the database rejects are counted and kept for replay"""
+        writer.dead_letter_path = str(tmp_path / "dead.csv")
+        
+        def unreachable(rows):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+        
+        monkeypatch.setattr(writer, "_write", unreachable)
+        rows = [writer.submit(i, 2, "Add", i + 2, None) for i in range(3)]
+        writer.flush()
+        
+        assert writer.stats()["dropped"] == 3
+        with open(tmp_path / "dead.csv", newline="") as file:
+            dead = list(csv.DictReader(file))
+        assert [int(row["id"]) for row in dead] == [row["id"] for row in rows]
+        assert "connection refused" in dead[0]["error"]
+    
+    def test_backpressure(self, writer, monkeypatch):
+        """Test that submissions are rejected once the queue is full"""
+        monkeypatch.setattr(writer, "_start", lambda: None)
+        writer.max_queue = 2
+        writer.submit(1, 2, "Add", 3, None)
+        writer.submit(1, 2, "Add", 3, None)
+        with pytest.raises(IngestQueueFull):
+            writer.submit(1, 2, "Add", 3, None)
+        assert writer.stats()["rejected"] == 1
+    
+    def test_shutdown_writes_queued_rows(self, test_db):
+        """Test that shutdown flushes rows still waiting for their batch"""
+        writer = WriteBehindWriter(TestingSessionLocal, batch_size=1000, flush_interval=60)
+        for i in range(3):
+            writer.submit(i, 1, "Multiply", i, None)
+        writer.shutdown()
+        assert len(stored_ids()) == 3
+    
+    def test_failed_row_does_not_lose_batch(self, writer):
+        """Test that a batch with one bad row falls back to row-by-row writes"""
+        good = writer.submit(1, 2, "Add", 3, None)
+        writer.flush()
+        duplicate = dict(good)
+        fresh = {**good, "id": writer.ids.next_id()}
+        
+        writer._flush([duplicate, fresh])
+        
+        assert stored_ids() == [good["id"], fresh["id"]]
+        assert writer.stats()["dropped"] == 1
+    
+    def test_flush_stops_sharing_lookups(self, writer, monkeypatch):
+        """Test that flushed ids are dropped from in-flight single-flight lookups, like any other write"""
+        forgotten = []
+        monkeypatch.setattr("app.handlers.forget_calculations", lambda ids: forgotten.extend(ids))
+        rows = [writer.submit(i, 2, "Add", i + 2, None) for i in range(3)]
+        writer.flush()
+        assert sorted(forgotten) == [row["id"] for row in rows]
+    
+    def test_flushed_rows_change_the_collection_version(self, writer):
+        """Test that a flush with a reserved id below newer rows still changes the user's list ETag"""
+        with TestingSessionLocal() as db:
+            user_id = db.execute(
+                insert(User).values(username="writer", email="writer@example.com", hashed_password="x")
+                .returning(User.id)
+            ).scalar_one()
+            db.commit()
+        queued = writer.submit(1, 2, "Add", 3, user_id)
+        with TestingSessionLocal() as db:
+            direct = db.scalars(
+                insert(Calculation).returning(Calculation.id),
+                [{"a": 1, "b": 1, "type": "Add", "result": 2, "user_id": user_id} for _ in range(2)]
+            ).all()
+            db.commit()
+            before = user_collection_version(db, user_id)
+        assert queued["id"] < min(direct)
+        
+        # Same count, highest id and sum of versions as before
+        writer.flush()
+        with TestingSessionLocal() as db:
+            deleted = db.execute(delete_calculation_row(direct[0])).first()
+            apply_changes(db, removed=[deleted])
+            db.commit()
+            assert user_collection_version(db, user_id) == before + 2
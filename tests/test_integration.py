@@ -1,10 +1,20 @@
+import csv
+import io
+import json
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.database import Base, get_db
+from app.batch import build_batch_rows
+from app.handlers import is_foreign_key_violation
 from app.models import User, Calculation
+from app.cache import LocalCache
+from app.ingest import WriteBehindWriter
+from app.singleflight import SingleFlight
+from app.stats import rebuild_rollups
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -50,6 +60,50 @@ class TestRootEndpoints:
         response = client.get("/health")
         assert response.status_code == 200
         assert response.json() == {"status": "healthy"}
+    
+    def test_pool_health(self, client):
+        """Test connection pool statistics endpoint"""
+        response = client.get("/health/pool")
+        assert response.status_code == 200
+        data = response.json()
+        assert "checked_out" in data["sync"]
+        assert "checkout_wait_seconds" in data["sync"]
+    
+    def test_hashing_health(self, client):
+        """Test password hashing pool statistics endpoint"""
+        response = client.get("/health/hashing")
+        assert response.status_code == 200
+        data = response.json()
+        assert "queue_depth" in data
+        assert "max_workers" in data
+    
+    def test_metrics(self, client):
+        """Test the Prometheus metrics endpoint"""
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add"})
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_requests_total{method="POST",route="/calculations",status="201"}' in response.text
+        assert "# TYPE db_query_duration_seconds histogram" in response.text
+        assert "password_hash_seconds_count" in response.text
+    
+    def test_single_flight_metrics(self, client, monkeypatch):
+        """Test that detail lookups are counted as executed or coalesced"""
+        monkeypatch.setattr("app.singleflight._lookups", SingleFlight())
+        calculation_id = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add"}).json()["id"]
+        assert client.get(f"/calculations/{calculation_id}").json()["result"] == 3
+        assert client.get("/calculations/999").status_code == 404
+        
+        assert client.get("/health/cache").json()["single_flight"]["lookups"] == {
+            "calculation": {"executed": 2, "coalesced": 0}
+        }
+        assert 'single_flight_lookups_total{lookup="calculation",outcome="executed"} 2' in client.get("/metrics").text
+    
+    def test_cache_health(self, client):
+        """Test result cache statistics endpoint"""
+        response = client.get("/health/cache")
+        assert response.status_code == 200
+        assert "enabled" in response.json()
 
 class TestUserEndpoints:
     """Test user CRUD endpoints"""
@@ -242,6 +296,26 @@ class TestCalculationEndpoints:
         }
         response = client.post("/calculations", json=calc_data)
         assert response.status_code == 404
+        assert response.json()["detail"] == "User with id 9999 not found"
+    
+    def test_create_calculation_other_integrity_error(self, client, monkeypatch):
+        """Test that integrity errors other than the user_id foreign key are not reported as 404"""
+        monkeypatch.setattr(
+            "app.main.insert_calculation",
+            lambda calculation, result: insert(Calculation).values(a=calculation.a, b=calculation.b, type=None)
+        )
+        with pytest.raises(IntegrityError, match="NOT NULL"):
+            client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"})
+    
+    def test_foreign_key_violation_detection(self):
+        """Test telling foreign key violations apart on PostgreSQL drivers"""
+        class DriverError(Exception):
+            def __init__(self, code):
+                super().__init__("violation")
+                self.pgcode = code
+        
+        assert is_foreign_key_violation(IntegrityError("INSERT", {}, DriverError("23503")))
+        assert not is_foreign_key_violation(IntegrityError("INSERT", {}, DriverError("23514")))
     
     def test_list_calculations(self, client):
         """Test listing calculations"""
@@ -259,6 +333,17 @@ class TestCalculationEndpoints:
         data = response.json()
         assert len(data) == 2
     
+    def test_list_calculations_matches_detail(self, client):
+        """Test that listed rows encode exactly like the CalculationRead detail response"""
+        created = client.post("/calculations", json={"a": 7, "b": 2, "type": "Divide"}).json()
+        client.post("/calculations", json={"a": 1.5, "b": 2, "type": "Multiply"})
+        
+        response = client.get("/calculations")
+        assert response.headers["content-type"] == "application/json"
+        listed = response.json()
+        assert listed[0] == client.get(f"/calculations/{created['id']}").json()
+        assert listed[1]["a"] == 1.5
+    
     def test_list_calculations_by_user(self, client):
         """Test listing calculations filtered by user"""
         # Create user
@@ -394,3 +479,642 @@ class TestCalculationWithFloats:
         })
         assert response.status_code == 201
         assert response.json()["result"] == 3.0
+
+class TestCalculationBatch:
+    """Test the batch calculation endpoint"""
+    
+    def test_batch_create(self, client):
+        """Test creating several calculations in one request"""
+        items = [
+            {"a": 10, "b": 5, "type": "Add"},
+            {"a": 10, "b": 5, "type": "Multiply"},
+            {"a": 9, "b": 3, "type": "Divide"}
+        ]
+        response = client.post("/calculations/batch", json=items)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["errors"] == []
+        assert [calc["result"] for calc in data["created"]] == [15, 50, 3]
+        
+        list_response = client.get("/calculations")
+        assert len(list_response.json()) == 3
+    
+    def test_batch_reports_item_errors(self, client):
+        """Test that invalid items are reported without aborting the batch"""
+        user_response = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        })
+        user_id = user_response.json()["id"]
+        
+        items = [
+            {"a": 10, "b": 0, "type": "Divide"},
+            {"a": 1, "b": 2, "type": "Add", "user_id": user_id},
+            {"a": 1, "b": 2, "type": "InvalidType"},
+            {"a": 1, "b": 2, "type": "Add", "user_id": 9999},
+            {"a": "nan", "b": 2, "type": "Add"}
+        ]
+        response = client.post("/calculations/batch", json=items)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["created"]) == 1
+        assert data["created"][0]["user_id"] == user_id
+        assert [error["index"] for error in data["errors"]] == [0, 2, 3, 4]
+        assert "Division by zero" in data["errors"][0]["detail"]
+        assert "not found" in data["errors"][2]["detail"]
+        assert "finite number" in data["errors"][3]["detail"]
+    
+    def test_batch_user_deleted_before_insert(self, client, monkeypatch):
+        """Test that a user deleted between the user check and the INSERT gives 404, not 500"""
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        
+        def build_rows_after_delete(valid, known_user_ids, errors):
+            with TestingSessionLocal() as db:
+                db.query(User).filter(User.id == user_id).delete()
+                db.commit()
+            return build_batch_rows(valid, known_user_ids, errors)
+        
+        monkeypatch.setattr("app.main.build_batch_rows", build_rows_after_delete)
+        response = client.post("/calculations/batch", json=[{"a": 1, "b": 2, "type": "Add", "user_id": user_id}])
+        assert response.status_code == 404
+        assert client.get("/calculations").json() == []
+    
+    def test_batch_empty(self, client):
+        """Test that an empty batch is accepted"""
+        response = client.post("/calculations/batch", json=[])
+        assert response.status_code == 200
+        assert response.json() == {"created": [], "errors": []}
+
+class TestCalculationImport:
+    """Test the CSV import endpoint"""
+    
+    def upload(self, client, text):
+        return client.post("/calculations/import", files={"file": ("calculations.csv", text.encode(), "text/csv")})
+    
+    def test_import_csv(self, client):
+        """Test importing rows, with optional columns and ignored extra columns"""
+        user_response = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        })
+        user_id = user_response.json()["id"]
+        
+        response = self.upload(client, (
+            "id,a,b,type,result,user_id,created_at\n"
+            "99,10,5,Add,0,,2024-01-02T03:04:05\n"
+            f"100,3,4,Multiply,0,{user_id},\n"
+        ))
+        assert response.status_code == 200
+        assert response.json() == {
+            "imported": 2, "rejected": 0, "errors": [], "errors_truncated": False,
+            "committed_line": 3, "failed": None
+        }
+        
+        calculations = client.get("/calculations").json()
+        assert [(calc["result"], calc["user_id"]) for calc in calculations] == [(15, None), (12, user_id)]
+        assert calculations[0]["created_at"].startswith("2024-01-02T03:04:05")
+        assert client.get(f"/calculations?user_id={user_id}").json()[0]["result"] == 12
+    
+    def test_import_reports_rejected_lines(self, client):
+        """Test that bad lines are reported by line number and the rest imported"""
+        response = self.upload(client, (
+            "a,b,type,user_id\n"
+            "1,2,Add,\n"
+            "10,0,Divide,\n"
+            "x,2,Add,\n"
+            "1,2,InvalidType,\n"
+            "1,2,Add,9999\n"
+            "inf,2,Add,\n"
+            "2,2,Subtract,\n"
+        ))
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["imported"], data["rejected"]) == (2, 5)
+        details = {error["line"]: error["detail"] for error in data["errors"]}
+        assert sorted(details) == [3, 4, 5, 6, 7]
+        assert "Division by zero" in details[3]
+        assert "not found" in details[6]
+        assert "finite number" in details[7]
+        assert [calc["result"] for calc in client.get("/calculations").json()] == [3, 0]
+    
+    def test_import_in_chunks(self, client, monkeypatch):
+        """Test that files larger than one chunk are imported completely"""
+        monkeypatch.setattr("app.csv_import.IMPORT_CHUNK_SIZE", 3)
+        monkeypatch.setattr("app.csv_import.MAX_REPORTED_ERRORS", 2)
+        lines = "".join(f"{i},{i % 3},Divide\n" for i in range(1, 11))
+        response = self.upload(client, "a,b,type\n" + lines)
+        data = response.json()
+        assert (data["imported"], data["rejected"]) == (7, 3)
+        assert [error["line"] for error in data["errors"]] == [4, 7]
+        assert data["errors_truncated"] is True
+        assert len(client.get("/calculations?limit=100").json()) == 7
+    
+    def test_import_rejects_bad_files(self, client):
+        """Test that a missing column or non-UTF-8 content is a client error"""
+        response = self.upload(client, "a,b\n1,2\n")
+        assert response.status_code == 400
+        assert "type" in response.json()["detail"]
+        
+        response = client.post("/calculations/import", files={"file": ("data.csv", b"a,b,type\n\xff,1,Add\n")})
+        assert response.status_code == 400
+
+    def test_import_stops_part_way(self, client, monkeypatch):
+        """Test that an unreadable line after stored chunks returns the partial result"""
+        monkeypatch.setattr("app.csv_import.IMPORT_CHUNK_SIZE", 1000)
+        # Past the first decoded block, so earlier chunks are stored first
+        lines = "1,2,Add\n" * 3000
+        response = client.post(
+            "/calculations/import",
+            files={"file": ("data.csv", b"a,b,type\n" + lines.encode() + b"\xff,1,Add\n")}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == data["committed_line"] - 1
+        assert data["imported"] in (1000, 2000, 3000)
+        assert data["failed"]["line"] > data["committed_line"]
+        assert "UTF-8" in data["failed"]["detail"]
+        assert client.get("/calculations/stats").json()["groups"][0]["count"] == data["imported"]
+
+class TestPagination:
+    """Test keyset and skip/limit pagination"""
+    
+    def test_cursor_pages_through_calculations(self, client):
+        """Test following X-Next-Cursor until the last page"""
+        for i in range(5):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        
+        seen = []
+        response = client.get("/calculations?limit=2")
+        while True:
+            assert response.status_code == 200
+            seen.extend(calc["a"] for calc in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            response = client.get(f"/calculations?limit=2&cursor={cursor}")
+        
+        assert seen == [0, 1, 2, 3, 4]
+    
+    def test_cursor_with_user_filter(self, client):
+        """Test that the cursor respects the user_id filter"""
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        for i in range(3):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add", "user_id": user_id})
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        
+        first = client.get(f"/calculations?user_id={user_id}&limit=2")
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get(f"/calculations?user_id={user_id}&limit=2&cursor={cursor}")
+        assert [calc["a"] for calc in first.json() + second.json()] == [0, 1, 2]
+        assert "X-Next-Cursor" not in second.headers
+    
+    def test_cursor_pages_through_users(self, client):
+        """Test cursor pagination for users"""
+        for i in range(3):
+            client.post("/users", json={
+                "username": f"user{i}",
+                "email": f"user{i}@test.com",
+                "password": "pass123456"
+            })
+        first = client.get("/users?limit=2")
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get(f"/users?limit=2&cursor={cursor}")
+        names = [user["username"] for user in first.json() + second.json()]
+        assert names == ["user0", "user1", "user2"]
+    
+    def test_skip_limit_compatibility(self, client):
+        """Test that skip/limit paging still works"""
+        for i in range(3):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        response = client.get("/calculations?skip=1&limit=1")
+        assert [calc["a"] for calc in response.json()] == [1]
+    
+    def test_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected"""
+        response = client.get("/calculations?cursor=not-a-cursor")
+        assert response.status_code == 400
+    
+    def test_cursor_with_skip(self, client):
+        """Test that cursor and skip cannot be combined"""
+        for i in range(2):
+            client.post("/calculations", json={"a": i, "b": 1, "type": "Add"})
+        cursor = client.get("/calculations?limit=1").headers["X-Next-Cursor"]
+        response = client.get(f"/calculations?skip=1&cursor={cursor}")
+        assert response.status_code == 400
+
+class TestCalculationExport:
+    """Test the streaming export endpoint"""
+    
+    def test_export_ndjson(self, client):
+        """Test exporting calculations as NDJSON"""
+        client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"})
+        client.post("/calculations", json={"a": 10, "b": 5, "type": "Multiply"})
+        
+        response = client.get("/calculations/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["result"] for line in lines] == [15, 50]
+        assert set(lines[0]) == {"id", "a", "b", "type", "result", "created_at", "user_id"}
+    
+    def test_export_csv(self, client):
+        """Test exporting calculations as CSV"""
+        client.post("/calculations", json={"a": 7.5, "b": 2.5, "type": "Divide"})
+        
+        response = client.get("/calculations/export?format=csv")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 1
+        assert rows[0]["type"] == "Divide"
+        assert float(rows[0]["result"]) == 3.0
+        assert rows[0]["user_id"] == ""
+    
+    def test_export_filters(self, client):
+        """Test that the export applies the user and time filters"""
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        created = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id}).json()
+        client.post("/calculations", json={"a": 3, "b": 4, "type": "Add"})
+        
+        response = client.get(f"/calculations/export?user_id={user_id}")
+        lines = response.text.splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["id"] == created["id"]
+        
+        response = client.get("/calculations/export", params={"created_after": "2999-01-01T00:00:00"})
+        assert response.text == ""
+    
+    def test_export_invalid_format(self, client):
+        """Test that unknown formats are rejected"""
+        response = client.get("/calculations/export?format=xml")
+        assert response.status_code == 422
+
+class TestWriteRoundTrips:
+    """Test that the write paths use a single statement"""
+    
+    @pytest.fixture
+    def statements(self):
+        """Record the SQL statements executed on the test engine"""
+        executed = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        yield executed
+        event.remove(engine, "before_cursor_execute", record)
+    
+    def test_create_calculation_single_statement(self, client, statements):
+        """Test that creating a calculation is one INSERT ... RETURNING"""
+        response = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"})
+        assert response.status_code == 201
+        assert response.json()["created_at"]
+        assert len(statements) == 1
+        assert "RETURNING" in statements[0]
+    
+    def test_create_user_single_statement(self, client, statements):
+        """Test that creating a user is one INSERT ... RETURNING"""
+        response = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpassword123"
+        })
+        assert response.status_code == 201
+        assert len(statements) == 1
+    
+    def test_full_update_single_statement(self, client, statements):
+        """Test that an update providing every field is one UPDATE ... RETURNING"""
+        calc_id = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"}).json()["id"]
+        statements.clear()
+        response = client.put(f"/calculations/{calc_id}", json={"a": 2, "b": 3, "type": "Multiply"})
+        assert response.status_code == 200
+        assert response.json()["result"] == 6
+        assert len(statements) == 1
+    
+    def test_delete_single_statement(self, client, statements):
+        """Test that deleting is one DELETE ... RETURNING"""
+        calc_id = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"}).json()["id"]
+        statements.clear()
+        assert client.delete(f"/calculations/{calc_id}").status_code == 204
+        assert len(statements) == 1
+    
+    def test_duplicate_email_detected_by_constraint(self, client):
+        """Test that a duplicate email alone is rejected"""
+        client.post("/users", json={
+            "username": "first",
+            "email": "test@example.com",
+            "password": "testpassword123"
+        })
+        response = client.post("/users", json={
+            "username": "second",
+            "email": "test@example.com",
+            "password": "testpassword123"
+        })
+        assert response.status_code == 400
+        assert "already registered" in response.json()["detail"]
+    
+    def test_update_nonexistent_calculation(self, client):
+        """Test updating a missing calculation with every field provided"""
+        response = client.put("/calculations/9999", json={"a": 1, "b": 2, "type": "Add"})
+        assert response.status_code == 404
+
+class TestConditionalRequests:
+    """Test ETag / If-None-Match on calculation reads"""
+    
+    @pytest.fixture
+    def user_id(self, client):
+        return client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+    
+    @pytest.fixture
+    def version_map(self, monkeypatch):
+        """Install an in-memory version map that never expires"""
+        versions = LocalCache(ttl=0)
+        monkeypatch.setattr("app.etags._versions", versions)
+        return versions
+    
+    def test_detail_not_modified(self, client):
+        """Test that a matching ETag gets 304 with no body"""
+        calc_id = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"}).json()["id"]
+        response = client.get(f"/calculations/{calc_id}")
+        etag = response.headers["etag"]
+        
+        response = client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        
+        response = client.get(f"/calculations/{calc_id}", headers={"If-None-Match": f'"other", W/{etag}'})
+        assert response.status_code == 304
+    
+    def test_update_changes_etag(self, client):
+        """Test that an update bumps the version and invalidates the old ETag"""
+        calc_id = client.post("/calculations", json={"a": 10, "b": 5, "type": "Add"}).json()["id"]
+        etag = client.get(f"/calculations/{calc_id}").headers["etag"]
+        
+        new_etag = client.put(f"/calculations/{calc_id}", json={"type": "Multiply"}).headers["etag"]
+        assert new_etag != etag
+        
+        response = client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["result"] == 50
+        assert response.headers["etag"] == new_etag
+    
+    def test_missing_calculation_with_etag(self, client):
+        """Test that If-None-Match on a missing calculation is still a 404"""
+        response = client.get("/calculations/9999", headers={"If-None-Match": '"c9999.1"'})
+        assert response.status_code == 404
+    
+    def test_collection_etag_changes_on_writes(self, client, user_id):
+        """Test that creating, updating and deleting a user's calculation changes the list ETag"""
+        url = f"/calculations?user_id={user_id}"
+        calc_id = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id}).json()["id"]
+        etags = [client.get(url).headers["etag"]]
+        assert client.get(url, headers={"If-None-Match": etags[0]}).status_code == 304
+        
+        client.put(f"/calculations/{calc_id}", json={"a": 2})
+        etags.append(client.get(url).headers["etag"])
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id})
+        etags.append(client.get(url).headers["etag"])
+        client.delete(f"/calculations/{calc_id}")
+        etags.append(client.get(url).headers["etag"])
+        assert len(set(etags)) == 4
+        
+        # Other users' writes and other queries do not share the ETag
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add"})
+        assert client.get(url).headers["etag"] == etags[-1]
+        assert client.get(url + "&limit=1").headers["etag"] != etags[-1]
+        assert "etag" not in client.get("/calculations").headers
+    
+    def test_collection_etag_reads_the_user_version(self, client, user_id):
+        """Test that the list ETag comes from the user's version, not an aggregate over their calculations"""
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id})
+        list_etag = client.get(f"/calculations?user_id={user_id}").headers["etag"]
+        
+        executed = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            assert client.get(
+                f"/calculations?user_id={user_id}", headers={"If-None-Match": list_etag}
+            ).status_code == 304
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert len(executed) == 1
+        assert "FROM users" in executed[0]
+        assert "calculations" not in executed[0].replace("calculations_version", "")
+    
+    def test_version_map_skips_database(self, client, user_id, version_map):
+        """Test that 304s are served from the version map and writes invalidate it"""
+        calc_id = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id}).json()["id"]
+        etag = client.get(f"/calculations/{calc_id}").headers["etag"]
+        list_etag = client.get(f"/calculations?user_id={user_id}").headers["etag"]
+        
+        executed = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            executed.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            assert client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag}).status_code == 304
+            assert client.get(
+                f"/calculations?user_id={user_id}", headers={"If-None-Match": list_etag}
+            ).status_code == 304
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert executed == []
+        
+        client.put(f"/calculations/{calc_id}", json={"a": 5})
+        assert client.get(f"/calculations/{calc_id}", headers={"If-None-Match": etag}).status_code == 200
+        assert client.get(
+            f"/calculations?user_id={user_id}", headers={"If-None-Match": list_etag}
+        ).status_code == 200
+        assert client.get("/health/cache").json()["etag_versions"]["hits"] == 2
+
+class TestCalculationStats:
+    """Test the aggregate statistics endpoint"""
+    
+    @pytest.fixture
+    def rollups(self, monkeypatch):
+        """Enable the rollup table for the duration of a test"""
+        monkeypatch.setattr("app.stats.ROLLUPS_ENABLED", True)
+    
+    def create_calculations(self, client):
+        """Create calculations for two types and two owners"""
+        user_id = client.post("/users", json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "testpass123"
+        }).json()["id"]
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": user_id})
+        client.post("/calculations", json={"a": 3, "b": 4, "type": "Add"})
+        client.post("/calculations", json={"a": 2, "b": 5, "type": "Multiply", "user_id": user_id})
+        return user_id
+    
+    def test_stats_by_type(self, client):
+        """Test statistics grouped by type"""
+        self.create_calculations(client)
+        
+        response = client.get("/calculations/stats")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["source"] == "live"
+        assert data["group_by"] == ["type"]
+        add, multiply = data["groups"]
+        assert add["type"] == "Add"
+        assert (add["count"], add["sum"], add["min"], add["max"], add["avg"]) == (2, 10, 3, 7, 5)
+        assert multiply["type"] == "Multiply"
+        assert multiply["count"] == 1
+    
+    def test_stats_by_type_and_user(self, client):
+        """Test statistics grouped by type and user"""
+        user_id = self.create_calculations(client)
+        
+        response = client.get("/calculations/stats?group_by=type&group_by=user_id")
+        groups = [(g["type"], g["user_id"], g["count"]) for g in response.json()["groups"]]
+        assert sorted(groups, key=str) == sorted(
+            [("Add", None, 1), ("Add", user_id, 1), ("Multiply", user_id, 1)], key=str
+        )
+    
+    def test_stats_window(self, client):
+        """Test that the time window is applied"""
+        self.create_calculations(client)
+        
+        response = client.get("/calculations/stats", params={"created_after": "2999-01-01T00:00:00"})
+        assert response.json()["groups"] == []
+    
+    def test_rollup_source_requires_rollups(self, client):
+        """Test that the rollup source is rejected while rollups are disabled"""
+        response = client.get("/calculations/stats?source=rollup")
+        assert response.status_code == 400
+    
+    def test_rollups_match_live_stats(self, client, rollups):
+        """Test that the rollups track creates, batches, updates and deletes"""
+        user_id = self.create_calculations(client)
+        client.post("/calculations/batch", json=[
+            {"a": 10, "b": 2, "type": "Divide", "user_id": user_id},
+            {"a": -1, "b": 1, "type": "Add"},
+        ])
+        calc_id = client.post("/calculations", json={"a": 100, "b": 1, "type": "Add"}).json()["id"]
+        client.put(f"/calculations/{calc_id}", json={"type": "Subtract"})
+        client.put(f"/calculations/{calc_id}", json={"a": 50})
+        doomed = client.post("/calculations", json={"a": -9, "b": 0, "type": "Multiply"}).json()["id"]
+        client.delete(f"/calculations/{doomed}")
+        
+        for group_by in ("group_by=type", "group_by=user_id", "group_by=type&group_by=user_id"):
+            live = client.get(f"/calculations/stats?{group_by}&source=live").json()
+            rollup = client.get(f"/calculations/stats?{group_by}&source=rollup").json()
+            assert rollup["groups"] == live["groups"]
+        
+        assert client.get("/calculations/stats").json()["source"] == "rollup"
+        response = client.get("/calculations/stats", params={"created_after": "2000-01-01T00:30:00"})
+        assert response.json()["source"] == "live"
+    
+    def test_rebuild_rollups(self, client, rollups):
+        """Test that rebuilding the rollups reproduces the maintained buckets"""
+        self.create_calculations(client)
+        before = client.get("/calculations/stats?group_by=type&group_by=user_id&source=rollup").json()
+        
+        with TestingSessionLocal() as db:
+            rebuild_rollups(db)
+            db.commit()
+        
+        after = client.get("/calculations/stats?group_by=type&group_by=user_id&source=rollup").json()
+        assert after == before
+
+class TestExpressionEvaluation:
+    """Test the expression evaluation endpoint"""
+    
+    def test_evaluate_expression(self, client):
+        """Test evaluating an expression for several bindings"""
+        response = client.post("/calculations/expression", json={
+            "expression": "(x + y) * 2",
+            "bindings": [{"x": 1, "y": 2}, {"x": -1, "y": 0.5}]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["variables"] == ["x", "y"]
+        assert data["results"] == [6, -1]
+        assert data["errors"] == []
+    
+    def test_constant_expression(self, client):
+        """Test that bindings default to a single empty binding"""
+        response = client.post("/calculations/expression", json={"expression": "Multiply(3, 4) - 2"})
+        assert response.json()["results"] == [10]
+    
+    def test_per_binding_errors(self, client):
+        """Test that failing bindings are reported by index"""
+        response = client.post("/calculations/expression", json={
+            "expression": "x / y",
+            "bindings": [{"x": 1, "y": 2}, {"x": 1, "y": 0}]
+        })
+        data = response.json()
+        assert data["results"] == [0.5, None]
+        assert data["errors"] == [{"index": 1, "detail": "Division by zero is not allowed"}]
+    
+    def test_invalid_expression(self, client):
+        """Test that invalid expressions are rejected"""
+        response = client.post("/calculations/expression", json={"expression": "x +"})
+        assert response.status_code == 400
+        
+        response = client.post("/calculations/expression", json={"expression": "x + 1", "bindings": [{}]})
+        assert response.status_code == 400
+
+class TestWriteBehind:
+    """Test POST /calculations with write-behind ingestion enabled"""
+    
+    @pytest.fixture
+    def writer(self, test_db, monkeypatch):
+        """Install a write-behind writer on the test database"""
+        writer = WriteBehindWriter(TestingSessionLocal, flush_interval=0.01)
+        monkeypatch.setattr("app.ingest._writer", writer)
+        yield writer
+        writer.shutdown()
+    
+    def test_create_is_accepted_then_stored(self, client, writer):
+        """Test that the calculation is returned immediately and readable after a flush"""
+        response = client.post("/calculations", json={"a": 10, "b": 5, "type": "Multiply"})
+        assert response.status_code == 202
+        data = response.json()
+        assert data["result"] == 50
+        
+        writer.flush()
+        stored = client.get(f"/calculations/{data['id']}").json()
+        assert stored == data
+    
+    def test_unknown_user(self, client, writer):
+        """Test that an unknown user is still rejected"""
+        response = client.post("/calculations", json={"a": 1, "b": 2, "type": "Add", "user_id": 9999})
+        assert response.status_code == 404
+    
+    def test_ingest_health(self, client, writer):
+        """Test the write-behind statistics endpoint"""
+        client.post("/calculations", json={"a": 1, "b": 2, "type": "Add"})
+        writer.flush()
+        data = client.get("/health/ingest").json()
+        assert data["enabled"] is True
+        assert data["flushed"] == 1
+        metrics = client.get("/metrics").text
+        assert "write_behind_queue_depth 0" in metrics
+        assert 'write_behind_rows_total{outcome="dropped"} 0' in metrics
@@ -0,0 +1,91 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from app.database import instrument_engine
+from app.metrics import Histogram, RequestMetrics, RequestStats, render_histogram
+from app.middleware import MetricsMiddleware
+
+engine = create_engine("sqlite://")
+instrument_engine(engine)
+
+def make_client(metrics, server_timing=False):
+    """Create a client for a small app wrapped in the metrics middleware"""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics, server_timing=server_timing)
+    
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+        return {"id": item_id}
+    
+    return TestClient(app)
+
+class TestHistogram:
+    """Test the cumulative histogram"""
+    
+    def test_snapshot_is_cumulative(self):
+        """Test that bucket counts include smaller buckets"""
+        histogram = Histogram(buckets=(1, 5))
+        for value in (0.5, 2, 3, 10):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        assert snapshot["buckets"] == {"1": 1, "5": 3, "+Inf": 4}
+        assert snapshot["count"] == 4
+        assert snapshot["sum"] == 15.5
+
+class TestPrometheusFormat:
+    """Test rendering metrics in the Prometheus text format"""
+    
+    def test_render_histogram(self):
+        """Test bucket, sum and count lines with labels"""
+        histogram = Histogram(buckets=(1,))
+        histogram.observe(0.5)
+        text_format = render_histogram("latency_seconds", "Latency", [({"route": "/a"}, histogram.snapshot())])
+        assert "# TYPE latency_seconds histogram" in text_format
+        assert 'latency_seconds_bucket{route="/a",le="1"} 1' in text_format
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 1' in text_format
+        assert 'latency_seconds_count{route="/a"} 1' in text_format
+    
+    def test_label_values_are_escaped(self):
+        """Test that quotes and backslashes in label values are escaped"""
+        metrics = RequestMetrics()
+        metrics.record_request("GET", 'a"b\\c', 200, 0.1, RequestStats())
+        assert 'route="a\\"b\\\\c"' in metrics.render()
+
+class TestMetricsMiddleware:
+    """Test the request metrics middleware"""
+    
+    def test_records_route_template(self):
+        """Test that requests are labelled by route template and status"""
+        metrics = RequestMetrics()
+        client = make_client(metrics)
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/missing")
+        
+        rendered = metrics.render()
+        assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in rendered
+        assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in rendered
+        assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 2' in rendered
+    
+    def test_counts_queries_per_request(self):
+        """Test that statements run in the threadpool are attributed to the request"""
+        metrics = RequestMetrics()
+        make_client(metrics).get("/items/1")
+        
+        rendered = metrics.render()
+        assert 'http_request_db_queries_bucket{method="GET",route="/items/{item_id}",le="1"} 0' in rendered
+        assert 'http_request_db_queries_bucket{method="GET",route="/items/{item_id}",le="2"} 1' in rendered
+    
+    @pytest.mark.parametrize("server_timing", [True, False])
+    def test_server_timing_header(self, server_timing):
+        """Test that Server-Timing is only added when enabled"""
+        response = make_client(RequestMetrics(), server_timing=server_timing).get("/items/1")
+        if server_timing:
+            assert response.headers["Server-Timing"].startswith("app;dur=")
+            assert 'desc="2 queries"' in response.headers["Server-Timing"]
+        else:
+            assert "Server-Timing" not in response.headers
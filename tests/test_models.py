@@ -0,0 +1,209 @@
+import io
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, select, text
+from app.database import Base
+from app.migrate import migrate
+from app.models import Calculation
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_models.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+@pytest.fixture(scope="function")
+def test_db():
+    """Create test database tables"""
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def explain(statement) -> str:
+    """Return SQLite's query plan for a statement as a single string"""
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return " ".join(row[-1] for row in rows)
+
+class TestCalculationIndexes:
+    """Test that the calculation queries are served by the composite indexes"""
+    
+    def test_list_by_user_uses_index(self, test_db):
+        """Test that listing a user's calculations avoids a full scan"""
+        statement = (
+            select(Calculation)
+            .where(Calculation.user_id == 1)
+            .order_by(Calculation.created_at, Calculation.id)
+            .limit(100)
+        )
+        plan = explain(statement)
+        assert "ix_calculations_user_id_created_at_id" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    def test_list_all_uses_index(self, test_db):
+        """Test that the unfiltered keyset listing reads the (created_at, id) index"""
+        statement = select(Calculation).order_by(Calculation.created_at, Calculation.id).limit(100)
+        plan = explain(statement)
+        assert "ix_calculations_created_at_id" in plan
+    
+    def test_type_window_uses_index(self, test_db):
+        """Test that filtering by type over a time window uses the (type, created_at) index"""
+        statement = select(Calculation).where(
+            Calculation.type == "Add",
+            Calculation.created_at >= "2024-01-01"
+        )
+        plan = explain(statement)
+        assert "ix_calculations_type_created_at" in plan
+
+class TestMigrations:
+    """Test the Alembic migrations against SQLite"""
+    
+    def test_upgrade_adds_missing_indexes(self, test_db):
+        """Test that upgrading builds indexes missing from an existing schema"""
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_calculations_user_id_created_at_id"))
+        
+        config = Config("alembic.ini")
+        config.attributes["configure_logger"] = False
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        
+        names = {index["name"] for index in inspect(engine).get_indexes("calculations")}
+        assert "ix_calculations_user_id_created_at_id" in names
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    
+    def test_upgrade_creates_rollup_table(self, test_db):
+        """Test that upgrading creates the rollup table on an existing schema"""
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE calculation_rollups"))
+        
+        config = Config("alembic.ini")
+        config.attributes["configure_logger"] = False
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        
+        assert inspect(engine).has_table("calculation_rollups")
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    
+    def test_upgrade_adds_sqlite_autoincrement(self, test_db):
+        """Test that upgrading rebuilds calculations with AUTOINCREMENT, keeping its indexes"""
+        def table_sql():
+            with engine.connect() as connection:
+                return connection.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'calculations'"))
+        
+        config = Config("alembic.ini")
+        config.attributes["configure_logger"] = False
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.stamp(config, "head")
+            command.downgrade(config, "0003")
+        assert "AUTOINCREMENT" not in table_sql()
+        
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        assert "AUTOINCREMENT" in table_sql()
+        assert "STRFTIME" in table_sql()
+        names = {index["name"] for index in inspect(engine).get_indexes("calculations")}
+        assert "ix_calculations_user_id_created_at_id" in names
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    
+    def test_offline_autoincrement_sql_is_frozen(self, monkeypatch):
+        """Test that offline SQL for 0004 rebuilds the table as it was at that revision"""
+        monkeypatch.setattr("app.database.engine", engine)
+        output = io.StringIO()
+        config = Config("alembic.ini", output_buffer=output)
+        config.attributes["configure_logger"] = False
+        command.upgrade(config, "0003:0004", sql=True)
+        
+        create = next(
+            statement for statement in output.getvalue().split(";")
+            if "CREATE TABLE _alembic_tmp_calculations" in statement
+        )
+        assert "AUTOINCREMENT" in create
+        assert "version" not in create
+        assert "FOREIGN KEY(user_id) REFERENCES users (id)" in create
+    
+    def test_upgrade_adds_version_column(self, test_db):
+        """Test that upgrading adds the version column, starting existing rows at 1"""
+        config = Config("alembic.ini")
+        config.attributes["configure_logger"] = False
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.stamp(config, "head")
+            command.downgrade(config, "0004")
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO calculations (a, b, type, result) VALUES (1, 2, 'Add', 3)"))
+        
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        with engine.connect() as connection:
+            assert connection.scalar(text("SELECT version FROM calculations")) == 1
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+    def test_upgrade_adds_user_calculations_version(self, test_db):
+        """Test that upgrading adds the calculations version of users, starting existing users at 0"""
+        config = Config("alembic.ini")
+        config.attributes["configure_logger"] = False
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.stamp(config, "head")
+            command.downgrade(config, "0005")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO users (username, email, hashed_password) VALUES ('old', 'old@example.com', 'x')"
+            ))
+        
+        with engine.connect() as connection:
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+        with engine.connect() as connection:
+            assert connection.scalar(text("SELECT calculations_version FROM users")) == 0
+        
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+class TestMigrateStep:
+    """Test the one-off schema step run before the server starts"""
+    
+    @pytest.fixture
+    def database(self, tmp_path):
+        """Engine on an empty SQLite database"""
+        database = create_engine(f"sqlite:///{tmp_path}/migrate.db")
+        yield database
+        database.dispose()
+    
+    def test_creates_new_database_at_head(self, database):
+        """Test that a new database is created from the models and stamped"""
+        assert migrate(database) == "created"
+        tables = set(inspect(database).get_table_names())
+        assert {"users", "calculations", "calculation_rollups", "alembic_version"} <= tables
+        with database.connect() as connection:
+            head = connection.scalar(text("SELECT version_num FROM alembic_version"))
+        assert head == ScriptDirectory.from_config(Config("alembic.ini")).get_current_head()
+    
+    def test_upgrades_existing_database(self, database):
+        """Test that a second run upgrades in place and keeps the data"""
+        migrate(database)
+        with database.begin() as connection:
+            connection.execute(text("INSERT INTO calculations (a, b, type, result) VALUES (1, 2, 'Add', 3)"))
+        assert migrate(database) == "upgraded"
+        with database.connect() as connection:
+            assert connection.scalar(text("SELECT count(*) FROM calculations")) == 1
+    
+    def test_upgrades_database_created_by_init_db(self, database):
+        """Test that a schema created by create_all without Alembic is brought to head"""
+        Base.metadata.create_all(database)
+        assert migrate(database) == "upgraded"
+        assert inspect(database).has_table("alembic_version")
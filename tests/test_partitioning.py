@@ -0,0 +1,141 @@
+import os
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, func, insert, select, text
+from app.database import Base
+from app.models import Calculation
+from app.partitioning import (
+    DEFAULT_PARTITION,
+    PartitionMaintainer,
+    add_months,
+    expired_partitions,
+    is_partitioned,
+    list_partitions,
+    missing_partitions,
+    partition_month,
+    partition_name
+)
+
+# Scratch PostgreSQL database for the tests that partition a real table;
+# its tables are dropped and recreated
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+class TestMonthlyPartitions:
+    """Test the month arithmetic behind partition creation and retention"""
+
+    def test_add_months_crosses_years(self):
+        """Test stepping forwards and backwards over year boundaries"""
+        month = datetime(2026, 11, 1)
+        assert add_months(month, 2) == datetime(2027, 1, 1)
+        assert add_months(month, -11) == datetime(2025, 12, 1)
+        assert add_months(month, -23) == datetime(2024, 12, 1)
+
+    def test_partition_names_round_trip(self):
+        """Test that partition names encode their month"""
+        assert partition_name(datetime(2026, 3, 1)) == "calculations_y2026m03"
+        assert partition_month("calculations_y2026m03") == datetime(2026, 3, 1)
+        assert partition_month("calculations_default") is None
+
+    def test_missing_partitions(self):
+        """Test that only months without a partition are created, through the last one"""
+        existing = ["calculations_y2026m10", "calculations_default"]
+        missing = missing_partitions(existing, datetime(2026, 10, 18, 12, 30), datetime(2027, 1, 1))
+        assert missing == [datetime(2026, 11, 1), datetime(2026, 12, 1), datetime(2027, 1, 1)]
+
+    def test_expired_partitions(self):
+        """Test that a partition expires once its whole month is before the cutoff"""
+        existing = ["calculations_y2026m09", "calculations_default", "calculations_y2026m07", "calculations_y2026m08"]
+        assert expired_partitions(existing, datetime(2026, 9, 1)) == ["calculations_y2026m07", "calculations_y2026m08"]
+        assert expired_partitions(existing, datetime(2026, 7, 1)) == []
+
+class TestPartitionMaintainer:
+    """Test the maintainer's configuration"""
+
+    def test_disabled_by_default(self, monkeypatch):
+        """Test that partitioning is opt-in"""
+        monkeypatch.delenv("CALCULATION_PARTITIONING", raising=False)
+        assert PartitionMaintainer.from_env(None) is None
+
+    def test_from_env(self, monkeypatch):
+        """Test reading the partitioning and retention settings"""
+        monkeypatch.setenv("CALCULATION_PARTITIONING", "true")
+        monkeypatch.setenv("CALCULATION_PARTITIONS_AHEAD", "2")
+        monkeypatch.setenv("CALCULATION_RETENTION_MONTHS", "12")
+        monkeypatch.setenv("CALCULATION_RETENTION_ACTION", "detach")
+        maintainer = PartitionMaintainer.from_env(None)
+        assert (maintainer.months_ahead, maintainer.retention_months) == (2, 12)
+        assert maintainer.retention_action == "detach"
+        assert maintainer.retention_cutoff(datetime(2026, 10, 18)) == datetime(2025, 10, 1)
+
+    def test_unknown_retention_action(self):
+        """Test that an unknown retention action is rejected"""
+        with pytest.raises(ValueError, match="Unknown retention action"):
+            PartitionMaintainer(None, retention_action="truncate")
+
+    def test_noop_outside_postgresql(self, tmp_path):
+        """Test that maintenance leaves other databases untouched"""
+        engine = create_engine(f"sqlite:///{tmp_path}/partitions.db")
+        maintainer = PartitionMaintainer(engine, retention_months=1)
+        assert maintainer.run_once() == {"created": [], "expired": []}
+        engine.dispose()
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+class TestPartitionMaintainerPostgres:
+    """Test partition maintenance against PostgreSQL"""
+
+    NOW = datetime(2026, 10, 18, 12, 30)
+
+    @pytest.fixture
+    def engine(self):
+        """A scratch database with freshly created, unpartitioned tables"""
+        engine = create_engine(TEST_POSTGRES_URL)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        yield engine
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+    @staticmethod
+    def add_calculations(connection, *timestamps):
+        """Insert one calculation per created_at and commit"""
+        connection.execute(insert(Calculation), [
+            {"a": 1.0, "b": 2.0, "type": "Add", "result": 3.0, "created_at": created_at}
+            for created_at in timestamps
+        ])
+        connection.commit()
+
+    def test_background_pass_does_not_convert(self, engine):
+        """Test that only an explicit conversion partitions the table"""
+        maintainer = PartitionMaintainer(engine)
+        with engine.connect() as connection:
+            assert maintainer.maintain(connection, self.NOW) == {"created": [], "expired": []}
+            connection.commit()
+            assert not is_partitioned(connection)
+
+    def test_convert_and_expire_partitions(self, engine):
+        """Test conversion, and that rows outside every partition expire by dropping partitions"""
+        maintainer = PartitionMaintainer(engine, months_ahead=1, retention_months=2)
+        with engine.connect() as connection:
+            self.add_calculations(connection, datetime(2026, 9, 5), datetime(2026, 10, 1))
+            maintainer.maintain(connection, self.NOW, convert=True)
+            connection.commit()
+            assert is_partitioned(connection)
+            assert sorted(list_partitions(connection)) == [
+                "calculations_default", "calculations_y2026m09", "calculations_y2026m10", "calculations_y2026m11"
+            ]
+
+            # Rows older than every partition land in the default partition until the next pass
+            self.add_calculations(connection, datetime(2025, 1, 10), datetime(2026, 6, 3))
+            assert connection.scalar(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")) == 2
+
+            outcome = maintainer.maintain(connection, self.NOW)
+            connection.commit()
+            assert outcome == {
+                "created": ["calculations_y2025m01", "calculations_y2026m06"],
+                "expired": ["calculations_y2025m01", "calculations_y2026m06"]
+            }
+            assert connection.scalar(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")) == 0
+            assert connection.scalar(select(func.count()).select_from(Calculation)) == 2
+            assert sorted(list_partitions(connection)) == [
+                "calculations_default", "calculations_y2026m09", "calculations_y2026m10", "calculations_y2026m11"
+            ]
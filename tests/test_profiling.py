@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.middleware import ProfilingMiddleware
+from app.profiling import PROFILE_ID_HEADER, StackSampler, router
+
+TOKEN = "profiling-test-token"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+def busy_loop(seconds):
+    """Burn CPU in a recognisable function"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+@pytest.fixture
+def client(monkeypatch):
+    """An app with the profiling router and middleware, as installed when PROFILING_TOKEN is set"""
+    monkeypatch.setattr("app.profiling.PROFILING_TOKEN", TOKEN)
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/work")
+    def work():
+        busy_loop(0.05)
+        return {"done": True}
+
+    client = TestClient(app)
+    yield client
+    client.delete("/debug/profile/memory", headers=AUTH)
+
+class TestStackSampler:
+    """Test the sampling profiler"""
+
+    def test_collapsed_stacks(self):
+        """Test that a busy function shows up in the collapsed output"""
+        sampler = StackSampler(interval=0.001).start()
+        busy_loop(0.05)
+        collapsed = sampler.stop()
+        assert sampler.samples > 0
+        line = next(line for line in collapsed.splitlines() if "busy_loop" in line)
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("MainThread;")
+        assert stack.endswith("busy_loop (tests/test_profiling.py)")
+        assert int(count) > 0
+
+    def test_idle_executor_workers_are_skipped(self):
+        """Test that executor threads waiting for work are idle, like the password hash pool"""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="idle-pool") as executor:
+            executor.submit(int).result()
+            time.sleep(0.01)
+            sampler = StackSampler()
+            sampler.sample(exclude=threading.get_ident())
+            assert not any(stack.startswith("idle-pool") for stack in sampler.counts)
+
+            sampler = StackSampler(include_idle=True)
+            sampler.sample(exclude=threading.get_ident())
+            assert any(stack.startswith("idle-pool") for stack in sampler.counts)
+
+class TestProfilingEndpoints:
+    """Test the token-gated profiling endpoints"""
+
+    def test_absent_by_default(self):
+        """Test that the app has no profiling routes unless PROFILING_TOKEN is set"""
+        from app.main import app
+        assert not any(route.path.startswith("/debug") for route in app.routes)
+
+    def test_token_required(self, client):
+        """Test that requests without the bearer token are rejected"""
+        assert client.post("/debug/profile/cpu?seconds=0.01").status_code == 401
+        response = client.post("/debug/profile/cpu?seconds=0.01", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+    def test_cpu_profile(self, client):
+        """Test sampling for a number of seconds"""
+        response = client.post("/debug/profile/cpu?seconds=0.05&interval_ms=1&idle=true", headers=AUTH)
+        assert response.status_code == 200
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines())
+
+    def test_memory_diff(self, client):
+        """Test diffing tracemalloc snapshots"""
+        base = client.post("/debug/profile/memory/snapshots", headers=AUTH).json()
+        retained = [bytearray(1024) for _ in range(1000)]
+        diff = client.get(f"/debug/profile/memory/diff?base={base['id']}", headers=AUTH).json()
+        assert any(
+            "test_profiling.py" in stat["location"][0] and stat["size_diff"] >= 1024 * 1000
+            for stat in diff
+        )
+        del retained
+        assert client.get("/debug/profile/memory/diff?base=missing", headers=AUTH).status_code == 404
+
+    def test_request_profile(self, client):
+        """Test profiling one request through the X-Profile header"""
+        assert PROFILE_ID_HEADER not in client.get("/work").headers
+        assert PROFILE_ID_HEADER not in client.get("/work", headers={"X-Profile": "wrong"}).headers
+
+        response = client.get("/work", headers={"X-Profile": TOKEN})
+        assert response.json() == {"done": True}
+        profile = client.get(f"/debug/profile/requests/{response.headers[PROFILE_ID_HEADER]}", headers=AUTH)
+        assert "busy_loop (tests/test_profiling.py)" in profile.text
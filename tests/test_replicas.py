@@ -0,0 +1,116 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, get_db
+from app.main import app
+from app.models import Calculation
+from app.replicas import READ_PRIMARY_COOKIE, Replica, ReplicaSet
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def replica_set(count, **kwargs):
+    """Build a replica set of placeholder replicas"""
+    return ReplicaSet([Replica(f"replica{i}", None, None) for i in range(count)], **kwargs)
+
+class TestReplicaSet:
+    """Test balancing and ejection over replicas"""
+
+    def test_round_robin(self):
+        """Test that replicas take turns"""
+        replicas = replica_set(3)
+        picked = [replicas.acquire().name for _ in range(6)]
+        assert picked == ["replica0", "replica1", "replica2"] * 2
+
+    def test_least_connections(self):
+        """Test that the replica with the fewest sessions in use is picked"""
+        replicas = replica_set(2, balancing="least_connections")
+        first = replicas.acquire()
+        second = replicas.acquire()
+        assert first is not second
+        replicas.release(second)
+        assert replicas.acquire() is second
+
+    def test_unknown_strategy(self):
+        """Test that an unknown balancing strategy is rejected"""
+        with pytest.raises(ValueError, match="Unknown read balancing strategy"):
+            replica_set(1, balancing="random")
+
+    def test_ejected_replica_is_skipped_until_it_expires(self):
+        """Test health-based ejection and re-admission"""
+        clock = FakeClock()
+        replicas = replica_set(2, eject_seconds=10, clock=clock)
+        broken = replicas.replicas[0]
+        replicas.eject(broken)
+        assert {replicas.acquire().name for _ in range(4)} == {"replica1"}
+        assert replicas.acquire(exclude=[replicas.replicas[1]]) is None
+
+        clock.now = 10
+        assert {replicas.acquire().name for _ in range(4)} == {"replica0", "replica1"}
+        assert broken.failures == 1
+
+class TestReadRouting:
+    """Test that GET routes read from replicas and writers read their own writes"""
+
+    @pytest.fixture
+    def databases(self, tmp_path, monkeypatch):
+        """A primary and a replica SQLite database, with a marker row only in the replica"""
+        primary = create_engine(f"sqlite:///{tmp_path}/primary.db", connect_args={"check_same_thread": False})
+        replica_url = f"sqlite:///{tmp_path}/replica.db"
+        replica = create_engine(replica_url)
+        for engine in (primary, replica):
+            Base.metadata.create_all(engine)
+        with replica.begin() as connection:
+            connection.execute(insert(Calculation).values(a=1, b=1, type="Add", result=-1))
+        replica.dispose()
+
+        PrimarySession = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+
+        def override_get_db():
+            with PrimarySession() as db:
+                yield db
+
+        monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+        replicas = ReplicaSet.from_urls([replica_url])
+        monkeypatch.setattr("app.replicas._replicas", replicas)
+        yield replicas
+        replicas.replicas[0].engine.dispose()
+        primary.dispose()
+
+    def test_reads_go_to_the_replica(self, databases):
+        """Test that list and detail routes are served by the replica"""
+        client = TestClient(app)
+        assert [row["result"] for row in client.get("/calculations").json()] == [-1]
+        assert client.get("/calculations/1").json()["result"] == -1
+        assert client.get("/health/pool").json()["replicas"][0]["in_use"] == 0
+
+    def test_writer_reads_its_own_writes(self, databases):
+        """Test that a write pins the client's reads to the primary for the window"""
+        client = TestClient(app)
+        response = client.post("/calculations", json={"a": 2, "b": 3, "type": "Multiply"})
+        assert response.status_code == 201
+        assert READ_PRIMARY_COOKIE in response.cookies
+        assert [row["result"] for row in client.get("/calculations").json()] == [6]
+
+        # Other clients, and this one once the window is over, read the replica
+        assert [row["result"] for row in TestClient(app).get("/calculations").json()] == [-1]
+        client.cookies.set(READ_PRIMARY_COOKIE, "0")
+        assert [row["result"] for row in client.get("/calculations").json()] == [-1]
+
+    def test_failed_replica_is_ejected(self, databases, tmp_path):
+        """Test that an unreachable replica is ejected and reads fall back to the primary"""
+        broken = ReplicaSet.from_urls([f"sqlite:///{tmp_path}/missing/replica.db"])
+        databases.replicas = broken.replicas
+        client = TestClient(app)
+        assert client.get("/calculations").json() == []
+
+        stats = client.get("/health/pool").json()["replicas"][0]
+        assert stats["ejected"] is True
+        assert stats["failures"] == 1
@@ -66,6 +66,14 @@ class TestCalculationCreate:
         with pytest.raises(ValidationError):
             CalculationCreate(b=5, type=CalculationType.ADD)  # Missing a
     
+    def test_non_finite_operands_rejected(self):
+        """Test that NaN and infinite operands are rejected"""
+        for value in (float("nan"), float("inf"), "-inf"):
+            with pytest.raises(ValidationError, match="finite number"):
+                CalculationCreate(a=value, b=5, type=CalculationType.ADD)
+            with pytest.raises(ValidationError, match="finite number"):
+                CalculationUpdate(b=value)
+    
     def test_negative_numbers(self):
         """Test calculations with negative numbers"""
         calc = CalculationCreate(a=-10, b=5, type=CalculationType.ADD)
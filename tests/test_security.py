@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from app.security import BCRYPT_ROUNDS, HashingPoolFull, PasswordHasher, pwd_context
+
+class TestPasswordHasher:
+    """Test the dedicated password hashing pool"""
+    
+    def test_hash_verifies(self):
+        """Test that hashes produced on the pool verify with pwd_context"""
+        hasher = PasswordHasher(max_workers=1)
+        try:
+            hashed = asyncio.run(hasher.hash("securepassword123"))
+        finally:
+            hasher.shutdown()
+        assert pwd_context.verify("securepassword123", hashed)
+        assert f"${BCRYPT_ROUNDS:02d}$" in hashed
+    
+    def test_queue_limit(self):
+        """Test that requests beyond the worker and queue limits are rejected"""
+        hasher = PasswordHasher(max_workers=1, max_queue=1)
+        
+        async def run():
+            return await asyncio.gather(
+                *(hasher.hash("securepassword123") for _ in range(3)),
+                return_exceptions=True
+            )
+        
+        try:
+            results = asyncio.run(run())
+        finally:
+            hasher.shutdown()
+        assert isinstance(results[2], HashingPoolFull)
+        assert all(isinstance(result, str) for result in results[:2])
+        
+        stats = hasher.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 2
+        assert stats["queue_depth"] == 0
+        assert stats["hash_seconds"]["count"] == 2
+    
+    def test_from_env(self, monkeypatch):
+        """Test configuring the pool from the environment"""
+        monkeypatch.setenv("PASSWORD_HASH_EXECUTOR", "process")
+        monkeypatch.setenv("PASSWORD_HASH_WORKERS", "3")
+        monkeypatch.setenv("PASSWORD_HASH_MAX_QUEUE", "0")
+        hasher = PasswordHasher.from_env()
+        assert hasher.executor_kind == "process"
+        assert hasher.max_workers == 3
+        assert hasher.max_queue == 0
+    
+    def test_invalid_executor(self):
+        """Test that unknown executor kinds are rejected"""
+        with pytest.raises(ValueError, match="Unsupported executor kind"):
+            PasswordHasher(executor_kind="fiber")
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.singleflight import SingleFlight
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical calls"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving while a call runs get its result"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            release.wait(5)
+            return "row"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(flight.do, ("calculation", 1), lookup) for _ in range(8)]
+            while sum(flight.stats().get("calculation", {}).values()) < 8:
+                time.sleep(0.001)
+            release.set()
+            assert [future.result() for future in futures] == ["row"] * 8
+
+        assert len(calls) == 1
+        assert flight.stats() == {"calculation": {"executed": 1, "coalesced": 7}}
+
+    def test_results_are_not_cached(self):
+        """Test that sequential calls each execute, and different keys never share"""
+        flight = SingleFlight()
+        assert flight.do(("user", 1), lambda: 1) == 1
+        assert flight.do(("user", 1), lambda: 2) == 2
+        assert flight.do(("user", 2), lambda: 3) == 3
+        assert flight.stats() == {"user": {"executed": 3, "coalesced": 0}}
+
+    def test_error_is_shared(self):
+        """Test that waiters receive the leader's exception"""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(5)
+            raise RuntimeError("database down")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(flight.do, ("user", 1), failing) for _ in range(2)]
+            while sum(flight.stats().get("user", {}).values()) < 2:
+                time.sleep(0.001)
+            release.set()
+            for future in futures:
+                with pytest.raises(RuntimeError, match="database down"):
+                    future.result()
+
+    def test_forget_starts_a_new_call(self):
+        """Test that callers after forget() do not join the earlier call"""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def stale():
+            release.wait(5)
+            return "before write"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(flight.do, ("calculation", 1), stale)
+            while not flight.stats():
+                time.sleep(0.001)
+            flight.forget(("calculation", 1))
+            assert flight.do(("calculation", 1), lambda: "after write") == "after write"
+            release.set()
+            assert leader.result() == "before write"
+
+    def test_async_calls_share_one_execution(self):
+        """Test coalescing of coroutines within the event loop"""
+        flight = SingleFlight()
+        calls = []
+
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "row"
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async(("user", 1), lookup) for _ in range(5)))
+
+        assert asyncio.run(run()) == ["row"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"user": {"executed": 1, "coalesced": 4}}
+
+    def test_cancelled_leader_does_not_cancel_waiters(self):
+        """Test that a waiter still gets the value when the leader's request is cancelled"""
+        flight = SingleFlight()
+        calls = []
+
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "row"
+
+        async def run():
+            leader = asyncio.create_task(flight.do_async(("calculation", 1), lookup))
+            await asyncio.sleep(0)
+            followers = [asyncio.create_task(flight.do_async(("calculation", 1), lookup)) for _ in range(2)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers)
+
+        assert asyncio.run(run()) == ["row", "row"]
+        assert len(calls) == 2
+        assert flight.stats() == {"calculation": {"executed": 2, "coalesced": 3}}